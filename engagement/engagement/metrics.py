@@ -0,0 +1,282 @@
+"""Per-view request, latency and database metrics in the Prometheus text format.
+
+MetricsMiddleware counts every request by URL name and times its database
+queries through ``connection.execute_wrapper``. A streaming response is timed
+until its body has been sent, including the queries made while producing it.
+Each worker process keeps its numbers in memory and writes them to its own JSON
+file in METRICS_DIR every few seconds. The ``/metrics`` view adds up all the
+files, so every worker appears in the scrape whichever one serves it, and folds
+the files of workers that have exited into one so the directory does not grow.
+With METRICS_ENABLED off the middleware removes itself at startup and costs
+nothing.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Holds the metrics of exited workers, added up
+RETIRED_NAME = 'retired.json'
+LOCK_NAME = 'metrics.lock'
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'METRICS_DIR', settings.BASE_DIR / 'metrics'))
+
+
+def empty_view_metrics():
+    return {
+        'requests': 0,
+        'latency_buckets': [0] * len(LATENCY_BUCKETS),
+        'latency_sum': 0.0,
+        'queries': 0,
+        'query_buckets': [0] * len(QUERY_BUCKETS),
+        'db_seconds': 0.0,
+    }
+
+
+class ProcessMetrics:
+    """Metrics of this worker process, periodically written to its own file"""
+    def __init__(self):
+        self.pid = os.getpid()
+        self.views = {}
+        self.lock = threading.Lock()
+        # The start time keeps a restarted worker that reuses a pid from overwriting its predecessor
+        self.path = metrics_dir() / f'{self.pid}-{time.time_ns()}.json'
+        self.flushed_at = 0.0
+
+    def record(self, view, seconds, queries, db_seconds):
+        with self.lock:
+            metrics = self.views.get(view)
+            if metrics is None:
+                metrics = self.views[view] = empty_view_metrics()
+            metrics['requests'] += 1
+            metrics['latency_sum'] += seconds
+            metrics['queries'] += queries
+            metrics['db_seconds'] += db_seconds
+            _observe(metrics['latency_buckets'], LATENCY_BUCKETS, seconds)
+            _observe(metrics['query_buckets'], QUERY_BUCKETS, queries)
+
+            now = time.monotonic()
+            due = now - self.flushed_at >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+            if due:
+                self.flushed_at = now
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            views = json.dumps(self.views)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f'.{self.path.name}.{threading.get_ident()}.tmp')
+        temporary.write_text(views)
+        os.replace(temporary, self.path)
+
+
+_process_metrics = None
+
+
+def get_process_metrics():
+    """Return the metrics of the current process, starting afresh in forked workers"""
+    global _process_metrics
+    if _process_metrics is None or _process_metrics.pid != os.getpid():
+        _process_metrics = ProcessMetrics()
+    return _process_metrics
+
+
+def _observe(buckets, bounds, value):
+    # Buckets are stored non-cumulative and summed up when rendered
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            buckets[index] += 1
+            return
+
+
+class QueryTimer:
+    """execute_wrapper that counts queries and adds up their time"""
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with timed_queries(timer):
+            response = self.get_response(request)
+        if response.streaming and not response.is_async:
+            # The body is produced while the server sends it, so the request is recorded once it is sent
+            response.streaming_content = self.stream(request, response.streaming_content, timer, started)
+        else:
+            self.record(request, timer, started)
+        return response
+
+    def stream(self, request, content, timer, started):
+        try:
+            with timed_queries(timer):
+                yield from content
+        finally:
+            self.record(request, timer, started)
+
+    def record(self, request, timer, started):
+        seconds = time.perf_counter() - started
+        match = request.resolver_match
+        view = (match.view_name if match else None) or 'unmatched'
+        get_process_metrics().record(view, seconds, timer.queries, timer.seconds)
+
+
+@contextmanager
+def timed_queries(timer):
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(timer))
+        yield
+
+
+def _add(total, views):
+    for view, metrics in views.items():
+        view_total = total.setdefault(view, empty_view_metrics())
+        for name, value in metrics.items():
+            if isinstance(value, list):
+                view_total[name] = [a + b for a, b in zip(view_total[name], value)]
+            else:
+                view_total[name] += value
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def retire_exited():
+    """Fold the files of worker processes that have exited into the retired file"""
+    directory = metrics_dir()
+    exited = []
+    for path in directory.glob('*-*.json'):
+        pid = path.name.split('-', 1)[0]
+        if pid.isdigit() and not _process_alive(int(pid)):
+            exited.append(path)
+    if not exited:
+        return
+
+    with open(directory / LOCK_NAME, 'w') as lock:
+        # Another worker may be retiring the same files
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired_path = directory / RETIRED_NAME
+        retired = _read(retired_path) or {}
+        exited = [(path, _read(path)) for path in exited if path.exists()]
+        for path, views in exited:
+            if views is not None:
+                _add(retired, views)
+        temporary = retired_path.with_name(f'.{RETIRED_NAME}.{os.getpid()}.tmp')
+        temporary.write_text(json.dumps(retired))
+        os.replace(temporary, retired_path)
+        for path, views in exited:
+            path.unlink(missing_ok=True)
+
+
+def collect():
+    """Add up the metric files of all worker processes, those that have exited included"""
+    retire_exited()
+    views = {}
+    for path in metrics_dir().glob('*.json'):
+        process_views = _read(path)
+        if process_views is not None:
+            _add(views, process_views)
+    return views
+
+
+def render_metrics(views):
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    def histogram(name, view, buckets, bounds, total, count):
+        cumulative = 0
+        for bound, observed in zip(bounds, buckets):
+            cumulative += observed
+            lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{view="{view}"}} {total}')
+        lines.append(f'{name}_count{{view="{view}"}} {count}')
+
+    names = sorted(views)
+    family('engagement_requests_total', 'counter', 'Requests handled, by URL name.')
+    for view in names:
+        lines.append(f'engagement_requests_total{{view="{view}"}} {views[view]["requests"]}')
+
+    family('engagement_request_duration_seconds', 'histogram', 'Time to produce the response, by URL name.')
+    for view in names:
+        metrics = views[view]
+        histogram(
+            'engagement_request_duration_seconds', view, metrics['latency_buckets'], LATENCY_BUCKETS,
+            metrics['latency_sum'], metrics['requests']
+        )
+
+    family('engagement_db_queries_per_request', 'histogram', 'Database queries per request, by URL name.')
+    for view in names:
+        metrics = views[view]
+        histogram(
+            'engagement_db_queries_per_request', view, metrics['query_buckets'], QUERY_BUCKETS,
+            metrics['queries'], metrics['requests']
+        )
+
+    family('engagement_db_queries_total', 'counter', 'Database queries, by URL name.')
+    for view in names:
+        lines.append(f'engagement_db_queries_total{{view="{view}"}} {views[view]["queries"]}')
+
+    family('engagement_db_query_duration_seconds_total', 'counter', 'Time spent in database queries, by URL name.')
+    for view in names:
+        lines.append(f'engagement_db_query_duration_seconds_total{{view="{view}"}} {views[view]["db_seconds"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, for METRICS_ALLOWED_IPS and staff users"""
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        raise Http404
+    allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    if not allowed and not (request.user.is_authenticated and request.user.is_staff):
+        raise Http404
+    # This worker's latest numbers may not have been written yet
+    get_process_metrics().flush()
+    return HttpResponse(render_metrics(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,137 @@
+"""Opt-in profiling of single requests, for views that are only slow in production.
+
+With PROFILING_ENABLED on, ProfilingMiddleware profiles a request when:
+- a staff user asks for it with ``?profile=1`` or an ``X-Profile: 1`` header
+  (``cprofile`` or ``sample`` instead of ``1`` picks the mode, other values
+  are ignored), or
+- the URL name is listed in PROFILING_SAMPLE_RATES and wins its 1-in-N draw.
+
+Each profile is written to PROFILING_DIR, tagged with the URL name and the
+organization id. There are two modes:
+- ``cprofile`` writes ``.pstats`` files for pstats or snakeviz.
+- ``sample`` records the stack every PROFILING_SAMPLE_INTERVAL seconds and
+  writes collapsed stacks (``.collapsed``) for flamegraph.pl or speedscope. It
+  adds far less overhead.
+"""
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+MODES = ('cprofile', 'sample')
+
+
+class CProfiler:
+    suffix = 'pstats'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, path):
+        self.profile.dump_stats(path)
+
+
+class StackSampler:
+    """Samples the stack of the profiled thread from a background thread"""
+    suffix = 'collapsed'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def save(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+def make_profiler(mode):
+    if mode == 'sample':
+        return StackSampler(getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005))
+    return CProfiler()
+
+
+class ProfilingMiddleware:
+    """Must come after AuthenticationMiddleware"""
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        profiler = getattr(request, '_profiler', None)
+        if profiler is None:
+            return response
+
+        profiler.stop()
+        organization = getattr(request, 'organization', None)
+        name = '-'.join([
+            time.strftime('%Y%m%d-%H%M%S'),
+            request.resolver_match.view_name or 'unnamed',
+            f'org{organization.pk if organization is not None else "-none"}',
+            str(os.getpid()),
+        ])
+        directory = Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{name}.{profiler.suffix}'
+        profiler.save(path)
+        response['X-Profile'] = path.name
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        mode = self.requested_mode(request)
+        if mode is None:
+            return None
+
+        profiler = make_profiler(mode)
+        try:
+            profiler.start()
+        except ValueError:
+            # Another request in this process is already being profiled with cProfile
+            return None
+        request._profiler = profiler
+        return None
+
+    def requested_mode(self, request):
+        default = getattr(settings, 'PROFILING_MODE', 'cprofile')
+        flag = request.GET.get('profile') or request.headers.get('X-Profile')
+        if (flag == '1' or flag in MODES) and request.user.is_authenticated and request.user.is_staff:
+            return default if flag == '1' else flag
+
+        rate = getattr(settings, 'PROFILING_SAMPLE_RATES', {}).get(request.resolver_match.view_name)
+        if rate and random.randrange(rate) == 0:
+            return default
+        return None
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'engagement.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'engagement.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'engagement.urls'
@@ -87,6 +89,38 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# Cached results, catalogs and memberships are invalidated by bumping version keys
+# in this cache, from web requests and from management commands such as
+# process_survey_spool, import_survey_responses and rebuild_survey_rollups. The
+# cache must therefore be shared by every process that serves or writes survey
+# data. The default keeps it in files, which every process on this host sees.
+# Across several hosts, use a network backend instead:
+#
+#   Redis:     'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#              'LOCATION': 'redis://127.0.0.1:6379'
+#   Memcached: 'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+#              'LOCATION': '127.0.0.1:11211'
+#   Database:  'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+#              'LOCATION': 'engagement_cache'  (run `manage.py createcachetable` first)
+#
+# The local-memory backend is private to each process: other processes would keep
+# serving stale entries until they expire, and `manage.py check --deploy` warns
+# about it. Tests run with a local-memory cache of their own, see engagement.testing.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+TEST_RUNNER = 'engagement.testing.TestRunner'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -134,3 +168,65 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 ACCOUNT_EMAIL_VERIFICATION = 'none'
 ACCOUNT_SIGNUP_FIELDS = ['email', 'password1', 'password2']
+
+# Org chart
+# Number of levels rendered with the page, deeper subtrees are loaded on demand.
+ORG_CHART_INITIAL_DEPTH = 3
+
+# Survey results
+# 'rollup' reads the weekly rollup tables kept up to date by take_survey,
+# 'sql' groups and sums the answers in the database on every request,
+# 'columnar' streams the answers into NumPy arrays (pure Python if NumPy is missing),
+# 'python' is the pure Python version of 'columnar'.
+SURVEY_RESULTS_ENGINE = 'rollup'
+
+# Seconds to keep computed results. New responses and survey edits invalidate
+# them immediately in every process sharing the cache (see CACHES), so this only
+# bounds how long unused entries occupy it.
+SURVEY_RESULTS_CACHE_TIMEOUT = 60 * 60
+
+# Team results stay hidden until this many people below the manager have answered,
+# so that no one's answers can be singled out.
+TEAM_RESULTS_MIN_RESPONDENTS = 3
+
+# Bootstrap confidence intervals for the averages on the results pages (needs NumPy).
+# Each average is resampled SURVEY_BOOTSTRAP_RESAMPLES times from the same seed, and
+# fewer times once resamples x averages would exceed SURVEY_BOOTSTRAP_MAX_DRAWS.
+# Averages from a single answer, or whose 95% interval is wider than
+# SURVEY_BOOTSTRAP_MAX_WIDTH rating points, are flagged as insufficient data.
+SURVEY_BOOTSTRAP_RESAMPLES = 1000
+SURVEY_BOOTSTRAP_SEED = 0
+SURVEY_BOOTSTRAP_MAX_DRAWS = 50000
+SURVEY_BOOTSTRAP_MAX_WIDTH = 2.0
+
+# Question pairs answered by fewer respondents are left out of the correlation matrix
+SURVEY_CORRELATION_MIN_RESPONDENTS = 30
+
+# Queue take_survey submissions in a spool file instead of writing them during the
+# request; run `manage.py process_survey_spool --watch` to write them in batches.
+SURVEY_WRITE_BEHIND = False
+SURVEY_SPOOL_DIR = BASE_DIR / 'spool'
+
+# Seconds to cache each user's membership, organization and survey between requests
+# (0 looks them up once per request). Changes to the organization, its survey or
+# its memberships take effect immediately either way.
+ORGANIZATION_CONTEXT_CACHE_TIMEOUT = 0
+
+# Request, latency and query metrics per URL name, scraped from /metrics.
+# Each worker process writes its numbers to its own file in METRICS_DIR;
+# /metrics folds the files of workers that have exited into one.
+METRICS_ENABLED = False
+METRICS_DIR = BASE_DIR / 'metrics'
+METRICS_FLUSH_INTERVAL = 5
+# Besides staff users, only these addresses may scrape /metrics
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+# Profiling of single requests, by staff users with ?profile=1 (or ?profile=sample)
+# and for a random 1 in N requests of the URL names in PROFILING_SAMPLE_RATES,
+# e.g. {'survey_results': 100}. Profiles are written to PROFILING_DIR.
+PROFILING_ENABLED = False
+PROFILING_DIR = BASE_DIR / 'profiles'
+# 'cprofile' writes .pstats files, 'sample' writes collapsed stacks for flame graphs
+PROFILING_MODE = 'cprofile'
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_SAMPLE_RATES = {}
@@ -0,0 +1,88 @@
+"""Test runner and query-budget assertions for view tests.
+
+``QueryBudgetTestCase.assertQueryBudget`` makes a request, or any other call,
+twice: before and after ``grow()`` adds more data. It fails if either request
+exceeds the budget or if the two make a different number of queries, which is
+how an N+1 shows up. The failure message lists the captured SQL, as a diff
+between the two requests when their counts differ.
+"""
+import difflib
+import re
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+# Ids, dates and other literals differ between the two requests, only the shape of the SQL is compared
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+# Test databases reuse the ids of the real one, so tests and benchmarks must never
+# read or write the shared cache of the configured site
+LOCAL_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'engagement-tests',
+    }
+}
+
+
+class TestRunner(DiscoverRunner):
+    """Runs the tests with a local-memory cache instead of the configured one"""
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_override = override_settings(CACHES=LOCAL_CACHES)
+        self.cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_override.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+def normalize(sql):
+    return LITERALS.sub('?', sql)
+
+
+class QueryBudgetTestCase(TestCase):
+    """TestCase whose subclasses implement ``grow()`` to add data between the two requests"""
+    def setUp(self):
+        # Cached catalogs and results of an earlier test may belong to an organization with the same id
+        cache.clear()
+
+    def grow(self):
+        raise NotImplementedError('subclasses of QueryBudgetTestCase must provide a grow() method')
+
+    def capture(self, request):
+        """Return the result of ``request()`` and the SQL it ran, with the caches empty"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def assertQueryBudget(self, budget, request, status=200):
+        """Pass ``status=None`` when ``request`` does not return a response"""
+        small_response, small = self.capture(request)
+        if status is not None:
+            self.assertEqual(small_response.status_code, status)
+        self.grow()
+        large_response, large = self.capture(request)
+        if status is not None:
+            self.assertEqual(large_response.status_code, status)
+
+        if len(small) <= budget and len(large) == len(small):
+            return
+        if len(large) != len(small):
+            details = '\n'.join(difflib.unified_diff(
+                [normalize(sql) for sql in small],
+                [normalize(sql) for sql in large],
+                'small data set', 'large data set', lineterm=''
+            ))
+        else:
+            details = '\n'.join(f'{number}. {sql}' for number, sql in enumerate(large, 1))
+        self.fail(
+            f'{len(small)} queries with the small data set and {len(large)} with the large one, '
+            f'budget {budget}:\n{details}'
+        )
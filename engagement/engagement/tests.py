@@ -0,0 +1,194 @@
+import json
+import os
+import pstats
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+from django.contrib.auth.models import User
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from . import metrics
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.profile_dir = Path(directory.name)
+        settings_override = override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_DIR=self.profile_dir,
+            PROFILING_MODE='cprofile',
+            PROFILING_SAMPLE_INTERVAL=0.001,
+            PROFILING_SAMPLE_RATES={},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.staff = User.objects.create_user('staff', 'staff@example.com', is_staff=True)
+        self.member = User.objects.create_user('member', 'member@example.com')
+        self.url = reverse('organization_list')
+
+    def assertProfiled(self, response, suffix):
+        name = response.headers.get('X-Profile')
+        self.assertIsNotNone(name)
+        self.assertEqual([path.name for path in self.profile_dir.iterdir()], [name])
+        self.assertIn('-organization_list-org-none-', name)
+        self.assertTrue(name.endswith(f'.{suffix}'))
+        return self.profile_dir / name
+
+    def assertNotProfiled(self, response):
+        self.assertNotIn('X-Profile', response.headers)
+        self.assertEqual(list(self.profile_dir.iterdir()), [])
+
+    def test_staff_query_string(self):
+        self.client.force_login(self.staff)
+        path = self.assertProfiled(self.client.get(self.url, {'profile': '1'}), 'pstats')
+        self.assertTrue(pstats.Stats(str(path)).stats)
+
+    def test_staff_header_picks_the_mode(self):
+        self.client.force_login(self.staff)
+        self.assertProfiled(self.client.get(self.url, headers={'X-Profile': 'sample'}), 'collapsed')
+
+    def test_non_staff_are_never_profiled(self):
+        self.client.force_login(self.member)
+        self.assertNotProfiled(self.client.get(self.url, {'profile': '1'}))
+        self.assertNotProfiled(self.client.get(self.url, headers={'X-Profile': '1'}))
+
+    def test_other_values_are_ignored(self):
+        self.client.force_login(self.staff)
+        for value in ['0', 'false', 'no', 'yes', 'pstats']:
+            with self.subTest(value=value):
+                self.assertNotProfiled(self.client.get(self.url, {'profile': value}))
+                self.assertNotProfiled(self.client.get(self.url, headers={'X-Profile': value}))
+
+    def test_sample_rate(self):
+        self.client.force_login(self.member)
+        with override_settings(PROFILING_SAMPLE_RATES={'organization_list': 1}):
+            self.assertProfiled(self.client.get(self.url), 'pstats')
+        for path in self.profile_dir.iterdir():
+            path.unlink()
+        with override_settings(PROFILING_SAMPLE_RATES={'survey_results': 1}):
+            self.assertNotProfiled(self.client.get(self.url))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.metrics_dir = Path(directory.name)
+        settings_override = override_settings(
+            METRICS_ENABLED=True, METRICS_DIR=self.metrics_dir, METRICS_FLUSH_INTERVAL=0, METRICS_ALLOWED_IPS=[]
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Every test starts with fresh metrics for this process, written to its temporary directory
+        process_metrics = mock.patch.object(metrics, '_process_metrics', None)
+        process_metrics.start()
+        self.addCleanup(process_metrics.stop)
+        self.staff = User.objects.create_user('staff', 'staff@example.com', is_staff=True)
+        self.member = User.objects.create_user('member', 'member@example.com')
+        self.url = reverse('organization_list')
+
+    def own_file(self):
+        return json.loads(metrics.get_process_metrics().path.read_text())
+
+    def scrape(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def sample(self, text, name, view='organization_list'):
+        match = re.search(rf'^{name}{{view="{view}"}} (\S+)$', text, re.MULTILINE)
+        return float(match.group(1)) if match else None
+
+    def write_process(self, pid, requests):
+        views = {'organization_list': {**metrics.empty_view_metrics(), 'requests': requests}}
+        path = self.metrics_dir / f'{pid}-1.json'
+        path.write_text(json.dumps(views))
+        return path
+
+    def exited_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        return process.pid
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.force_login(self.member)
+        self.client.get(self.url)
+        self.client.get(self.url)
+        views = self.own_file()
+        self.assertEqual(views['organization_list']['requests'], 2)
+        self.assertEqual(sum(views['organization_list']['latency_buckets']), 2)
+        self.assertGreater(views['organization_list']['queries'], 0)
+        self.assertEqual(sum(views['organization_list']['query_buckets']), 2)
+
+    @override_settings(METRICS_FLUSH_INTERVAL=3600)
+    def test_each_process_flushes_at_most_once_per_interval(self):
+        self.client.force_login(self.member)
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(self.own_file()['organization_list']['requests'], 1)
+        self.assertEqual(metrics.get_process_metrics().views['organization_list']['requests'], 2)
+        # A scrape writes out this process's latest numbers first
+        self.assertEqual(self.sample(self.scrape(), 'engagement_requests_total'), 2)
+
+    def test_scrape_adds_up_all_processes(self):
+        self.client.force_login(self.member)
+        self.client.get(self.url)
+        # The parent process is alive, so its file is read as it is
+        self.write_process(os.getppid(), 5)
+        text = self.scrape()
+        self.assertEqual(self.sample(text, 'engagement_requests_total'), 6)
+        self.assertEqual(
+            self.sample(text, 'engagement_request_duration_seconds_count'),
+            self.sample(text, 'engagement_requests_total')
+        )
+        self.assertIn('# TYPE engagement_request_duration_seconds histogram', text)
+
+    def test_files_of_exited_processes_are_folded(self):
+        first = self.write_process(self.exited_pid(), 3)
+        self.assertEqual(self.sample(self.scrape(), 'engagement_requests_total'), 3)
+        self.assertFalse(first.exists())
+        second = self.write_process(self.exited_pid(), 4)
+        self.assertEqual(self.sample(self.scrape(), 'engagement_requests_total'), 7)
+        self.assertFalse(second.exists())
+        self.assertEqual(
+            sorted(path.name for path in self.metrics_dir.glob('*.json')),
+            sorted([metrics.RETIRED_NAME, metrics.get_process_metrics().path.name])
+        )
+        self.assertEqual(self.sample(self.scrape(), 'engagement_requests_total'), 7)
+
+    def test_streaming_responses_are_timed_until_sent(self):
+        def content():
+            yield 'first'
+            yield str(User.objects.count())
+
+        middleware = metrics.MetricsMiddleware(lambda request: StreamingHttpResponse(content()))
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        response = middleware(request)
+        self.assertEqual(metrics.get_process_metrics().views, {})
+        self.assertEqual(b''.join(response.streaming_content), b'first2')
+        views = metrics.get_process_metrics().views
+        self.assertEqual(views['unmatched']['requests'], 1)
+        self.assertEqual(views['unmatched']['queries'], 1)
+
+    def test_access(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.logout()
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, 200)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.6').status_code, 404)
+        with override_settings(METRICS_ENABLED=False):
+            self.client.force_login(self.staff)
+            self.assertEqual(self.client.get(url).status_code, 404)
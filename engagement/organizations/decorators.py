@@ -0,0 +1,76 @@
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+from .models import OrganizationMembership
+
+
+CONTEXT_VERSION_KEY = 'organizations:context-version:{organization_id}'
+CONTEXT_KEY = 'organizations:context:{organization_id}:{version}:{user_id}'
+
+
+def organization_member(url_kwarg='pk'):
+    """Resolve the organization in ``url_kwarg`` and the caller's membership before the view runs.
+
+    Sets ``request.organization`` and ``request.membership`` and raises Http404
+    if the organization does not exist or the user is not a member. The
+    organization's survey comes with the same query, so ``organization.survey``
+    needs no query of its own. Use below ``login_required``.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            membership = get_membership(request, kwargs[url_kwarg])
+            request.membership = membership
+            request.organization = membership.organization
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_membership(request, organization_id):
+    """Return the caller's membership with organization and survey loaded, once per request.
+
+    With ORGANIZATION_CONTEXT_CACHE_TIMEOUT set it is also cached per user for
+    that many seconds, until the organization, its survey or one of its
+    memberships changes.
+    """
+    memberships = request.__dict__.setdefault('_organization_memberships', {})
+    if organization_id in memberships:
+        return memberships[organization_id]
+
+    timeout = getattr(settings, 'ORGANIZATION_CONTEXT_CACHE_TIMEOUT', 0)
+    membership = None
+    if timeout:
+        key = CONTEXT_KEY.format(
+            organization_id=organization_id,
+            version=get_context_version(organization_id),
+            user_id=request.user.pk
+        )
+        membership = cache.get(key)
+
+    if membership is None:
+        membership = OrganizationMembership.objects.select_related('organization', 'organization__survey').filter(
+            user=request.user,
+            organization_id=organization_id
+        ).first()
+        if membership is None:
+            raise Http404('No organization membership matches the given query.')
+        if timeout:
+            cache.set(key, membership, timeout=timeout)
+
+    memberships[organization_id] = membership
+    return membership
+
+
+def get_context_version(organization_id):
+    """Return the version of an organization's memberships and reporting lines, starting one if there is none"""
+    return cache.get_or_set(CONTEXT_VERSION_KEY.format(organization_id=organization_id), time.time_ns, timeout=None)
+
+
+def bump_context_version(organization_id):
+    """Drop the cached memberships of an organization once the current transaction commits"""
+    key = CONTEXT_VERSION_KEY.format(organization_id=organization_id)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), timeout=None))
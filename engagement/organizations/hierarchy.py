@@ -0,0 +1,181 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from .decorators import bump_context_version
+from .models import OrganizationMembership, ReportingLine
+
+
+_deferred = threading.local()
+
+# Sent with ``organization`` after its closure table has been rebuilt, for data
+# derived from reporting lines that per-row maintenance would otherwise keep up to date
+rebuilt = Signal()
+
+
+@contextmanager
+def deferred_maintenance(organization):
+    """Skip per-row closure maintenance in this thread and rebuild the organization afterwards.
+
+    For bulk membership writes (bulk_create, queryset updates and deletes) that
+    would otherwise bypass the signals or trigger them once per row.
+    """
+    _deferred.depth = getattr(_deferred, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _deferred.depth -= 1
+    rebuild(organization)
+
+
+def maintenance_deferred():
+    return getattr(_deferred, 'depth', 0) > 0
+
+
+def with_report_counts(memberships):
+    """Annotate ``direct_count`` and ``headcount`` (all reports at any depth) as subqueries"""
+    direct_counts = OrganizationMembership.objects.filter(
+        reports_to=OuterRef('pk')
+    ).order_by().values('reports_to').annotate(n=Count('pk')).values('n')
+    headcounts = ReportingLine.objects.filter(
+        ancestor=OuterRef('pk'),
+        depth__gt=0
+    ).order_by().values('ancestor').annotate(n=Count('pk')).values('n')
+    return memberships.annotate(
+        direct_count=Coalesce(Subquery(direct_counts), 0),
+        headcount=Coalesce(Subquery(headcounts), 0)
+    )
+
+
+def add_member(membership):
+    """Add closure rows for a newly created membership"""
+    lines = [ReportingLine(
+        organization_id=membership.organization_id,
+        ancestor_id=membership.pk,
+        descendant_id=membership.pk,
+        depth=0
+    )]
+    if membership.reports_to_id is not None:
+        lines.extend(
+            ReportingLine(
+                organization_id=membership.organization_id,
+                ancestor_id=ancestor_id,
+                descendant_id=membership.pk,
+                depth=depth + 1
+            )
+            for ancestor_id, depth in ReportingLine.objects.filter(
+                descendant_id=membership.reports_to_id
+            ).values_list('ancestor_id', 'depth')
+        )
+    ReportingLine.objects.bulk_create(lines)
+
+
+def creates_cycle(membership):
+    """Whether the new ``reports_to`` of a saved membership is the member or one of its reports"""
+    return membership.reports_to_id is not None and ReportingLine.objects.filter(
+        ancestor_id=membership.pk,
+        descendant_id=membership.reports_to_id
+    ).exists()
+
+
+def move_member(membership):
+    """Re-link a membership and everyone under it below its current ``reports_to``"""
+    subtree_lines = ReportingLine.objects.filter(ancestor_id=membership.pk)
+    subtree = list(subtree_lines.values_list('descendant_id', 'depth'))
+
+    with transaction.atomic():
+        # Cut the subtree off from its old managers
+        ReportingLine.objects.filter(
+            descendant__in=subtree_lines.values('descendant_id')
+        ).exclude(ancestor__in=subtree_lines.values('descendant_id')).delete()
+
+        if membership.reports_to_id is None:
+            return
+
+        ancestors = ReportingLine.objects.filter(
+            descendant_id=membership.reports_to_id
+        ).values_list('ancestor_id', 'depth')
+        ReportingLine.objects.bulk_create(
+            (
+                ReportingLine(
+                    organization_id=membership.organization_id,
+                    ancestor_id=ancestor_id,
+                    descendant_id=descendant_id,
+                    depth=ancestor_depth + 1 + descendant_depth
+                )
+                for ancestor_id, ancestor_depth in ancestors
+                for descendant_id, descendant_depth in subtree
+            ),
+            batch_size=1000
+        )
+
+
+def detach_reports(membership):
+    """Cut the reports of a membership that is about to be deleted off from its managers"""
+    ReportingLine.objects.filter(
+        descendant__in=ReportingLine.objects.filter(ancestor_id=membership.pk, depth__gt=0).values('descendant_id'),
+        ancestor__in=ReportingLine.objects.filter(descendant_id=membership.pk, depth__gt=0).values('ancestor_id')
+    ).delete()
+
+
+def closure_lines(parents):
+    """Yield (ancestor_id, descendant_id, depth) for a {member_id: reports_to_id} mapping.
+
+    Members caught in a reporting cycle are only linked to themselves.
+    """
+    children = defaultdict(list)
+    for member_id, parent_id in parents.items():
+        if parent_id is not None and parent_id in parents:
+            children[parent_id].append(member_id)
+
+    roots = [member_id for member_id, parent_id in parents.items() if parent_id is None or parent_id not in parents]
+    reached = set()
+    stack = [(root, ()) for root in roots]
+    while stack:
+        member_id, chain = stack.pop()
+        reached.add(member_id)
+        yield member_id, member_id, 0
+        for depth, ancestor_id in enumerate(reversed(chain), start=1):
+            yield ancestor_id, member_id, depth
+        chain = chain + (member_id,)
+        stack.extend((child_id, chain) for child_id in children[member_id])
+
+    for member_id in parents.keys() - reached:
+        yield member_id, member_id, 0
+
+
+def rebuild(organization, batch_size=10000):
+    """Recompute the closure table of an organization from ``reports_to``"""
+    parents = dict(
+        OrganizationMembership.objects.filter(organization=organization).values_list('id', 'reports_to_id')
+    )
+
+    # Closure tables are several times larger than the organization, so rows are
+    # written as plain tuples rather than model instances
+    table = connection.ops.quote_name(ReportingLine._meta.db_table)
+    insert = (
+        f'INSERT INTO {table} (organization_id, ancestor_id, descendant_id, depth) '
+        f'VALUES (%s, %s, %s, %s)'
+    )
+
+    created = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        ReportingLine.objects.filter(organization=organization).delete()
+        batch = []
+        for ancestor_id, descendant_id, depth in closure_lines(parents):
+            batch.append((organization.pk, ancestor_id, descendant_id, depth))
+            if len(batch) >= batch_size:
+                cursor.executemany(insert, batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert, batch)
+            created += len(batch)
+
+    # Bulk membership writes skip the signals that would otherwise do this
+    bump_context_version(organization.pk)
+    rebuilt.send(sender=ReportingLine, organization=organization)
+    return created
@@ -1,8 +1,55 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.db import transaction
+from organizations import hierarchy
 from organizations.models import Organization, OrganizationMembership
 import random
+import time
+
+
+# Job titles by level
+JOB_TITLES = {
+    'ceo': ['Chief Executive Officer', 'President'],
+    'c_level': ['Chief Technology Officer', 'Chief Operating Officer', 'Chief Financial Officer', 
+               'Chief Marketing Officer', 'Chief Human Resources Officer'],
+    'vp': ['VP of Engineering', 'VP of Sales', 'VP of Marketing', 'VP of Operations', 
+           'VP of Finance', 'VP of Human Resources', 'VP of Product'],
+    'director': ['Director of Engineering', 'Director of Sales', 'Director of Marketing', 
+                'Director of Operations', 'Director of Finance', 'Director of HR', 
+                'Director of Product', 'Director of Customer Success'],
+    'manager': ['Engineering Manager', 'Sales Manager', 'Marketing Manager', 
+               'Operations Manager', 'Finance Manager', 'HR Manager', 'Product Manager',
+               'Team Lead', 'Project Manager', 'Account Manager'],
+    'senior': ['Senior Software Engineer', 'Senior Sales Representative', 'Senior Marketing Specialist',
+              'Senior Operations Analyst', 'Senior Financial Analyst', 'Senior HR Specialist',
+              'Senior Product Designer', 'Senior Data Analyst', 'Senior DevOps Engineer'],
+    'mid': ['Software Engineer', 'Sales Representative', 'Marketing Specialist', 
+           'Operations Analyst', 'Financial Analyst', 'HR Specialist', 'Product Designer',
+           'Data Analyst', 'DevOps Engineer', 'Business Analyst'],
+    'junior': ['Junior Software Engineer', 'Junior Sales Representative', 'Junior Marketing Coordinator',
+              'Junior Operations Assistant', 'Junior Financial Analyst', 'Junior HR Coordinator',
+              'Junior Product Designer', 'Junior Data Analyst', 'Intern']
+}
+
+# Common first and last names for generating realistic names
+FIRST_NAMES = [
+    'John', 'Jane', 'Michael', 'Sarah', 'David', 'Lisa', 'Robert', 'Emily', 'James', 'Ashley',
+    'William', 'Jessica', 'Richard', 'Jennifer', 'Joseph', 'Amanda', 'Thomas', 'Melissa',
+    'Christopher', 'Michelle', 'Daniel', 'Kimberly', 'Matthew', 'Amy', 'Anthony', 'Angela',
+    'Mark', 'Helen', 'Donald', 'Brenda', 'Steven', 'Nicole', 'Paul', 'Katherine', 'Andrew',
+    'Samantha', 'Joshua', 'Christine', 'Kenneth', 'Rachel', 'Kevin', 'Deborah', 'Brian',
+    'Caroline', 'George', 'Janet', 'Edward', 'Catherine', 'Ronald', 'Maria'
+]
+
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+    'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor',
+    'Moore', 'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez',
+    'Clark', 'Ramirez', 'Lewis', 'Robinson', 'Walker', 'Young', 'Allen', 'King', 'Wright',
+    'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores', 'Green', 'Adams', 'Nelson', 'Baker',
+    'Hall', 'Rivera', 'Campbell', 'Mitchell', 'Carter', 'Roberts'
+]
 
 
 class Command(BaseCommand):
@@ -13,8 +60,22 @@ class Command(BaseCommand):
         parser.add_argument('--size', type=str, choices=['small', 'medium', 'large'], default='medium', 
                           help='Size of the organization (small: 15-25, medium: 30-50, large: 60-100)')
         parser.add_argument('--clear', action='store_true', help='Clear existing data for the organization')
+        parser.add_argument('--employees', type=int,
+                          help='Generate exactly this many employees with bulk inserts (for load testing, ignores --size)')
+        parser.add_argument('--max-span', type=int, default=7,
+                          help='Maximum direct reports per manager in --employees mode (default: 7)')
+        parser.add_argument('--depth', type=int, default=8,
+                          help='Maximum number of levels in --employees mode (default: 8)')
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible org-charts')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                          help='Rows per bulk insert in --employees mode (default: 2000)')
 
     def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        if options['employees'] is not None:
+            return self.handle_bulk(**options)
+        
         org_name = options['org_name']
         size = options['size']
         clear_existing = options['clear']
@@ -29,48 +90,9 @@ class Command(BaseCommand):
         config = size_configs[size]
         num_employees = random.randint(config['min_employees'], config['max_employees'])
         
-        # Job titles by level
-        job_titles = {
-            'ceo': ['Chief Executive Officer', 'President'],
-            'c_level': ['Chief Technology Officer', 'Chief Operating Officer', 'Chief Financial Officer', 
-                       'Chief Marketing Officer', 'Chief Human Resources Officer'],
-            'vp': ['VP of Engineering', 'VP of Sales', 'VP of Marketing', 'VP of Operations', 
-                   'VP of Finance', 'VP of Human Resources', 'VP of Product'],
-            'director': ['Director of Engineering', 'Director of Sales', 'Director of Marketing', 
-                        'Director of Operations', 'Director of Finance', 'Director of HR', 
-                        'Director of Product', 'Director of Customer Success'],
-            'manager': ['Engineering Manager', 'Sales Manager', 'Marketing Manager', 
-                       'Operations Manager', 'Finance Manager', 'HR Manager', 'Product Manager',
-                       'Team Lead', 'Project Manager', 'Account Manager'],
-            'senior': ['Senior Software Engineer', 'Senior Sales Representative', 'Senior Marketing Specialist',
-                      'Senior Operations Analyst', 'Senior Financial Analyst', 'Senior HR Specialist',
-                      'Senior Product Designer', 'Senior Data Analyst', 'Senior DevOps Engineer'],
-            'mid': ['Software Engineer', 'Sales Representative', 'Marketing Specialist', 
-                   'Operations Analyst', 'Financial Analyst', 'HR Specialist', 'Product Designer',
-                   'Data Analyst', 'DevOps Engineer', 'Business Analyst'],
-            'junior': ['Junior Software Engineer', 'Junior Sales Representative', 'Junior Marketing Coordinator',
-                      'Junior Operations Assistant', 'Junior Financial Analyst', 'Junior HR Coordinator',
-                      'Junior Product Designer', 'Junior Data Analyst', 'Intern']
-        }
-        
-        # Common first and last names for generating realistic names
-        first_names = [
-            'John', 'Jane', 'Michael', 'Sarah', 'David', 'Lisa', 'Robert', 'Emily', 'James', 'Ashley',
-            'William', 'Jessica', 'Richard', 'Jennifer', 'Joseph', 'Amanda', 'Thomas', 'Melissa',
-            'Christopher', 'Michelle', 'Daniel', 'Kimberly', 'Matthew', 'Amy', 'Anthony', 'Angela',
-            'Mark', 'Helen', 'Donald', 'Brenda', 'Steven', 'Nicole', 'Paul', 'Katherine', 'Andrew',
-            'Samantha', 'Joshua', 'Christine', 'Kenneth', 'Rachel', 'Kevin', 'Deborah', 'Brian',
-            'Caroline', 'George', 'Janet', 'Edward', 'Catherine', 'Ronald', 'Maria'
-        ]
-        
-        last_names = [
-            'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
-            'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor',
-            'Moore', 'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez',
-            'Clark', 'Ramirez', 'Lewis', 'Robinson', 'Walker', 'Young', 'Allen', 'King', 'Wright',
-            'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores', 'Green', 'Adams', 'Nelson', 'Baker',
-            'Hall', 'Rivera', 'Campbell', 'Mitchell', 'Carter', 'Roberts'
-        ]
+        job_titles = JOB_TITLES
+        first_names = FIRST_NAMES
+        last_names = LAST_NAMES
         
         self.stdout.write(f"Generating org-chart for '{org_name}' with {num_employees} employees...")
         
@@ -276,4 +298,146 @@ class Command(BaseCommand):
             if emp['can_manage']:
                 direct_reports = emp['membership'].direct_reports.count()
                 if direct_reports > 0:
-                    self.stdout.write(f"  {emp['membership'].user.get_full_name()}: {direct_reports} reports")
\ No newline at end of file
+                    self.stdout.write(f"  {emp['membership'].user.get_full_name()}: {direct_reports} reports")
+
+    def handle_bulk(self, org_name, employees, max_span, depth, seed, batch_size, clear, **options):
+        """Generate a large org-chart in memory and write it with chunked bulk inserts"""
+        if employees < 1 or max_span < 1 or depth < 1:
+            raise CommandError('--employees, --max-span and --depth must be at least 1')
+        capacity = sum(max_span ** level for level in range(depth))
+        if employees > capacity:
+            raise CommandError(
+                f'{employees} employees do not fit in {depth} levels with at most {max_span} reports each '
+                f'(maximum {capacity})'
+            )
+        
+        started = time.monotonic()
+        rng = random.Random(seed)
+        parents, levels, spans = self.build_tree(rng, employees, max_span, depth)
+        self.stdout.write(f"Generating org-chart for '{org_name}' with {employees} employees...")
+        
+        domain = f"{org_name.lower().replace(' ', '')}.com"
+        people = []
+        for i in range(employees):
+            first = rng.choice(FIRST_NAMES)
+            last = rng.choice(LAST_NAMES)
+            if i == 0:
+                title, role = rng.choice(JOB_TITLES['ceo']), 'owner'
+            elif spans[i]:
+                band = ['ceo', 'c_level', 'vp', 'director'][levels[i]] if levels[i] < 4 else 'manager'
+                title, role = rng.choice(JOB_TITLES[band]), 'admin' if levels[i] < 4 else 'member'
+            else:
+                band = rng.choices(['senior', 'mid', 'junior'], weights=[2, 3, 1])[0]
+                title, role = rng.choice(JOB_TITLES[band]), 'member'
+            people.append((f'{first.lower()}.{last.lower()}.{i}@{domain}', first, last, title, role))
+        
+        with transaction.atomic():
+            org, created = Organization.objects.get_or_create(
+                name=org_name,
+                defaults={'questions_per_cycle': 5}
+            )
+            
+            with hierarchy.deferred_maintenance(org):
+                if clear:
+                    OrganizationMembership.objects.filter(organization=org).delete()
+                    self.stdout.write(f"Cleared existing data for '{org_name}'")
+                elif OrganizationMembership.objects.filter(organization=org).exists():
+                    raise CommandError(f"'{org_name}' already has members, use --clear to replace them")
+                
+                user_ids = self.bulk_users(people, domain, batch_size)
+                self.stdout.write(f"Users ready: {len(user_ids)}")
+                
+                # Insert level by level so every manager already has an id when their reports are created
+                membership_ids = [None] * employees
+                by_level = {}
+                for i, level in enumerate(levels):
+                    by_level.setdefault(level, []).append(i)
+                for level in sorted(by_level):
+                    indexes = by_level[level]
+                    memberships = [
+                        OrganizationMembership(
+                            user_id=user_ids[people[i][0]],
+                            organization=org,
+                            role=people[i][4],
+                            title=people[i][3],
+                            reports_to_id=membership_ids[parents[i]] if parents[i] is not None else None
+                        )
+                        for i in indexes
+                    ]
+                    OrganizationMembership.objects.bulk_create(memberships, batch_size=batch_size)
+                    if any(membership.pk is None for membership in memberships):
+                        # Backends that cannot return ids from bulk inserts
+                        ids = dict(OrganizationMembership.objects.filter(
+                            organization=org,
+                            user_id__in=[membership.user_id for membership in memberships]
+                        ).values_list('user_id', 'id'))
+                        for membership in memberships:
+                            membership.pk = ids[membership.user_id]
+                    for i, membership in zip(indexes, memberships):
+                        membership_ids[i] = membership.pk
+                    self.stdout.write(f"  Level {level}: {len(memberships)} members")
+                
+                # Always ensure user with ID=1 is added to the organization
+                if User.objects.filter(id=1).exists():
+                    OrganizationMembership.objects.get_or_create(
+                        user_id=1,
+                        organization=org,
+                        defaults={'role': 'owner', 'title': 'System Administrator'}
+                    )
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully created org-chart for '{org_name}' with {employees} employees "
+                f"in {time.monotonic() - started:.1f}s!"
+            )
+        )
+        
+        self.stdout.write("\nOrg Chart Summary:")
+        for level in range(max(levels) + 1):
+            self.stdout.write(f"  Level {level}: {levels.count(level)}")
+        managers = [span for span in spans if span]
+        if managers:
+            self.stdout.write(
+                f"\nManagers: {len(managers)}, average span {sum(managers) / len(managers):.1f}, "
+                f"max span {max(managers)}"
+            )
+
+    def build_tree(self, rng, employees, max_span, depth):
+        """Assign every employee a manager using in-memory span counters.
+
+        Returns parallel lists of manager index (None for the CEO), level and
+        number of direct reports.
+        """
+        parents = [None]
+        levels = [0]
+        spans = [0]
+        # Managers that still have room for reports and are not on the last level
+        open_managers = [0] if depth > 1 else []
+        for i in range(1, employees):
+            slot = rng.randrange(len(open_managers))
+            manager = open_managers[slot]
+            parents.append(manager)
+            levels.append(levels[manager] + 1)
+            spans.append(0)
+            spans[manager] += 1
+            if spans[manager] >= max_span:
+                open_managers[slot] = open_managers[-1]
+                open_managers.pop()
+            if levels[i] < depth - 1:
+                open_managers.append(i)
+        return parents, levels, spans
+
+    def bulk_users(self, people, domain, batch_size):
+        """Create missing users in bulk and return a username to id mapping"""
+        user_ids = dict(User.objects.filter(username__endswith=f'@{domain}').values_list('username', 'id'))
+        # Generated employees cannot log in, so they all share one unusable password hash
+        password = make_password(None)
+        missing = [
+            User(username=email, email=email, first_name=first, last_name=last, password=password)
+            for email, first, last, title, role in people
+            if email not in user_ids
+        ]
+        User.objects.bulk_create(missing, batch_size=batch_size)
+        if missing:
+            user_ids.update(User.objects.filter(username__endswith=f'@{domain}').values_list('username', 'id'))
+        return user_ids
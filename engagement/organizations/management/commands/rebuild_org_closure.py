@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from organizations import hierarchy
+from organizations.models import Organization
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the reporting-line closure table from OrganizationMembership.reports_to'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'organization_ids',
+            nargs='*',
+            type=int,
+            help='IDs of the organizations to rebuild (default: all organizations)'
+        )
+
+    def handle(self, *args, **options):
+        organization_ids = options['organization_ids']
+
+        organizations = Organization.objects.all()
+        if organization_ids:
+            organizations = organizations.filter(id__in=organization_ids)
+            missing = set(organization_ids) - set(organizations.values_list('id', flat=True))
+            for organization_id in sorted(missing):
+                self.stdout.write(
+                    self.style.ERROR(f'Organization with ID {organization_id} does not exist')
+                )
+
+        for organization in organizations:
+            lines = hierarchy.rebuild(organization)
+            self.stdout.write(f'Rebuilt reporting lines for "{organization.name}": {lines} rows')
+
+        self.stdout.write(self.style.SUCCESS('Reporting-line closure table rebuilt'))
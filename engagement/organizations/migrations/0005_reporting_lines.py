@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0004_organizationmembership_title'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportingLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_lines', to='organizations.organizationmembership')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_lines', to='organizations.organizationmembership')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='organizations.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='organizatio_ancesto_596711_idx'), models.Index(fields=['descendant', 'depth'], name='organizatio_descend_9f0edf_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def closure_lines(parents):
+    # A copy of organizations.hierarchy.closure_lines as it was when this migration was written
+    children = defaultdict(list)
+    for member_id, parent_id in parents.items():
+        if parent_id is not None and parent_id in parents:
+            children[parent_id].append(member_id)
+
+    roots = [member_id for member_id, parent_id in parents.items() if parent_id is None or parent_id not in parents]
+    reached = set()
+    stack = [(root, ()) for root in roots]
+    while stack:
+        member_id, chain = stack.pop()
+        reached.add(member_id)
+        yield member_id, member_id, 0
+        for depth, ancestor_id in enumerate(reversed(chain), start=1):
+            yield ancestor_id, member_id, depth
+        chain = chain + (member_id,)
+        stack.extend((child_id, chain) for child_id in children[member_id])
+
+    # Members caught in a reporting cycle are only linked to themselves
+    for member_id in parents.keys() - reached:
+        yield member_id, member_id, 0
+
+
+def populate_reporting_lines(apps, schema_editor):
+    Organization = apps.get_model('organizations', 'Organization')
+    OrganizationMembership = apps.get_model('organizations', 'OrganizationMembership')
+    ReportingLine = apps.get_model('organizations', 'ReportingLine')
+
+    for organization_id in Organization.objects.values_list('id', flat=True):
+        parents = dict(
+            OrganizationMembership.objects.filter(organization_id=organization_id).values_list('id', 'reports_to_id')
+        )
+        ReportingLine.objects.bulk_create(
+            (
+                ReportingLine(
+                    organization_id=organization_id,
+                    ancestor_id=ancestor_id,
+                    descendant_id=descendant_id,
+                    depth=depth
+                )
+                for ancestor_id, descendant_id, depth in closure_lines(parents)
+            ),
+            batch_size=5000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0005_reporting_lines'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_reporting_lines, migrations.RunPython.noop),
+    ]
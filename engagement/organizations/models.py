@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 
 
 class Organization(models.Model):
@@ -35,10 +36,48 @@ class OrganizationMembership(models.Model):
     def __str__(self):
         return f"{self.user.email} - {self.organization.name} ({self.role})"
     
+    def clean(self):
+        if self.reports_to_id is None:
+            return
+        if self.reports_to.organization_id != self.organization_id:
+            raise ValidationError({'reports_to': 'Managers must belong to the same organization.'})
+        if self.pk and ReportingLine.objects.filter(ancestor_id=self.pk, descendant_id=self.reports_to_id).exists():
+            raise ValidationError({'reports_to': 'A member cannot report to themselves or one of their reports.'})
+    
+    def subordinates(self):
+        """Queryset of all subordinates (direct and indirect reports), nearest first"""
+        return OrganizationMembership.objects.filter(
+            ancestor_lines__ancestor=self,
+            ancestor_lines__depth__gt=0
+        ).order_by('ancestor_lines__depth', 'id')
+    
     def get_all_subordinates(self):
         """Get all subordinates (direct and indirect reports)"""
-        subordinates = []
-        for direct_report in self.direct_reports.all():
-            subordinates.append(direct_report)
-            subordinates.extend(direct_report.get_all_subordinates())
-        return subordinates
+        return list(self.subordinates())
+    
+    def get_level(self):
+        """Number of managers above this member (0 for the top of the chart)"""
+        return self.ancestor_lines.aggregate(level=models.Max('depth'))['level'] or 0
+
+
+class ReportingLine(models.Model):
+    """Closure table of the reporting hierarchy.
+
+    Holds one row for every (manager, report) pair at any distance, plus a depth 0
+    row linking each member to themselves, so subtree and chain-of-command lookups
+    are a single indexed query. Kept up to date by organizations.signals.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    ancestor = models.ForeignKey(OrganizationMembership, on_delete=models.CASCADE, related_name='descendant_lines')
+    descendant = models.ForeignKey(OrganizationMembership, on_delete=models.CASCADE, related_name='ancestor_lines')
+    depth = models.PositiveIntegerField()
+    
+    class Meta:
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['ancestor', 'depth']),
+            models.Index(fields=['descendant', 'depth']),
+        ]
+    
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
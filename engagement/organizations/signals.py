@@ -0,0 +1,52 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from . import hierarchy
+from .decorators import bump_context_version
+from .models import Organization, OrganizationMembership
+
+
+@receiver(pre_save, sender=OrganizationMembership)
+def membership_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._reports_to_changed = False
+    if raw or hierarchy.maintenance_deferred() or instance.pk is None:
+        return
+    if update_fields is not None and 'reports_to' not in update_fields:
+        return
+    previous = OrganizationMembership.objects.filter(pk=instance.pk).values_list('reports_to_id', flat=True)
+    if previous and previous[0] != instance.reports_to_id:
+        if hierarchy.creates_cycle(instance):
+            raise ValueError(f'{instance} cannot report to themselves or one of their reports')
+        instance._reports_to_changed = True
+
+
+@receiver(post_save, sender=OrganizationMembership)
+def membership_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or hierarchy.maintenance_deferred():
+        return
+    if created:
+        hierarchy.add_member(instance)
+    elif getattr(instance, '_reports_to_changed', False):
+        hierarchy.move_member(instance)
+
+
+@receiver(pre_delete, sender=OrganizationMembership)
+def membership_deleting(sender, instance, origin=None, **kwargs):
+    # Deleting an organization removes its whole closure table anyway
+    if isinstance(origin, Organization) or hierarchy.maintenance_deferred():
+        return
+    hierarchy.detach_reports(instance)
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def organization_changed(sender, instance, **kwargs):
+    bump_context_version(instance.pk)
+
+
+@receiver(post_save, sender=OrganizationMembership)
+@receiver(post_delete, sender=OrganizationMembership)
+def membership_changed(sender, instance, raw=False, origin=None, **kwargs):
+    # Deleting an organization bumps the version once for all of its memberships
+    if raw or isinstance(origin, Organization):
+        return
+    bump_context_version(instance.organization_id)
@@ -1,3 +1,238 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from engagement.testing import QueryBudgetTestCase
+from .models import Organization, OrganizationMembership, ReportingLine
 
-# Create your tests here.
+
+class OrganizationDataMixin:
+    """An organization with an owner, grown into a wider and deeper org-chart by ``grow()``"""
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'password')
+        self.organization = Organization.objects.create(name='Acme')
+        self.membership = OrganizationMembership.objects.create(
+            user=self.user, organization=self.organization, role='owner'
+        )
+        self.add_reports(self.membership, 2, 'first')
+        self.client.force_login(self.user)
+
+    def add_reports(self, manager, count, prefix):
+        reports = []
+        for number in range(count):
+            user = User.objects.create_user(f'{prefix}-{number}', f'{prefix}-{number}@example.com')
+            reports.append(OrganizationMembership.objects.create(
+                user=user, organization=self.organization, reports_to=manager, title=f'Title {number}'
+            ))
+        return reports
+
+    def grow(self):
+        # Wider at the top and deeper than ORG_CHART_INITIAL_DEPTH
+        manager = self.membership
+        for level in range(5):
+            manager = self.add_reports(manager, 4, f'level{level}')[0]
+        for number in range(3):
+            organization = Organization.objects.create(name=f'Other {number}')
+            OrganizationMembership.objects.create(user=self.user, organization=organization, role='member')
+
+
+class HierarchyTests(OrganizationDataMixin, TestCase):
+    """The closure table and the lookups built on it agree with walking ``reports_to``"""
+    def walked_lines(self):
+        parents = dict(
+            OrganizationMembership.objects.filter(organization=self.organization).values_list('id', 'reports_to_id')
+        )
+        lines = set()
+        for member in parents:
+            ancestor, depth = member, 0
+            while ancestor is not None:
+                lines.add((ancestor, member, depth))
+                ancestor, depth = parents[ancestor], depth + 1
+        return lines
+
+    def recursive_subordinates(self, membership):
+        # How get_all_subordinates used to find them, one query per member
+        subordinates = []
+        for direct_report in membership.direct_reports.order_by('id'):
+            subordinates.append(direct_report)
+            subordinates.extend(self.recursive_subordinates(direct_report))
+        return subordinates
+
+    def assertClosureMatches(self):
+        self.assertEqual(
+            set(ReportingLine.objects.filter(organization=self.organization).values_list(
+                'ancestor_id', 'descendant_id', 'depth'
+            )),
+            self.walked_lines()
+        )
+
+    def member(self, username):
+        return OrganizationMembership.objects.get(organization=self.organization, user__username=username)
+
+    def test_closure_follows_adds_moves_and_deletes(self):
+        self.grow()
+        self.assertClosureMatches()
+
+        moved = self.member('level2-0')
+        moved.reports_to = self.member('first-1')
+        moved.save()
+        self.assertClosureMatches()
+
+        moved.reports_to = None
+        moved.save()
+        self.assertClosureMatches()
+
+        self.add_reports(moved, 2, 'added')
+        self.assertClosureMatches()
+
+        # Reports of a deleted manager move to the top of the chart
+        self.member('level0-0').delete()
+        self.assertClosureMatches()
+        User.objects.get(username='level3-0').delete()
+        self.assertClosureMatches()
+
+    def test_get_all_subordinates(self):
+        self.grow()
+        for manager in OrganizationMembership.objects.filter(organization=self.organization):
+            with self.subTest(manager=manager.user.username):
+                depths = {
+                    descendant: depth for ancestor, descendant, depth in self.walked_lines() if ancestor == manager.id
+                }
+                # The same members as before, but nearest first and then by id, where the recursive
+                # version listed each report's whole subtree before the next report
+                expected = self.recursive_subordinates(manager)
+                self.assertEqual(
+                    manager.get_all_subordinates(),
+                    sorted(expected, key=lambda member: (depths[member.id], member.id))
+                )
+
+
+class OrgChartTests(OrganizationDataMixin, TestCase):
+    """The org chart shows the top levels and every deeper member can be reached by expanding"""
+    def test_initial_levels_and_expanding(self):
+        self.grow()
+        members = list(OrganizationMembership.objects.filter(organization=self.organization).order_by('id'))
+
+        def shown(nodes):
+            for node in nodes:
+                yield node['membership'].id
+                yield from shown(node['children'])
+
+        response = self.client.get(reverse('organization_org_chart', args=[self.organization.pk]))
+        self.assertEqual(
+            sorted(shown(response.context['org_chart'])),
+            [member.id for member in members if member.get_level() < settings.ORG_CHART_INITIAL_DEPTH]
+        )
+
+        for manager in members:
+            with self.subTest(manager=manager.user.username):
+                reports = self.client.get(
+                    reverse('organization_org_chart_reports', args=[self.organization.pk, manager.pk])
+                ).json()['reports']
+                direct_reports = list(manager.direct_reports.order_by('id'))
+                self.assertEqual([report['id'] for report in reports], [member.id for member in direct_reports])
+                for report, member in zip(reports, direct_reports):
+                    self.assertEqual(report['direct_count'], member.direct_reports.count())
+                    self.assertEqual(report['headcount'], len(member.get_all_subordinates()))
+
+
+class OrganizationContextTests(OrganizationDataMixin, TestCase):
+    """organization_member resolves the organization and the caller's membership, cached or not"""
+    def setUp(self):
+        super().setUp()
+        # Rolled back tests never bump the context versions and the next test reuses their ids
+        cache.clear()
+        self.detail_url = reverse('organization_detail', args=[self.organization.pk])
+        self.edit_url = reverse('organization_edit', args=[self.organization.pk])
+
+    def test_request_context(self):
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.wsgi_request.organization, self.organization)
+        self.assertEqual(response.wsgi_request.membership, self.membership)
+        self.assertEqual(response.context['membership'].role, 'owner')
+
+    def test_non_members_get_404(self):
+        self.client.force_login(User.objects.create_user('outsider', 'outsider@example.com'))
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse('organization_detail', args=[self.organization.pk + 100])).status_code, 404
+        )
+
+    @override_settings(ORGANIZATION_CONTEXT_CACHE_TIMEOUT=300)
+    def test_cached_context_follows_changes(self):
+        self.assertEqual(self.client.get(self.edit_url).status_code, 200)
+        # Only the session and the user are loaded, the membership comes from the cache
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(self.edit_url).status_code, 200)
+
+        self.membership.role = 'member'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.membership.save()
+        self.assertRedirects(self.client.get(self.edit_url), self.detail_url)
+
+        self.organization.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization.save()
+        self.assertEqual(self.client.get(self.detail_url).wsgi_request.organization.name, 'Renamed')
+
+class OrganizationViewQueryTests(OrganizationDataMixin, QueryBudgetTestCase):
+    def test_organization_list(self):
+        self.assertQueryBudget(3, lambda: self.client.get(reverse('organization_list')))
+
+    def test_organization_create(self):
+        self.assertQueryBudget(2, lambda: self.client.get(reverse('organization_create')))
+
+    def test_organization_create_post(self):
+        self.assertQueryBudget(
+            7,
+            lambda: self.client.post(reverse('organization_create'), {'name': 'New', 'questions_per_cycle': 5}),
+            status=302
+        )
+
+    def test_organization_detail(self):
+        self.assertQueryBudget(3, lambda: self.client.get(reverse('organization_detail', args=[self.organization.pk])))
+
+    def test_organization_edit(self):
+        self.assertQueryBudget(3, lambda: self.client.get(reverse('organization_edit', args=[self.organization.pk])))
+
+    def test_organization_edit_post(self):
+        self.assertQueryBudget(
+            5,
+            lambda: self.client.post(
+                reverse('organization_edit', args=[self.organization.pk]), {'name': 'Acme', 'questions_per_cycle': 7}
+            ),
+            status=302
+        )
+
+    def test_organization_org_chart(self):
+        self.assertQueryBudget(
+            4, lambda: self.client.get(reverse('organization_org_chart', args=[self.organization.pk]))
+        )
+
+    def test_organization_org_chart_reports(self):
+        self.assertQueryBudget(
+            4,
+            lambda: self.client.get(
+                reverse('organization_org_chart_reports', args=[self.organization.pk, self.membership.pk])
+            )
+        )
+
+    def test_get_all_subordinates(self):
+        self.assertQueryBudget(1, self.membership.get_all_subordinates, status=None)
+
+
+class OrganizationAdminQueryTests(OrganizationDataMixin, QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+
+    def test_organization_changelist(self):
+        self.assertQueryBudget(6, lambda: self.client.get(reverse('admin:organizations_organization_changelist')))
+
+    def test_organizationmembership_changelist(self):
+        self.assertQueryBudget(
+            5, lambda: self.client.get(reverse('admin:organizations_organizationmembership_changelist'))
+        )
@@ -7,4 +7,5 @@ urlpatterns = [
     path('<int:pk>/', views.organization_detail, name='organization_detail'),
     path('<int:pk>/edit/', views.organization_edit, name='organization_edit'),
     path('<int:pk>/org-chart/', views.organization_org_chart, name='organization_org_chart'),
+    path('<int:pk>/org-chart/<int:member_pk>/reports/', views.organization_org_chart_reports, name='organization_org_chart_reports'),
 ]
\ No newline at end of file
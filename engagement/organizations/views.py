@@ -1,8 +1,12 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
 from django.db import transaction
-from .models import Organization, OrganizationMembership
+from django.http import JsonResponse
+from .decorators import organization_member
+from .hierarchy import with_report_counts
+from .models import OrganizationMembership
 from .forms import OrganizationForm
 
 
@@ -33,9 +37,10 @@ def organization_create(request):
 
 
 @login_required
+@organization_member()
 def organization_detail(request, pk):
-    organization = get_object_or_404(Organization, pk=pk)
-    membership = get_object_or_404(OrganizationMembership, user=request.user, organization=organization)
+    organization = request.organization
+    membership = request.membership
     return render(request, 'organizations/detail.html', {
         'organization': organization,
         'membership': membership
@@ -43,9 +48,10 @@ def organization_detail(request, pk):
 
 
 @login_required
+@organization_member()
 def organization_edit(request, pk):
-    organization = get_object_or_404(Organization, pk=pk)
-    membership = get_object_or_404(OrganizationMembership, user=request.user, organization=organization)
+    organization = request.organization
+    membership = request.membership
     
     if membership.role not in ['owner', 'admin']:
         messages.error(request, 'You do not have permission to edit this organization.')
@@ -67,14 +73,15 @@ def organization_edit(request, pk):
 
 
 @login_required
+@organization_member()
 def organization_org_chart(request, pk):
-    organization = get_object_or_404(Organization, pk=pk)
-    membership = get_object_or_404(OrganizationMembership, user=request.user, organization=organization)
+    organization = request.organization
+    membership = request.membership
     
     def build_hierarchy(memberships):
         hierarchy = {}
         for membership in memberships:
-            if membership.reports_to is None:
+            if membership.reports_to_id is None:
                 if 'top_level' not in hierarchy:
                     hierarchy['top_level'] = []
                 hierarchy['top_level'].append({
@@ -82,7 +89,7 @@ def organization_org_chart(request, pk):
                     'children': []
                 })
             else:
-                parent_id = membership.reports_to.id
+                parent_id = membership.reports_to_id
                 if parent_id not in hierarchy:
                     hierarchy[parent_id] = []
                 hierarchy[parent_id].append({
@@ -103,11 +110,45 @@ def organization_org_chart(request, pk):
         
         return top_level
     
-    all_memberships = OrganizationMembership.objects.filter(organization=organization).select_related('user', 'reports_to')
-    org_chart = build_hierarchy(all_memberships)
+    # Only the top levels are rendered up front, deeper subtrees are loaded on demand
+    initial_depth = settings.ORG_CHART_INITIAL_DEPTH
+    visible_memberships = with_report_counts(
+        OrganizationMembership.objects.filter(organization=organization).exclude(
+            ancestor_lines__depth__gte=initial_depth
+        )
+    ).select_related('user', 'reports_to__user').order_by('id')
+    org_chart = build_hierarchy(visible_memberships)
     
     return render(request, 'organizations/org_chart.html', {
         'organization': organization,
         'org_chart': org_chart,
         'membership': membership
     })
+
+
+@login_required
+@organization_member()
+def organization_org_chart_reports(request, pk, member_pk):
+    """Direct reports of one member with their own report counts, for expanding the org chart"""
+    organization = request.organization
+    
+    reports = with_report_counts(
+        OrganizationMembership.objects.filter(organization=organization, reports_to_id=member_pk)
+    ).select_related('user').order_by('id')
+    
+    return JsonResponse({
+        'manager': member_pk,
+        'reports': [
+            {
+                'id': report.id,
+                'name': report.user.get_full_name() or report.user.username,
+                'email': report.user.email,
+                'title': report.title,
+                'role': report.role,
+                'role_display': report.get_role_display(),
+                'direct_count': report.direct_count,
+                'headcount': report.headcount,
+            }
+            for report in reports
+        ],
+    })
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Count
 from .models import Survey, Theme, Question, SurveyResponse, Answer
 
 
@@ -29,6 +30,7 @@ class SurveyAdmin(admin.ModelAdmin):
 @admin.register(Theme)
 class ThemeAdmin(admin.ModelAdmin):
     list_display = ['name', 'survey', 'order']
+    list_select_related = ['survey__organization']
     list_filter = ['survey__organization']
     search_fields = ['name', 'survey__title']
     inlines = [QuestionInline]
@@ -37,6 +39,7 @@ class ThemeAdmin(admin.ModelAdmin):
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
     list_display = ['text_preview', 'theme', 'order']
+    list_select_related = ['theme__survey__organization']
     list_filter = ['theme__survey__organization']
     search_fields = ['text', 'theme__name']
     
@@ -48,19 +51,25 @@ class QuestionAdmin(admin.ModelAdmin):
 @admin.register(SurveyResponse)
 class SurveyResponseAdmin(admin.ModelAdmin):
     list_display = ['user', 'organization', 'created_at', 'completed_at', 'answer_count']
+    list_select_related = ['user', 'organization']
     list_filter = ['organization', 'created_at', 'completed_at']
     search_fields = ['user__email', 'organization__name']
     readonly_fields = ['created_at', 'completed_at']
     inlines = [AnswerInline]
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(answer_total=Count('answers'))
+    
     def answer_count(self, obj):
-        return obj.answers.count()
+        return obj.answer_total
     answer_count.short_description = 'Answers'
+    answer_count.admin_order_field = 'answer_total'
 
 
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
     list_display = ['response_user', 'organization', 'question_preview', 'rating', 'created_at']
+    list_select_related = ['response__user', 'response__organization', 'question']
     list_filter = ['rating', 'response__organization', 'response__created_at']
     search_fields = ['response__user__email', 'question__text']
     
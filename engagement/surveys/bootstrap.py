@@ -0,0 +1,63 @@
+"""Bootstrap confidence intervals for averages, resampled from rating histograms.
+
+Resampling n answers with replacement from a histogram is one multinomial draw
+over its ten ratings, so every average on a page is resampled at once as a
+(resamples x histograms x ratings) array. Identical histograms are resampled
+once, and averages whose answers all agree need no resampling.
+"""
+from django.conf import settings
+from . import histograms
+from .numeric import np
+
+# Fewer resamples than this give unstable percentiles, the remaining averages get no interval
+MIN_RESAMPLES = 100
+
+
+def confidence_intervals(histogram_list, confidence=0.95, resamples=None, seed=None, max_draws=None):
+    """Return a (low, high) interval of the mean for each histogram, or None where there is none.
+
+    Averages with fewer than two answers never get an interval, and neither does
+    anything without NumPy.
+    """
+    resamples = resamples or getattr(settings, 'SURVEY_BOOTSTRAP_RESAMPLES', 1000)
+    seed = getattr(settings, 'SURVEY_BOOTSTRAP_SEED', 0) if seed is None else seed
+    max_draws = max_draws or getattr(settings, 'SURVEY_BOOTSTRAP_MAX_DRAWS', 50000)
+
+    intervals = {}
+    sampled = set()
+    for histogram in histogram_list:
+        histogram = tuple(histogram)
+        if histograms.count(histogram) < 2 or histogram in intervals:
+            continue
+        if sum(1 for slot in histogram if slot) == 1:
+            mean = histograms.mean(histogram)
+            intervals[histogram] = (mean, mean)
+        else:
+            intervals[histogram] = None
+            sampled.add(histogram)
+
+    if sampled and np is not None:
+        # Sorted so that the same histograms always get the same draws; with too many
+        # to resample, the ones with fewest answers (the noisiest) come first
+        sampled = sorted(sampled, key=lambda histogram: (histograms.count(histogram), histogram))
+        resamples = min(resamples, max_draws // len(sampled))
+        if resamples < MIN_RESAMPLES:
+            resamples = MIN_RESAMPLES
+            sampled = sampled[:max_draws // MIN_RESAMPLES]
+        if sampled:
+            bounds = _resample(sampled, confidence, resamples, seed)
+            intervals.update(zip(sampled, bounds))
+
+    return [intervals.get(tuple(histogram)) for histogram in histogram_list]
+
+
+def _resample(histogram_list, confidence, resamples, seed):
+    counts = np.array(histogram_list, dtype=np.int64)
+    answers = counts.sum(axis=1)
+    draws = np.random.default_rng(seed).multinomial(
+        answers, counts / answers[:, None], size=(resamples, len(histogram_list))
+    )
+    means = draws @ np.array(histograms.RATINGS, dtype=np.float64) / answers
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(means, [tail, 100 - tail], axis=0)
+    return list(zip(low.tolist(), high.tolist()))
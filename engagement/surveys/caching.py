@@ -0,0 +1,89 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from organizations.decorators import get_context_version
+
+
+RESULTS_VERSION_KEY = 'surveys:results-version:{organization_id}'
+RESULTS_KEY = 'surveys:results:{organization_id}:{version}:{engine}:{week}'
+CORRELATIONS_KEY = 'surveys:correlations:{organization_id}:{version}'
+HEATMAP_KEY = 'surveys:heatmap:{organization_id}:{version}:{hierarchy}:{level}'
+TEAM_RESULTS_KEY = 'surveys:team-results:{organization_id}:{version}:{hierarchy}:{engine}:{manager_id}:{week}'
+
+
+def get_results_version(organization_id):
+    """Return the current results version of an organization, starting one if there is none"""
+    return cache.get_or_set(RESULTS_VERSION_KEY.format(organization_id=organization_id), time.time_ns, timeout=None)
+
+
+def bump_results_version(organization_id):
+    """Invalidate every cached result of an organization once the current transaction commits.
+
+    Bumping before the commit would let a concurrent request cache results that
+    miss the new rows under the new version. Versions are timestamps rather than
+    counters so that a version evicted from the cache is never re-issued.
+    """
+    key = RESULTS_VERSION_KEY.format(organization_id=organization_id)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), timeout=None))
+
+
+def get_cached_results(organization, weekly_ranges, compute):
+    """Return the results for the current version, calling ``compute()`` on a miss"""
+    key = RESULTS_KEY.format(
+        organization_id=organization.pk,
+        version=get_results_version(organization.pk),
+        engine=getattr(settings, 'SURVEY_RESULTS_ENGINE', 'rollup'),
+        week=weekly_ranges[-1]['start'].isoformat(),
+    )
+    results = cache.get(key)
+    if results is None:
+        results = compute()
+        cache.set(key, results, timeout=getattr(settings, 'SURVEY_RESULTS_CACHE_TIMEOUT', 60 * 60))
+    return results
+
+
+def get_cached_team_results(manager, weekly_ranges, compute):
+    """Return the team results of a manager, calling ``compute()`` on a miss.
+
+    Besides new answers, changes to the reporting lines of the organization
+    change who is on the team and invalidate the entry.
+    """
+    key = TEAM_RESULTS_KEY.format(
+        organization_id=manager.organization_id,
+        version=get_results_version(manager.organization_id),
+        hierarchy=get_context_version(manager.organization_id),
+        engine=getattr(settings, 'SURVEY_RESULTS_ENGINE', 'rollup'),
+        manager_id=manager.pk,
+        week=weekly_ranges[-1]['start'].isoformat(),
+    )
+    results = cache.get(key)
+    if results is None:
+        results = compute()
+        cache.set(key, results, timeout=getattr(settings, 'SURVEY_RESULTS_CACHE_TIMEOUT', 60 * 60))
+    return results
+
+
+def get_cached_heatmap(organization, level, compute):
+    """Return the manager x theme heatmap of an organization at ``level``, calling ``compute()`` on a miss"""
+    key = HEATMAP_KEY.format(
+        organization_id=organization.pk,
+        version=get_results_version(organization.pk),
+        hierarchy=get_context_version(organization.pk),
+        level=level,
+    )
+    heatmap = cache.get(key)
+    if heatmap is None:
+        heatmap = compute()
+        cache.set(key, heatmap, timeout=getattr(settings, 'SURVEY_RESULTS_CACHE_TIMEOUT', 60 * 60))
+    return heatmap
+
+
+def get_cached_correlations(organization, compute):
+    """Return the question correlations of an organization, calling ``compute()`` on a miss"""
+    key = CORRELATIONS_KEY.format(organization_id=organization.pk, version=get_results_version(organization.pk))
+    correlations = cache.get(key)
+    if correlations is None:
+        correlations = compute()
+        cache.set(key, correlations, timeout=getattr(settings, 'SURVEY_RESULTS_CACHE_TIMEOUT', 60 * 60))
+    return correlations
@@ -0,0 +1,92 @@
+"""Per-process cache of each organization's survey catalog for the take-survey path.
+
+Catalogs live in a module-level dict, so a warm worker renders the survey form
+without catalog queries. A version stamp in the default Django cache, bumped by
+organizations, surveys, themes and questions on save and delete, tells every
+worker when its copy is stale. That only works when the cache is shared between
+processes (see CACHES in settings, ``check --deploy`` warns otherwise), and a
+bump lands just after its transaction commits, so answers are accepted only
+after ``survey_is_active`` has rechecked the survey in the database.
+"""
+import time
+from collections import namedtuple
+from django.core.cache import cache
+from django.db import transaction
+from .models import Survey, Theme, Question
+
+
+CATALOG_VERSION_KEY = 'surveys:catalog-version:{organization_id}'
+
+CatalogSurvey = namedtuple('CatalogSurvey', ['id', 'title', 'description', 'is_active'])
+CatalogTheme = namedtuple('CatalogTheme', ['id', 'name', 'description', 'order'])
+CatalogQuestion = namedtuple('CatalogQuestion', ['id', 'text', 'order', 'theme_id', 'theme'])
+
+
+class SurveyCatalog:
+    def __init__(self, survey, themes, questions, questions_per_cycle):
+        self.survey = survey
+        self.themes = themes
+        self.questions = {question.id: question for question in questions}
+        self.question_ids = [question.id for question in questions]
+        self.questions_per_cycle = questions_per_cycle
+
+    def get_questions(self, question_ids):
+        """Return the catalog questions for ``question_ids`` in that order, skipping deleted ones"""
+        return [self.questions[question_id] for question_id in question_ids if question_id in self.questions]
+
+
+_catalogs = {}
+
+
+def get_catalog(organization):
+    """Return the survey catalog of an organization, or None if it has no survey"""
+    version = cache.get_or_set(
+        CATALOG_VERSION_KEY.format(organization_id=organization.pk), time.time_ns, timeout=None
+    )
+    cached = _catalogs.get(organization.pk)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    catalog = load_catalog(organization)
+    _catalogs[organization.pk] = (version, catalog)
+    return catalog
+
+
+def survey_is_active(organization, catalog):
+    """Recheck in the database that the survey of ``catalog`` still accepts answers.
+
+    A copy that still shows a deactivated survey is dropped, so the next request reloads it.
+    """
+    if Survey.objects.filter(pk=catalog.survey.id, is_active=True).exists():
+        return True
+    _catalogs.pop(organization.pk, None)
+    return False
+
+
+def load_catalog(organization):
+    survey = Survey.objects.filter(organization=organization).values_list(
+        'id', 'title', 'description', 'is_active'
+    ).first()
+    if survey is None:
+        return None
+    survey = CatalogSurvey(*survey)
+
+    themes = {
+        theme_id: CatalogTheme(theme_id, name, description, order)
+        for theme_id, name, description, order in Theme.objects.filter(survey_id=survey.id).values_list(
+            'id', 'name', 'description', 'order'
+        )
+    }
+    questions = [
+        CatalogQuestion(question_id, text, order, theme_id, themes[theme_id])
+        for question_id, text, order, theme_id in Question.objects.filter(theme__survey_id=survey.id).values_list(
+            'id', 'text', 'order', 'theme_id'
+        )
+    ]
+    return SurveyCatalog(survey, list(themes.values()), questions, organization.questions_per_cycle)
+
+
+def bump_catalog_version(organization_id):
+    """Mark the catalog of an organization stale in every process once the transaction commits"""
+    key = CATALOG_VERSION_KEY.format(organization_id=organization_id)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), timeout=None))
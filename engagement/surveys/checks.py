@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Cache invalidations only reach other processes through a shared cache"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if not backend.endswith('.LocMemCache'):
+        return []
+    return [Warning(
+        'The default cache is private to each process.',
+        hint=(
+            'Survey results, catalogs and memberships are invalidated through the default cache, '
+            "so other web workers and management commands would not see each other's changes. "
+            'Use a shared backend such as FileBasedCache, Redis or Memcached.'
+        ),
+        id='surveys.W001',
+    )]
@@ -0,0 +1,140 @@
+"""Correlations between the questions of a survey, to find questions that move together.
+
+Each respondent only answers the questions drawn for their cycles, so the
+respondent x question matrix of (average) ratings is sparse. Correlations are
+pairwise-complete: the correlation of two questions uses only the respondents
+who answered both, and every pair reports how many there were. All pairs come
+out of four matrix products of the rating and answered-or-not matrices, sparse
+with SciPy, dense with NumPy alone and plain loops without either.
+"""
+import math
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import Count, Sum
+from .analytics import completed_answers
+from .numeric import np, wants_numpy
+
+try:
+    from scipy import sparse
+except ImportError:  # SciPy is optional, NumPy multiplies dense matrices instead
+    sparse = None
+
+
+def load_ratings(organization):
+    """Return (user_id, question_id, average rating) for every respondent and question they answered"""
+    rows = completed_answers(organization).values_list('response__user_id', 'question_id').annotate(
+        total=Sum('rating'),
+        count=Count('id')
+    ).order_by()
+    return [(user_id, question_id, total / count) for user_id, question_id, total, count in rows.iterator()]
+
+
+def pairwise_sums(ratings, question_ids, use_numpy=None):
+    """Return the pairwise-complete sums (n, sx, sxx, sxy) as question x question lists of lists.
+
+    For questions i and j, over the respondents who answered both: ``n[i][j]`` is
+    their number, ``sx[i][j]`` the sum of their ratings of i, ``sxx[i][j]`` the
+    sum of squares of those ratings and ``sxy[i][j]`` the sum of products.
+    """
+    if wants_numpy(use_numpy):
+        return _sums_numpy(ratings, question_ids)
+    return _sums_python(ratings, question_ids)
+
+
+def _sums_numpy(ratings, question_ids):
+    columns = {question_id: column for column, question_id in enumerate(question_ids)}
+    ratings = [row for row in ratings if row[1] in columns]
+    users = {}
+    rows = np.fromiter((users.setdefault(user_id, len(users)) for user_id, _, _ in ratings), dtype=np.int64)
+    cols = np.fromiter((columns[question_id] for _, question_id, _ in ratings), dtype=np.int64)
+    values = np.fromiter((value for _, _, value in ratings), dtype=np.float64)
+    shape = (len(users), len(question_ids))
+
+    if sparse is not None:
+        x = sparse.csr_matrix((values, (rows, cols)), shape=shape)
+        answered = sparse.csr_matrix((np.ones_like(values), (rows, cols)), shape=shape)
+        squares = x.multiply(x)
+
+        def product(left, right):
+            return (left.T @ right).toarray()
+    else:
+        x = np.zeros(shape)
+        x[rows, cols] = values
+        answered = np.zeros(shape)
+        answered[rows, cols] = 1
+        squares = x * x
+
+        def product(left, right):
+            return left.T @ right
+
+    return (
+        product(answered, answered).tolist(),
+        product(x, answered).tolist(),
+        product(squares, answered).tolist(),
+        product(x, x).tolist(),
+    )
+
+
+def _sums_python(ratings, question_ids):
+    columns = {question_id: column for column, question_id in enumerate(question_ids)}
+    by_user = defaultdict(list)
+    for user_id, question_id, value in ratings:
+        if question_id in columns:
+            by_user[user_id].append((columns[question_id], value))
+
+    size = len(question_ids)
+    n, sx, sxx, sxy = ([[0.0] * size for _ in range(size)] for _ in range(4))
+    for answers in by_user.values():
+        for i, x in answers:
+            for j, y in answers:
+                n[i][j] += 1
+                sx[i][j] += x
+                sxx[i][j] += x * x
+                sxy[i][j] += x * y
+    return n, sx, sxx, sxy
+
+
+def correlation(n, sx, sy, sxx, syy, sxy):
+    """Pearson correlation from pairwise sums, or None when either question has no spread"""
+    spread = (n * sxx - sx * sx) * (n * syy - sy * sy)
+    if n < 2 or spread <= 0:
+        return None
+    return max(-1.0, min(1.0, (n * sxy - sx * sy) / math.sqrt(spread)))
+
+
+def compute_correlations(organization, survey, use_numpy=None):
+    """Return the questions of ``survey``, their correlation matrix and the most correlated pairs.
+
+    Pairs answered by fewer than SURVEY_CORRELATION_MIN_RESPONDENTS respondents
+    are left out.
+    """
+    min_respondents = getattr(settings, 'SURVEY_CORRELATION_MIN_RESPONDENTS', 30)
+    questions = [
+        question
+        for theme in survey.themes.prefetch_related('questions').order_by('order', 'id')
+        for question in sorted(theme.questions.all(), key=lambda question: (question.order, question.id))
+    ]
+    ratings = load_ratings(organization)
+    n, sx, sxx, sxy = pairwise_sums(ratings, [question.id for question in questions], use_numpy=use_numpy)
+
+    matrix = []
+    pairs = []
+    for i, question in enumerate(questions):
+        cells = []
+        for j in range(len(questions)):
+            value = None
+            if n[i][j] >= min_respondents:
+                value = correlation(n[i][j], sx[i][j], sx[j][i], sxx[i][j], sxx[j][i], sxy[i][j])
+            cells.append({'r': round(value, 2) if value is not None else None, 'n': int(n[i][j])})
+            if j > i and value is not None:
+                pairs.append({'first': question, 'second': questions[j], 'r': round(value, 2), 'n': int(n[i][j])})
+        matrix.append({'question': question, 'cells': cells})
+
+    pairs.sort(key=lambda pair: (-abs(pair['r']), pair['first'].id, pair['second'].id))
+    return {
+        'questions': questions,
+        'matrix': matrix,
+        'pairs': pairs,
+        'respondents': len({user_id for user_id, _, _ in ratings}),
+        'min_respondents': min_respondents,
+    }
@@ -0,0 +1,83 @@
+"""Streaming export of individual survey answers as CSV or NDJSON.
+
+Answers are read with ``values_list().iterator()`` and written one line at a
+time, so memory stays flat however many answers there are. Theme and question
+names come from the in-memory survey catalog instead of being joined per row.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from .catalog import get_catalog
+from .models import Answer
+
+
+FIELDS = ['response_id', 'completed_at', 'theme_id', 'theme', 'question_id', 'question', 'rating']
+
+
+def export_rows(organization, start=None, end=None, theme_id=None, chunk_size=2000):
+    """Yield one tuple of FIELDS per answer of completed responses, optionally filtered.
+
+    ``start`` and ``end`` are inclusive dates in the current time zone.
+    """
+    catalog = get_catalog(organization)
+    if catalog is None:
+        return
+
+    answers = Answer.objects.filter(
+        response__organization=organization,
+        response__completed_at__isnull=False
+    )
+    if start is not None:
+        answers = answers.filter(response__completed_at__gte=start_of_day(start))
+    if end is not None:
+        answers = answers.filter(response__completed_at__lt=start_of_day(end + timedelta(days=1)))
+    if theme_id is not None:
+        answers = answers.filter(question__theme_id=theme_id)
+
+    rows = answers.order_by('id').values_list(
+        'response_id', 'response__completed_at', 'question_id', 'rating'
+    ).iterator(chunk_size=chunk_size)
+    for response_id, completed_at, question_id, rating in rows:
+        question = catalog.questions.get(question_id)
+        if question is None:
+            # Added after the export started
+            continue
+        yield (
+            response_id,
+            timezone.localtime(completed_at).isoformat(),
+            question.theme_id,
+            question.theme.name,
+            question_id,
+            question.text,
+            rating,
+        )
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class _Echo:
+    """File-like object that hands back what csv.writer writes to it"""
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(FIELDS, row))) + '\n'
+
+
+# format: (line generator, content type)
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
@@ -34,7 +34,11 @@ class QuestionForm(forms.ModelForm):
         }
 
 
+RATING_FIELD_CHOICES = [('', 'Select rating')] + [(i, str(i)) for i in range(1, 11)]
+
+
 class SurveyResponseForm(forms.Form):
+    """One optional rating field per question; ``questions`` may be Question objects or catalog questions"""
     def __init__(self, *args, **kwargs):
         questions = kwargs.pop('questions', [])
         super().__init__(*args, **kwargs)
@@ -43,7 +47,42 @@ class SurveyResponseForm(forms.Form):
             field_name = f'question_{question.id}'
             self.fields[field_name] = forms.ChoiceField(
                 label=question.text,
-                choices=[('', 'Select rating')] + [(i, str(i)) for i in range(1, 11)],
+                choices=RATING_FIELD_CHOICES,
                 required=False,
                 widget=forms.Select(attrs={'class': 'form-select'})
-            )
\ No newline at end of file
+            )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if not any(cleaned_data.get(field_name) for field_name in self.fields):
+            raise forms.ValidationError('Please answer at least one question.')
+        return cleaned_data
+
+
+class AnswerExportForm(forms.Form):
+    """Format and filters of a survey answer export; ``themes`` are the catalog themes to offer"""
+    format = forms.ChoiceField(
+        choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')],
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    theme = forms.TypedChoiceField(
+        coerce=int,
+        required=False,
+        empty_value=None,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    
+    def __init__(self, *args, **kwargs):
+        themes = kwargs.pop('themes', [])
+        super().__init__(*args, **kwargs)
+        self.fields['theme'].choices = [('', 'All themes')] + [(theme.id, theme.name) for theme in themes]
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError('The start date must not be after the end date.')
+        return cleaned_data
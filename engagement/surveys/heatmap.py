@@ -0,0 +1,176 @@
+"""Average theme score per manager at one level of the org-chart.
+
+Every answer of the organization is read once as ``(user_id, theme_id, rating)``.
+Each respondent is mapped to their manager at the chosen level through an
+ancestor array built from ``reports_to``, and every (manager, theme) cell is
+summed and counted in one grouped pass, with NumPy when it is installed.
+Level 0 is the top of the org-chart, so level 1 are the first-level managers.
+A manager's cell covers everyone below them at any depth, not the manager.
+"""
+from collections import defaultdict
+from django.conf import settings
+from organizations.models import OrganizationMembership
+from .analytics import completed_answers
+from .numeric import np, wants_numpy
+
+HEATMAP_COLUMNS = [('user_id', 'i8'), ('theme_id', 'i8'), ('rating', 'u1')]
+
+
+def ancestors_at_level(parents, level):
+    """Map each member below ``level`` to their ancestor at ``level``.
+
+    ``parents`` is a {member_id: reports_to_id} mapping. Members whose manager is
+    outside the mapping count as the top of the org-chart, and a reporting
+    cycle is cut where it is found.
+    """
+    levels = {}
+    ancestors = {}
+    for start_id in parents:
+        # Walk up to the first member already placed, or to the top
+        chain = []
+        walked = set()
+        current = start_id
+        while current not in levels:
+            chain.append(current)
+            walked.add(current)
+            parent_id = parents[current]
+            if parent_id is None or parent_id not in parents or parent_id in walked:
+                break
+            current = parent_id
+
+        if current in levels:
+            parent_level, parent_ancestor = levels[current], ancestors.get(current)
+        else:
+            parent_level, parent_ancestor = -1, None
+        for member_id in reversed(chain):
+            levels[member_id] = parent_level = parent_level + 1
+            if parent_level == level:
+                parent_ancestor = member_id
+            if parent_level >= level:
+                ancestors[member_id] = parent_ancestor
+
+    return {member_id: ancestor_id for member_id, ancestor_id in ancestors.items() if member_id != ancestor_id}
+
+
+def load_answers(organization, chunk_size=20000, use_numpy=None):
+    """Stream (user_id, theme_id, rating) of every completed answer, as a structured array with NumPy"""
+    rows = completed_answers(organization).values_list(
+        'response__user_id', 'question__theme_id', 'rating'
+    ).order_by().iterator(chunk_size=chunk_size)
+    if wants_numpy(use_numpy):
+        return np.fromiter(rows, dtype=np.dtype(HEATMAP_COLUMNS))
+    return list(rows)
+
+
+def compute_heatmap(organization, survey, level=1, use_numpy=None):
+    """Return the themes of ``survey`` and one row of theme cells per manager at ``level``.
+
+    Cells with fewer than TEAM_RESULTS_MIN_RESPONDENTS respondents are withheld,
+    as on the team results page.
+    """
+    memberships = OrganizationMembership.objects.filter(organization=organization).values_list(
+        'id', 'user_id', 'reports_to_id'
+    )
+    parents = {}
+    members_by_user = {}
+    for member_id, user_id, reports_to_id in memberships:
+        parents[member_id] = reports_to_id
+        members_by_user[user_id] = member_id
+    ancestors = ancestors_at_level(parents, level)
+
+    themes = list(survey.themes.order_by('order', 'id'))
+    manager_ids = sorted(set(ancestors.values()))
+    manager_of_user = {
+        user_id: ancestors[member_id] for user_id, member_id in members_by_user.items() if member_id in ancestors
+    }
+    headcounts = defaultdict(int)
+    for manager_id in ancestors.values():
+        headcounts[manager_id] += 1
+
+    answers = load_answers(organization, use_numpy=use_numpy)
+    if np is not None and isinstance(answers, np.ndarray):
+        cells = _group_numpy(answers, manager_of_user, manager_ids, themes)
+    else:
+        cells = _group_python(answers, manager_of_user, manager_ids, themes)
+
+    min_respondents = getattr(settings, 'TEAM_RESULTS_MIN_RESPONDENTS', 3)
+    managers = OrganizationMembership.objects.select_related('user').in_bulk(manager_ids)
+    rows = []
+    for row, manager_id in enumerate(manager_ids):
+        manager = managers[manager_id]
+        row_cells = []
+        for column in range(len(themes)):
+            total, count, respondents = cells[row][column]
+            withheld = 0 < respondents < min_respondents
+            row_cells.append({
+                'average': round(total / count, 1) if count and not withheld else None,
+                'count': count,
+                'respondents': respondents,
+                'withheld': withheld,
+            })
+        rows.append({
+            'manager': manager,
+            'manager_name': manager.user.get_full_name() or manager.user.username,
+            'headcount': headcounts[manager_id],
+            'cells': row_cells,
+        })
+    rows.sort(key=lambda row: (row['manager_name'].lower(), row['manager'].pk))
+    return {'level': level, 'themes': themes, 'rows': rows, 'min_respondents': min_respondents}
+
+
+def _group_numpy(answers, manager_of_user, manager_ids, themes):
+    # Sorted lookup arrays: user id -> manager row, theme id -> column
+    users = np.array(sorted(manager_of_user), dtype=np.int64)
+    rows_of_managers = {manager_id: row for row, manager_id in enumerate(manager_ids)}
+    user_rows = np.array([rows_of_managers[manager_of_user[user_id]] for user_id in users.tolist()], dtype=np.int64)
+    theme_ids = np.array(sorted(theme.pk for theme in themes), dtype=np.int64)
+    columns_of_themes = {theme.pk: column for column, theme in enumerate(themes)}
+    theme_columns = np.array([columns_of_themes[theme_id] for theme_id in theme_ids.tolist()], dtype=np.int64)
+    row_count, column_count = len(manager_ids), len(themes)
+    cells = [[(0, 0, 0)] * column_count for _ in range(row_count)]
+    if not len(users) or not len(theme_ids) or not len(answers):
+        return cells
+
+    user_positions = np.minimum(np.searchsorted(users, answers['user_id']), len(users) - 1)
+    theme_positions = np.minimum(np.searchsorted(theme_ids, answers['theme_id']), len(theme_ids) - 1)
+    keep = (users[user_positions] == answers['user_id']) & (theme_ids[theme_positions] == answers['theme_id'])
+    user_positions = user_positions[keep]
+    keys = user_rows[user_positions] * column_count + theme_columns[theme_positions[keep]]
+    ratings = answers['rating'][keep].astype(np.int64)
+
+    size = row_count * column_count
+    totals = np.bincount(keys, weights=ratings, minlength=size).astype(np.int64)
+    counts = np.bincount(keys, minlength=size)
+    # Distinct respondents per cell, from the distinct (cell, respondent) pairs
+    pairs = np.unique(keys * len(users) + user_positions)
+    respondents = np.bincount(pairs // len(users), minlength=size)
+
+    for key, total, count, respondent_count in zip(
+        np.flatnonzero(counts).tolist(),
+        totals[counts > 0].tolist(),
+        counts[counts > 0].tolist(),
+        respondents[counts > 0].tolist()
+    ):
+        cells[key // column_count][key % column_count] = (total, count, respondent_count)
+    return cells
+
+
+def _group_python(answers, manager_of_user, manager_ids, themes):
+    rows_of_managers = {manager_id: row for row, manager_id in enumerate(manager_ids)}
+    columns_of_themes = {theme.pk: column for column, theme in enumerate(themes)}
+    totals = defaultdict(lambda: [0, 0])
+    respondents = defaultdict(set)
+    for user_id, theme_id, rating in answers:
+        manager_id = manager_of_user.get(user_id)
+        column = columns_of_themes.get(theme_id)
+        if manager_id is None or column is None:
+            continue
+        key = (rows_of_managers[manager_id], column)
+        totals[key][0] += rating
+        totals[key][1] += 1
+        respondents[key].add(user_id)
+
+    cells = [[(0, 0, 0)] * len(themes) for _ in manager_ids]
+    for (row, column), (total, count) in totals.items():
+        cells[row][column] = (total, count, len(respondents[(row, column)]))
+    return cells
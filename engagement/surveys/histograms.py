@@ -0,0 +1,90 @@
+"""Rating histograms: how many answers gave each rating from 1 to 10.
+
+A histogram is a tuple of ten counts, slot 0 for rating 1. Histograms of any
+question, theme, team or week merge by adding them slot by slot, and every
+statistic on the results page is computed from them rather than from the raw
+ratings.
+"""
+from itertools import accumulate
+
+RATINGS = range(1, 11)
+FIELDS = [f'rating_{rating}' for rating in RATINGS]
+EMPTY = (0,) * len(RATINGS)
+
+# eNPS-style buckets on the 1-10 scale
+PROMOTERS = range(9, 11)
+DETRACTORS = range(1, 7)
+
+
+def from_ratings(ratings):
+    counts = [0] * len(RATINGS)
+    for rating in ratings:
+        counts[rating - 1] += 1
+    return tuple(counts)
+
+
+def merge(*histograms):
+    return tuple(map(sum, zip(EMPTY, *histograms)))
+
+
+def count(histogram):
+    return sum(histogram)
+
+
+def total(histogram):
+    return sum(rating * slot for rating, slot in zip(RATINGS, histogram))
+
+
+def mean(histogram):
+    answers = count(histogram)
+    return total(histogram) / answers if answers else None
+
+
+def percentile(histogram, q):
+    """The ``q``th percentile of the ratings, interpolated between neighbours like ``numpy.percentile``"""
+    answers = count(histogram)
+    if not answers:
+        return None
+    position = q / 100 * (answers - 1)
+    lower = int(position)
+    upper = min(lower + 1, answers - 1)
+    lower_rating = _rating_at(histogram, lower)
+    upper_rating = _rating_at(histogram, upper)
+    return lower_rating + (upper_rating - lower_rating) * (position - lower)
+
+
+def median(histogram):
+    return percentile(histogram, 50)
+
+
+def enps(histogram):
+    """Percentage of promoters (9-10) minus percentage of detractors (1-6), from -100 to 100"""
+    answers = count(histogram)
+    if not answers:
+        return None
+    promoters = sum(histogram[rating - 1] for rating in PROMOTERS)
+    detractors = sum(histogram[rating - 1] for rating in DETRACTORS)
+    return round(100 * (promoters - detractors) / answers)
+
+
+def distribution(histogram):
+    """Share of answers per rating in percent, and relative to the most common rating for charts"""
+    answers = count(histogram)
+    most = max(histogram)
+    return [
+        {
+            'rating': rating,
+            'count': slot,
+            'percent': round(100 * slot / answers, 1) if answers else 0,
+            'scaled': round(100 * slot / most) if most else 0,
+        }
+        for rating, slot in zip(RATINGS, histogram)
+    ]
+
+
+def _rating_at(histogram, index):
+    # Rating of the answer at ``index`` when all answers are sorted
+    for rating, reached in zip(RATINGS, accumulate(histogram)):
+        if index < reached:
+            return rating
+    raise IndexError(index)
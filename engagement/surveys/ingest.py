@@ -0,0 +1,111 @@
+"""Bulk import of survey responses collected offline, e.g. on kiosks that sync later.
+
+Records are JSON objects, one per line::
+
+    {"user": 12, "completed_at": "2025-03-03T09:15:00+01:00", "answers": [[4, 8], [7, 6]]}
+
+``user`` is the id or email address of a member of the organization and
+``answers`` holds (question_id, rating) pairs. Valid records become submissions
+in the format of the write-behind spool and are written by
+``submissions.write_submissions``.
+"""
+import json
+import time
+from itertools import islice
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from organizations.models import OrganizationMembership
+from .catalog import get_catalog
+from .submissions import write_submissions
+
+
+def read_records(organization, lines):
+    """Validate JSON lines against the organization, yielding (line_number, submission, error).
+
+    Exactly one of ``submission`` and ``error`` is set. Questions are checked
+    against the in-memory catalog and members against a map loaded once.
+    """
+    catalog = get_catalog(organization)
+    questions = catalog.questions if catalog is not None else {}
+    members = dict(
+        OrganizationMembership.objects.filter(organization=organization).values_list('user_id', 'user__email')
+    )
+    emails = {email.lower(): user_id for user_id, email in members.items() if email}
+    now = timezone.now()
+
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        if not line.strip():
+            continue
+        try:
+            submission = _parse_record(line, organization, members, emails, questions, now)
+        except ValueError as error:
+            yield line_number, None, str(error)
+        else:
+            yield line_number, submission, None
+
+
+def _parse_record(line, organization, members, emails, questions, now):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise ValueError('Not valid JSON')
+    if not isinstance(record, dict):
+        raise ValueError('Expected a JSON object')
+
+    user = record.get('user')
+    if isinstance(user, str):
+        user_id = emails.get(user.lower())
+    elif type(user) is int and user in members:
+        user_id = user
+    else:
+        user_id = None
+    if user_id is None:
+        raise ValueError(f'User {user!r} is not a member of this organization')
+
+    completed_at = parse_datetime(record['completed_at']) if isinstance(record.get('completed_at'), str) else None
+    if completed_at is None:
+        raise ValueError('completed_at must be an ISO 8601 date and time')
+    if timezone.is_naive(completed_at):
+        completed_at = timezone.make_aware(completed_at)
+    if completed_at > now:
+        raise ValueError('completed_at is in the future')
+
+    answers = record.get('answers')
+    if not isinstance(answers, list) or not answers:
+        raise ValueError('answers must be a non-empty list of [question_id, rating] pairs')
+    seen = set()
+    for answer in answers:
+        if not isinstance(answer, list) or len(answer) != 2:
+            raise ValueError('answers must be a non-empty list of [question_id, rating] pairs')
+        question_id, rating = answer
+        if type(question_id) is not int or question_id not in questions:
+            raise ValueError(f'Question {question_id!r} is not part of this survey')
+        if question_id in seen:
+            raise ValueError(f'Question {question_id} is answered more than once')
+        if type(rating) is not int or not 1 <= rating <= 10:
+            raise ValueError(f'Rating {rating!r} for question {question_id} must be a whole number from 1 to 10')
+        seen.add(question_id)
+
+    return {
+        'user_id': user_id,
+        'organization_id': organization.pk,
+        'completed_at': completed_at.isoformat(),
+        'answers': answers,
+    }
+
+
+def write_in_batches(submissions, batch_size=1000, insert_size=1000):
+    """Write submissions with one transaction per ``batch_size`` of them.
+
+    Yields (responses, answers, seconds) per transaction.
+    """
+    submissions = iter(submissions)
+    while True:
+        batch = list(islice(submissions, batch_size))
+        if not batch:
+            return
+        started = time.monotonic()
+        responses, answers = write_submissions(batch, insert_size=insert_size)
+        yield responses, answers, time.monotonic() - started
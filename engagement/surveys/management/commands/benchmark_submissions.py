@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import (
+    CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+from django.urls import reverse
+import time
+from engagement.testing import LOCAL_CACHES
+from organizations.models import Organization, OrganizationMembership
+from surveys.models import Survey, Theme, Question
+
+
+class Command(BaseCommand):
+    help = 'Measure take_survey submissions per second for several questions_per_cycle values'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--questions-per-cycle',
+            type=str,
+            default='5,20,50',
+            help='Comma-separated questions_per_cycle values to measure (default: 5,20,50)'
+        )
+        parser.add_argument(
+            '--submissions',
+            type=int,
+            default=200,
+            help='Number of submissions to time per value (default: 200)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['questions_per_cycle'].split(',')]
+        except ValueError:
+            raise CommandError('--questions-per-cycle must be a comma-separated list of numbers')
+        if not sizes or min(sizes) < 1:
+            raise CommandError('--questions-per-cycle values must be at least 1')
+        if options['submissions'] < 1:
+            raise CommandError('--submissions must be at least 1')
+
+        # Everything runs in a throwaway test database and a local cache, the configured ones are left alone.
+        # Submissions are always written directly: with write-behind they would go to the real spool.
+        setup_test_environment()
+        settings_override = override_settings(SURVEY_WRITE_BEHIND=False, CACHES=LOCAL_CACHES)
+        settings_override.enable()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            organization = Organization.objects.create(name='Submission benchmark')
+            survey = Survey.objects.create(organization=organization, title='Benchmark survey')
+            themes = Theme.objects.bulk_create(
+                Theme(survey=survey, name=f'Theme {number}', order=number) for number in range(1, 6)
+            )
+            Question.objects.bulk_create(
+                Question(theme=themes[number % len(themes)], text=f'Question {number}?', order=number)
+                for number in range(max(sizes))
+            )
+
+            self.stdout.write(f'{"questions":>9}  {"submissions/s":>13}  {"ms each":>8}  {"queries each":>12}')
+            for size in sizes:
+                organization.questions_per_cycle = size
+                organization.save()
+                user = User.objects.create_user(username=f'benchmark-{size}')
+                OrganizationMembership.objects.create(user=user, organization=organization, role='member')
+
+                client = Client()
+                client.force_login(user)
+                url = reverse('take_survey', args=[organization.pk])
+
+                # The GET warms the catalog and draws this cycle's questions
+                page = client.get(url)
+                data = {name: '7' for name in page.context['form'].fields}
+
+                # Counted straight away, Django clears the query log when the next request starts
+                with CaptureQueriesContext(connection) as queries:
+                    client.post(url, data)
+                query_count = len(queries)
+
+                start = time.perf_counter()
+                for _ in range(options['submissions']):
+                    client.post(url, data)
+                elapsed = time.perf_counter() - start
+
+                self.stdout.write(
+                    f'{size:>9}  {options["submissions"] / elapsed:>13.1f}  '
+                    f'{elapsed * 1000 / options["submissions"]:>8.2f}  {query_count:>12}'
+                )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            settings_override.disable()
+            teardown_test_environment()
@@ -0,0 +1,273 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import (
+    CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+from django.urls import reverse
+from io import StringIO
+import django
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from engagement.testing import LOCAL_CACHES
+from organizations.hierarchy import with_report_counts
+from organizations.models import Organization, OrganizationMembership
+from surveys import analytics, caching
+from surveys.models import Survey, Theme, Question, Answer, SurveyResponse
+
+SCALES = {
+    'small': {'members': 100, 'answers': 1000},
+    'medium': {'members': 10000, 'answers': 100000},
+    'large': {'members': 100000, 'answers': 1000000},
+}
+WEEKS = 12
+THEMES = 5
+QUESTIONS_PER_THEME = 4
+
+
+class Command(BaseCommand):
+    help = 'Time the hot views on generated data sets of several sizes and write the numbers as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales',
+            type=str,
+            default='small,medium',
+            help=f'Comma-separated data set sizes out of {", ".join(SCALES)} (default: small,medium)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Timed requests per view and scale (default: 20)'
+        )
+        parser.add_argument(
+            '--engines',
+            type=str,
+            help='Comma-separated results engines to time uncached survey_results with (default: the configured one)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Random seed for the generated data sets (default: 1)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Write the results as JSON to this file'
+        )
+        parser.add_argument(
+            '--compare',
+            type=str,
+            help='JSON file of an earlier run to compare the results with'
+        )
+
+    def handle(self, *args, **options):
+        scales = [scale.strip() for scale in options['scales'].split(',') if scale.strip()]
+        unknown = [scale for scale in scales if scale not in SCALES]
+        if unknown or not scales:
+            raise CommandError(f'--scales must be a comma-separated list out of {", ".join(SCALES)}')
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        engines = [getattr(settings, 'SURVEY_RESULTS_ENGINE', 'rollup')]
+        if options['engines']:
+            engines = [engine.strip() for engine in options['engines'].split(',') if engine.strip()]
+            if not engines or any(engine not in analytics.ENGINES for engine in engines):
+                raise CommandError(f'--engines must be a comma-separated list out of {", ".join(analytics.ENGINES)}')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Cannot read {options["compare"]}: {error}')
+
+        report = {
+            'meta': {
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'seed': options['seed'],
+            },
+            'results': {},
+        }
+
+        # Everything runs in a throwaway test database and a local cache, the configured ones are left alone
+        setup_test_environment()
+        local_caches = override_settings(CACHES=LOCAL_CACHES)
+        local_caches.enable()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            for scale in scales:
+                self.stdout.write(f'Building the {scale} data set...')
+                started = time.monotonic()
+                organization, owner, team, dataset = self.build_dataset(scale, options['seed'])
+                self.stdout.write(
+                    f'  {dataset["members"]} members, {dataset["responses"]} responses, '
+                    f'{dataset["answers"]} answers in {time.monotonic() - started:.1f}s'
+                )
+                views = self.run_views(organization, owner, team, engines, options['repeat'])
+                report['results'][scale] = {'dataset': dataset, 'views': views}
+                self.write_table(scale, views, baseline)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            local_caches.disable()
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def build_dataset(self, scale, seed):
+        """Generate an org-chart, a survey and its answers with the existing generators"""
+        size = SCALES[scale]
+        name = f'Benchmark {scale}'
+        call_command('generate_org_chart', employees=size['members'], org_name=name, seed=seed, stdout=StringIO())
+        organization = Organization.objects.get(name=name)
+
+        survey = Survey.objects.create(organization=organization, title='Benchmark survey')
+        themes = Theme.objects.bulk_create(
+            Theme(survey=survey, name=f'Theme {number}', order=number) for number in range(1, THEMES + 1)
+        )
+        Question.objects.bulk_create(
+            Question(theme=theme, text=f'{theme.name}, question {number}?', order=number)
+            for theme in themes
+            for number in range(1, QUESTIONS_PER_THEME + 1)
+        )
+
+        responses_per_week = max(1, round(size['answers'] / (organization.questions_per_cycle * WEEKS)))
+        call_command(
+            'generate_survey_data', organization.pk, bulk=True, weeks=WEEKS,
+            responses_per_week=responses_per_week, stdout=StringIO()
+        )
+
+        owner = OrganizationMembership.objects.filter(
+            organization=organization, role='owner', reports_to__isnull=True
+        ).select_related('user').first()
+        # The largest team right below the top of the org-chart
+        team = with_report_counts(
+            OrganizationMembership.objects.filter(reports_to=owner)
+        ).order_by('-headcount', 'id').first()
+        dataset = {
+            'members': OrganizationMembership.objects.filter(organization=organization).count(),
+            'team_members': team.headcount,
+            'responses': SurveyResponse.objects.filter(organization=organization).count(),
+            'answers': Answer.objects.filter(response__organization=organization).count(),
+        }
+        return organization, owner, team, dataset
+
+    def run_views(self, organization, owner, team, engines, repeat):
+        cache.clear()
+        client = Client()
+        client.force_login(owner.user)
+
+        def get(name, kwargs):
+            url = reverse(name, kwargs=kwargs)
+            return lambda: client.get(url)
+
+        def get_with_engine(engine):
+            url = reverse('survey_results', kwargs={'org_pk': organization.pk})
+
+            def request():
+                with override_settings(SURVEY_RESULTS_ENGINE=engine):
+                    return client.get(url)
+            return request
+
+        def uncached():
+            caching.bump_results_version(organization.pk)
+
+        take_url = reverse('take_survey', kwargs={'org_pk': organization.pk})
+        form = client.get(take_url).context['form']
+        answers = {name: '7' for name in form.fields}
+
+        # survey_results comes before take_survey POST, which invalidates the cached results
+        cases = [
+            ('organization_list', get('organization_list', {}), None, 200),
+            ('organization_org_chart', get('organization_org_chart', {'pk': organization.pk}), None, 200),
+            ('survey_results', get('survey_results', {'org_pk': organization.pk}), None, 200),
+        ]
+        for engine in engines:
+            cases.append((f'survey_results_uncached[{engine}]', get_with_engine(engine), uncached, 200))
+        cases += [
+            ('survey_correlations_uncached', get('survey_correlations', {'org_pk': organization.pk}), uncached, 200),
+            ('survey_heatmap_uncached', get('survey_heatmap', {'org_pk': organization.pk}), uncached, 200),
+            ('team_results_uncached', get('team_results', {'org_pk': organization.pk, 'member_pk': team.pk}), uncached, 200),
+            ('take_survey_get', lambda: client.get(take_url), None, 200),
+            ('take_survey_post', lambda: client.post(take_url, answers), None, 302),
+        ]
+
+        views = {}
+        for name, request, before, status in cases:
+            self.stdout.write(f'  {name}...')
+            views[name] = self.measure(request, before, status, repeat)
+        return views
+
+    def measure(self, request, before, status, repeat):
+        """Return median and p95 latency, query count and peak Python memory of one request"""
+        def run():
+            if before is not None:
+                before()
+            response = request()
+            if response.status_code != status:
+                raise CommandError(f'Expected status {status}, got {response.status_code}')
+            return response
+
+        # The first request fills the caches the timed ones rely on
+        run()
+
+        timings = []
+        for _ in range(repeat):
+            if before is not None:
+                before()
+            started = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        query_count = len(queries)
+
+        # Traced separately, tracemalloc slows down every allocation
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        return {
+            'median_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            'queries': query_count,
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def write_table(self, scale, views, baseline):
+        previous = (baseline or {}).get('results', {}).get(scale, {}).get('views', {})
+        header = f'{"view":<36} {"median ms":>10} {"p95 ms":>10} {"queries":>8} {"peak KiB":>10}'
+        if previous:
+            header += f' {"vs median":>10} {"vs queries":>10}'
+        self.stdout.write(f'\n{scale}\n{header}')
+        for name, numbers in views.items():
+            line = (
+                f'{name:<36} {numbers["median_ms"]:>10.2f} {numbers["p95_ms"]:>10.2f} '
+                f'{numbers["queries"]:>8} {numbers["peak_memory_kb"]:>10.1f}'
+            )
+            earlier = previous.get(name)
+            if earlier:
+                ratio = numbers['median_ms'] / earlier['median_ms'] if earlier['median_ms'] else 0
+                line += f' {ratio:>9.2f}x {numbers["queries"] - earlier["queries"]:>+10}'
+            self.stdout.write(line)
+        self.stdout.write('')
+
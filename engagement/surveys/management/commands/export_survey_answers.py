@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+from datetime import date
+import os
+import sys
+import time
+from organizations.models import Organization
+from surveys import export
+
+
+class Command(BaseCommand):
+    help = 'Export the individual survey answers of an organization as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'organization_id',
+            type=int,
+            help='ID of the organization to export'
+        )
+        parser.add_argument(
+            'path',
+            type=str,
+            help='File to write, or - for standard output'
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(export.FORMATS),
+            help='Output format (default: from the file extension, otherwise csv)'
+        )
+        parser.add_argument(
+            '--start',
+            type=date.fromisoformat,
+            help='Only answers completed on or after this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help='Only answers completed on or before this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--theme',
+            type=int,
+            help='Only answers to questions of this theme ID'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Answers fetched from the database at a time (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            organization = Organization.objects.get(id=options['organization_id'])
+        except Organization.DoesNotExist:
+            raise CommandError(f'Organization with ID {options["organization_id"]} does not exist')
+        if options['start'] and options['end'] and options['start'] > options['end']:
+            raise CommandError('--start must not be after --end')
+
+        export_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if export_format not in export.FORMATS:
+            export_format = 'csv'
+        lines, content_type = export.FORMATS[export_format]
+
+        rows = export.export_rows(
+            organization,
+            start=options['start'],
+            end=options['end'],
+            theme_id=options['theme'],
+            chunk_size=options['chunk_size']
+        )
+
+        started = time.monotonic()
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        if options['path'] == '-':
+            sys.stdout.writelines(lines(counted(rows)))
+            return
+
+        with open(options['path'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(lines(counted(rows)))
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {count} answers of "{organization.name}" to {options["path"]} '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
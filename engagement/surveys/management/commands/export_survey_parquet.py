@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+import time
+from organizations.models import Organization
+from surveys import snapshots
+
+
+class Command(BaseCommand):
+    help = 'Write columnar Parquet snapshots of survey answers, partitioned by ISO week'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'organization_ids',
+            nargs='*',
+            type=int,
+            help='IDs of the organizations to export (default: all organizations with a survey)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='snapshots',
+            help='Directory to write the snapshots to (default: snapshots)'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rewrite every week instead of only the weeks changed since the last snapshot'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50000,
+            help='Answers read from the database and written as one row group at a time (default: 50000)'
+        )
+
+    def handle(self, *args, **options):
+        if snapshots.pa is None:
+            raise CommandError('Parquet snapshots need pyarrow, install it with "pip install pyarrow"')
+
+        organizations = Organization.objects.filter(survey__isnull=False)
+        if options['organization_ids']:
+            organizations = Organization.objects.filter(id__in=options['organization_ids'])
+            missing = set(options['organization_ids']) - set(organizations.values_list('id', flat=True))
+            for organization_id in sorted(missing):
+                self.stdout.write(self.style.ERROR(f'Organization with ID {organization_id} does not exist'))
+
+        for organization in organizations.order_by('id'):
+            started = time.monotonic()
+            written, answers, unchanged, removed = snapshots.export_snapshot(
+                organization,
+                options['output'],
+                full=options['full'],
+                chunk_size=options['chunk_size']
+            )
+            self.stdout.write(
+                f'"{organization.name}": wrote {written} weeks ({answers} answers), '
+                f'{unchanged} unchanged, {removed} removed in {time.monotonic() - started:.1f}s'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Snapshots written to {options["output"]}'))
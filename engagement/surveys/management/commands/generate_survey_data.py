@@ -1,11 +1,54 @@
-from django.core.management.base import BaseCommand
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db import transaction
+from django.db import connection, connections, transaction
+import multiprocessing
 import random
+import time
 from datetime import datetime, timedelta
+from organizations import hierarchy
 from organizations.models import Organization, OrganizationMembership
 from surveys.models import Survey, Question, SurveyResponse, Answer
+from surveys import rollups
+
+
+TEST_PASSWORD = 'testpassword123'
+
+# Seconds a worker waits for another worker's write on SQLite before giving up
+SQLITE_BUSY_TIMEOUT = 600
+
+# Sample first and last names for variety
+FIRST_NAMES = [
+    'Alice', 'Bob', 'Charlie', 'Diana', 'Eve', 'Frank', 'Grace', 'Henry',
+    'Ivy', 'Jack', 'Kate', 'Liam', 'Maya', 'Noah', 'Olivia', 'Peter',
+    'Quinn', 'Rachel', 'Sam', 'Tara', 'Uma', 'Victor', 'Wendy', 'Xavier',
+    'Yara', 'Zoe', 'Alex', 'Blake', 'Casey', 'Drew'
+]
+
+LAST_NAMES = [
+    'Anderson', 'Brown', 'Clark', 'Davis', 'Evans', 'Garcia', 'Harris',
+    'Johnson', 'Jones', 'Lee', 'Martinez', 'Miller', 'Moore', 'Rodriguez',
+    'Smith', 'Taylor', 'Thomas', 'White', 'Williams', 'Wilson'
+]
+
+
+def generate_in_worker(organization_id, options):
+    """Generate data for one organization in a worker process"""
+    # Forked workers inherit the parent's random state, reseed so organizations differ
+    random.seed()
+    if connection.vendor == 'sqlite':
+        # SQLite has one writer at a time. Immediate transactions take the write lock
+        # when they begin, so workers queue for it with the busy timeout instead of
+        # failing with "database is locked" when a read turns into a write
+        connection.settings_dict['OPTIONS'] = {
+            **connection.settings_dict['OPTIONS'],
+            'timeout': SQLITE_BUSY_TIMEOUT,
+            'transaction_mode': 'IMMEDIATE',
+        }
+    call_command('generate_survey_data', organization_id, **options)
 
 
 class Command(BaseCommand):
@@ -14,9 +57,40 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument(
             'organization_id',
+            nargs='?',
             type=int,
             help='ID of the organization to generate data for'
         )
+        parser.add_argument(
+            '--orgs',
+            type=str,
+            help='Comma-separated IDs of several organizations to generate data for, e.g. 1,2,3'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help=(
+                'Number of worker processes for --orgs, one organization per process (default: 1). '
+                'On SQLite the workers take turns writing'
+            )
+        )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Write users, responses and answers with batched bulk inserts (for large data sets)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Answers per bulk insert and transaction in --bulk mode (default: 5000)'
+        )
+        parser.add_argument(
+            '--unusable-passwords',
+            action='store_true',
+            help='Give created users an unusable password instead of the shared test password'
+        )
         parser.add_argument(
             '--create-users',
             action='store_true',
@@ -47,12 +121,66 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
-        organization_id = options['organization_id']
+        organization_ids = []
+        if options['organization_id'] is not None:
+            organization_ids.append(options['organization_id'])
+        if options['orgs']:
+            try:
+                organization_ids.extend(int(value) for value in options['orgs'].split(',') if value.strip())
+            except ValueError:
+                raise CommandError(f'--orgs must be a comma-separated list of IDs, got "{options["orgs"]}"')
+        if not organization_ids:
+            raise CommandError('Give an organization ID or --orgs')
+        
+        if len(organization_ids) > 1 and options['workers'] > 1:
+            self.generate_in_parallel(organization_ids, options)
+        else:
+            for organization_id in organization_ids:
+                self.generate(organization_id, options)
+
+    def generate_in_parallel(self, organization_ids, options):
+        """Generate each organization in its own worker process"""
+        worker_options = {
+            key: options[key] for key in [
+                'create_users', 'users', 'weeks', 'responses_per_week', 'clear_responses',
+                'bulk', 'batch_size', 'unusable_passwords', 'verbosity',
+            ]
+        }
+        started = time.monotonic()
+        
+        # Workers are forked, they must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as pool:
+            futures = {
+                pool.submit(generate_in_worker, organization_id, worker_options): organization_id
+                for organization_id in organization_ids
+            }
+            failed = 0
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(
+                        self.style.ERROR(f'Organization {futures[future]} failed: {e}')
+                    )
+        
+        elapsed = time.monotonic() - started
+        if failed:
+            raise CommandError(f'{failed} of {len(organization_ids)} organizations failed')
+        self.stdout.write(
+            self.style.SUCCESS(f'Generated {len(organization_ids)} organizations in {elapsed:.1f}s')
+        )
+
+    def generate(self, organization_id, options):
         create_users = options['create_users']
         num_users = options['users']
         num_weeks = options['weeks']
         responses_per_week = options['responses_per_week']
         clear_responses = options['clear_responses']
+        bulk = options['bulk']
+        batch_size = options['batch_size']
 
         try:
             organization = Organization.objects.get(id=organization_id)
@@ -84,17 +212,47 @@ class Command(BaseCommand):
         self.stdout.write(f'Available questions: {len(questions)}')
         self.stdout.write(f'Questions per cycle: {organization.questions_per_cycle}')
 
+        if options['unusable_passwords']:
+            password = make_password(None)
+        else:
+            # Hash the shared password once instead of once per user
+            password = make_password(TEST_PASSWORD)
+
+        if bulk:
+            if not connection.features.can_return_rows_from_bulk_insert:
+                raise CommandError('--bulk needs a database that returns ids from bulk inserts')
+            users = self.generate_bulk(
+                organization, questions, create_users, num_users, password,
+                num_weeks, responses_per_week, clear_responses, batch_size
+            )
+            if users is None:
+                return
+        else:
+            users = self.generate_one_by_one(
+                organization, questions, create_users, num_users, password,
+                num_weeks, responses_per_week, clear_responses
+            )
+            if users is None:
+                return
+
+        user_action = "created" if create_users else "used existing"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully {user_action} {len(users)} users and generated survey responses '
+                f'for "{organization.name}"'
+            )
+        )
+
+    def generate_one_by_one(self, organization, questions, create_users, num_users, password,
+                            num_weeks, responses_per_week, clear_responses):
         with transaction.atomic():
             # Clear existing responses if requested
             if clear_responses:
-                existing_responses = SurveyResponse.objects.filter(organization=organization)
-                response_count = existing_responses.count()
-                existing_responses.delete()
-                self.stdout.write(f'Cleared {response_count} existing survey responses')
+                self.clear_responses(organization)
 
             # Get users (either create new ones or use existing)
             if create_users:
-                users = self.create_users(num_users, organization)
+                users = self.create_users(num_users, organization, password)
             else:
                 users = self.get_existing_users(organization)
                 if not users:
@@ -104,55 +262,76 @@ class Command(BaseCommand):
                             f'Use --create-users to create new users or add users to the organization first.'
                         )
                     )
-                    return
+                    return None
             
-            # Generate survey responses spread over time
+            # Generate survey responses spread over time. Every save updates the results
+            # rollups through the answer signals, so they need no rebuild afterwards.
             self.create_survey_responses(
                 users, organization, questions, num_weeks, responses_per_week
             )
 
-        user_action = "created" if create_users else "used existing"
+        return users
+
+    def generate_bulk(self, organization, questions, create_users, num_users, password,
+                      num_weeks, responses_per_week, clear_responses, batch_size):
+        started = time.monotonic()
+
+        if clear_responses:
+            # Deleting the responses takes their answers out of the results rollups
+            with transaction.atomic():
+                self.clear_responses(organization)
+
+        if create_users:
+            users = self.create_users_bulk(num_users, organization, password, batch_size)
+        else:
+            users = self.get_existing_users(organization)
+            if not users:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f'No users found for organization "{organization.name}". '
+                        f'Use --create-users to create new users or add users to the organization first.'
+                    )
+                )
+                return None
+
+        # Each batch updates the results rollups in the same transaction
+        responses_created, answers_created = self.create_survey_responses_bulk(
+            users, organization, questions, num_weeks, responses_per_week, batch_size
+        )
+
+        elapsed = time.monotonic() - started
         self.stdout.write(
-            self.style.SUCCESS(
-                f'Successfully {user_action} {len(users)} users and generated survey responses '
-                f'for "{organization.name}"'
-            )
+            f'Wrote {responses_created} responses and {answers_created} answers in {elapsed:.1f}s '
+            f'({answers_created / max(elapsed, 0.001):.0f} answers/s)'
         )
+        return users
 
-    def create_users(self, num_users, organization):
+    def clear_responses(self, organization):
+        existing_responses = SurveyResponse.objects.filter(organization=organization)
+        response_count = existing_responses.count()
+        existing_responses.delete()
+        self.stdout.write(f'Cleared {response_count} existing survey responses')
+
+    def create_users(self, num_users, organization, password):
         """Create random users and add them to the organization"""
         users = []
         
-        # Sample first and last names for variety
-        first_names = [
-            'Alice', 'Bob', 'Charlie', 'Diana', 'Eve', 'Frank', 'Grace', 'Henry',
-            'Ivy', 'Jack', 'Kate', 'Liam', 'Maya', 'Noah', 'Olivia', 'Peter',
-            'Quinn', 'Rachel', 'Sam', 'Tara', 'Uma', 'Victor', 'Wendy', 'Xavier',
-            'Yara', 'Zoe', 'Alex', 'Blake', 'Casey', 'Drew'
-        ]
-        
-        last_names = [
-            'Anderson', 'Brown', 'Clark', 'Davis', 'Evans', 'Garcia', 'Harris',
-            'Johnson', 'Jones', 'Lee', 'Martinez', 'Miller', 'Moore', 'Rodriguez',
-            'Smith', 'Taylor', 'Thomas', 'White', 'Williams', 'Wilson'
-        ]
-
         for i in range(num_users):
             # Generate unique email
-            first_name = random.choice(first_names)
-            last_name = random.choice(last_names)
+            first_name = random.choice(FIRST_NAMES)
+            last_name = random.choice(LAST_NAMES)
             email = f'{first_name.lower()}.{last_name.lower()}{i}@{organization.name.lower().replace(" ", "")}.com'
             
             # Ensure email is unique
             while User.objects.filter(email=email).exists():
                 email = f'{first_name.lower()}.{last_name.lower()}{i}{random.randint(10, 99)}@{organization.name.lower().replace(" ", "")}.com'
             
-            user = User.objects.create_user(
+            user = User.objects.create(
                 username=email,
                 email=email,
                 first_name=first_name,
                 last_name=last_name,
-                password='testpassword123'
+                password=password
             )
             
             # Add user to organization as member
@@ -170,6 +349,37 @@ class Command(BaseCommand):
         self.stdout.write(f'Created {len(users)} users total')
         return users
 
+    def create_users_bulk(self, num_users, organization, password, batch_size):
+        """Create random users and their memberships with bulk inserts"""
+        domain = organization.name.lower().replace(" ", "")
+        taken = set(User.objects.filter(email__endswith=f'@{domain}.com').values_list('email', flat=True))
+
+        users = []
+        for i in range(num_users):
+            first_name = random.choice(FIRST_NAMES)
+            last_name = random.choice(LAST_NAMES)
+            email = f'{first_name.lower()}.{last_name.lower()}{i}@{domain}.com'
+            while email in taken:
+                email = f'{first_name.lower()}.{last_name.lower()}{i}{random.randint(10, 99)}@{domain}.com'
+            taken.add(email)
+            users.append(User(
+                username=email,
+                email=email,
+                first_name=first_name,
+                last_name=last_name,
+                password=password
+            ))
+
+        with transaction.atomic(), hierarchy.deferred_maintenance(organization):
+            User.objects.bulk_create(users, batch_size=batch_size)
+            OrganizationMembership.objects.bulk_create(
+                [OrganizationMembership(user=user, organization=organization, role='member') for user in users],
+                batch_size=batch_size
+            )
+
+        self.stdout.write(f'Created {len(users)} users total')
+        return users
+
     def get_existing_users(self, organization):
         """Get existing users from the organization"""
         memberships = OrganizationMembership.objects.filter(
@@ -183,6 +393,86 @@ class Command(BaseCommand):
 
     def create_survey_responses(self, users, organization, questions, num_weeks, responses_per_week):
         """Create survey responses spread over the specified time period"""
+        responses_created = 0
+        
+        for user, response_date, ratings in self.iter_survey_responses(
+            users, organization, questions, num_weeks, responses_per_week
+        ):
+            # Create survey response
+            response = SurveyResponse.objects.create(
+                user=user,
+                organization=organization,
+                created_at=response_date,
+                completed_at=response_date
+            )
+            
+            # Create answers for selected questions
+            for question, rating in ratings:
+                Answer.objects.create(
+                    response=response,
+                    question=question,
+                    rating=rating
+                )
+            
+            responses_created += 1
+            
+            if responses_created % 10 == 0:
+                self.stdout.write(f'Created {responses_created} responses...')
+
+        self.stdout.write(f'Created {responses_created} total responses')
+
+    def create_survey_responses_bulk(self, users, organization, questions, num_weeks, responses_per_week,
+                                     batch_size):
+        """Create survey responses in memory and write them in batches of about ``batch_size`` answers"""
+        responses_created = 0
+        answers_created = 0
+        batch = []
+        batch_answers = 0
+        
+        def flush():
+            started = time.monotonic()
+            with transaction.atomic():
+                responses = SurveyResponse.objects.bulk_create(
+                    [response for response, ratings in batch], batch_size=batch_size
+                )
+                Answer.objects.bulk_create(
+                    [
+                        Answer(response_id=response.pk, question_id=question.id, rating=rating)
+                        for response, (_, ratings) in zip(responses, batch)
+                        for question, rating in ratings
+                    ],
+                    batch_size=batch_size
+                )
+                rollups.apply_rows(organization, [
+                    (response.user_id, question.id, question.theme_id, rollups.week_start(response.completed_at), rating)
+                    for response, (_, ratings) in zip(responses, batch)
+                    for question, rating in ratings
+                ])
+            self.stdout.write(
+                f'Wrote {len(batch)} responses / {batch_answers} answers '
+                f'({batch_answers / max(time.monotonic() - started, 0.001):.0f} answers/s)'
+            )
+        
+        for user, response_date, ratings in self.iter_survey_responses(
+            users, organization, questions, num_weeks, responses_per_week
+        ):
+            response = SurveyResponse(user=user, organization=organization, completed_at=response_date)
+            batch.append((response, ratings))
+            batch_answers += len(ratings)
+            responses_created += 1
+            answers_created += len(ratings)
+            if batch_answers >= batch_size:
+                flush()
+                batch = []
+                batch_answers = 0
+        if batch:
+            flush()
+
+        self.stdout.write(f'Created {responses_created} total responses')
+        return responses_created, answers_created
+
+    def iter_survey_responses(self, users, organization, questions, num_weeks, responses_per_week):
+        """Yield (user, response date, [(question, rating), ...]) spread over the specified time period"""
         
         # Calculate date range (last N weeks)
         end_date = timezone.now()
@@ -194,13 +484,12 @@ class Command(BaseCommand):
             f'Creating approximately {total_responses} responses over {num_weeks} weeks '
             f'({start_date.date()} to {end_date.date()})'
         )
-
-        responses_created = 0
+        
+        questions_count = min(organization.questions_per_cycle, len(questions))
         
         for week in range(num_weeks):
             # Calculate week boundaries
             week_start = start_date + timedelta(weeks=week)
-            week_end = week_start + timedelta(weeks=1)
             
             # Randomize number of responses for this week (around the average)
             week_responses = max(1, responses_per_week + random.randint(-1, 2))
@@ -222,43 +511,20 @@ class Command(BaseCommand):
                     )
                 
                 # Ensure date doesn't exceed current time
-                if response_date > timezone.now():
-                    response_date = timezone.now() - timedelta(minutes=random.randint(5, 60))
+                if response_date > end_date:
+                    response_date = end_date - timedelta(minutes=random.randint(5, 60))
                 
                 # Pick a random user
                 user = random.choice(users)
                 
-                # Create survey response
-                response = SurveyResponse.objects.create(
-                    user=user,
-                    organization=organization,
-                    created_at=response_date,
-                    completed_at=response_date
-                )
+                # Select random questions based on organization's questions_per_cycle and
+                # generate realistic ratings (slight bias toward higher ratings)
+                ratings = [
+                    (question, self.generate_realistic_rating())
+                    for question in random.sample(questions, questions_count)
+                ]
                 
-                # Select random questions based on organization's questions_per_cycle
-                selected_questions = random.sample(
-                    questions, 
-                    min(organization.questions_per_cycle, len(questions))
-                )
-                
-                # Create answers for selected questions
-                for question in selected_questions:
-                    # Generate realistic ratings (slight bias toward higher ratings)
-                    rating = self.generate_realistic_rating()
-                    
-                    Answer.objects.create(
-                        response=response,
-                        question=question,
-                        rating=rating
-                    )
-                
-                responses_created += 1
-                
-                if responses_created % 10 == 0:
-                    self.stdout.write(f'Created {responses_created} responses...')
-
-        self.stdout.write(f'Created {responses_created} total responses')
+                yield user, response_date, ratings
 
     def generate_realistic_rating(self):
         """Generate realistic ratings with some bias toward positive scores"""
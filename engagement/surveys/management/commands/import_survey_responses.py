@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+import sys
+from organizations.models import Organization
+from surveys import ingest
+
+
+class Command(BaseCommand):
+    help = 'Import survey responses from a JSON-lines file, e.g. collected offline on kiosks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'organization_id',
+            type=int,
+            help='ID of the organization the responses belong to'
+        )
+        parser.add_argument(
+            'path',
+            type=str,
+            help='JSON-lines file with one response per line, or - to read standard input'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Responses per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--insert-size',
+            type=int,
+            default=1000,
+            help='Rows per bulk insert statement (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            organization = Organization.objects.get(id=options['organization_id'])
+        except Organization.DoesNotExist:
+            raise CommandError(f'Organization with ID {options["organization_id"]} does not exist')
+        if options['batch_size'] < 1 or options['insert_size'] < 1:
+            raise CommandError('--batch-size and --insert-size must be at least 1')
+
+        if options['path'] == '-':
+            self.import_lines(organization, sys.stdin, options)
+        else:
+            try:
+                with open(options['path'], encoding='utf-8') as lines:
+                    self.import_lines(organization, lines, options)
+            except OSError as error:
+                raise CommandError(f'Cannot read {options["path"]}: {error}')
+
+    def import_lines(self, organization, lines, options):
+        errors = 0
+
+        def valid_submissions():
+            nonlocal errors
+            for line_number, submission, error in ingest.read_records(organization, lines):
+                if error:
+                    errors += 1
+                    self.stderr.write(f'Line {line_number}: {error}')
+                else:
+                    yield submission
+
+        responses = answers = 0
+        batches = ingest.write_in_batches(
+            valid_submissions(),
+            batch_size=options['batch_size'],
+            insert_size=options['insert_size']
+        )
+        for number, (batch_responses, batch_answers, seconds) in enumerate(batches, start=1):
+            responses += batch_responses
+            answers += batch_answers
+            self.stdout.write(
+                f'Chunk {number}: {batch_responses} responses / {batch_answers} answers in {seconds:.2f}s '
+                f'({batch_answers / max(seconds, 0.001):.0f} answers/s)'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {responses} responses and {answers} answers into "{organization.name}"'
+        ))
+        if errors:
+            self.stdout.write(self.style.WARNING(f'Skipped {errors} invalid lines'))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+import time
+from surveys import submissions
+
+
+class Command(BaseCommand):
+    help = 'Write survey submissions queued by take_survey in write-behind mode to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Submissions per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Keep running and drain the spool whenever new submissions arrive'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between checks of an empty spool in --watch mode (default: 1)'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        lock = submissions.lock_worker()
+        if lock is None:
+            raise CommandError(f'Another worker is already draining {submissions.spool_dir()}')
+
+        try:
+            while True:
+                written = self.drain(options['batch_size'])
+                if not options['watch']:
+                    break
+                if not written:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            lock.close()
+
+    def drain(self, batch_size):
+        total_responses = 0
+        for responses, answers, skipped in submissions.drain(batch_size):
+            total_responses += responses
+            message = f'Wrote {responses} responses / {answers} answers'
+            if skipped:
+                message += f', skipped {skipped} submissions of deleted users, organizations or unreadable lines'
+            self.stdout.write(message)
+
+        if total_responses:
+            self.stdout.write(self.style.SUCCESS(f'Wrote {total_responses} queued survey responses'))
+        return total_responses
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from organizations.models import Organization
+from surveys import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the weekly survey result rollups from existing answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'organization_ids',
+            nargs='*',
+            type=int,
+            help='IDs of the organizations to rebuild (default: all organizations)'
+        )
+
+    def handle(self, *args, **options):
+        organization_ids = options['organization_ids']
+
+        organizations = Organization.objects.all()
+        if organization_ids:
+            organizations = organizations.filter(id__in=organization_ids)
+            missing = set(organization_ids) - set(organizations.values_list('id', flat=True))
+            for organization_id in sorted(missing):
+                self.stdout.write(
+                    self.style.ERROR(f'Organization with ID {organization_id} does not exist')
+                )
+
+        for organization in organizations:
+            question_rows, theme_rows, team_rows = rollups.rebuild(organization)
+            self.stdout.write(
+                f'Rebuilt rollups for "{organization.name}": '
+                f'{question_rows} question-weeks, {theme_rows} theme-weeks, {team_rows} team-question-weeks'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Survey rollups rebuilt'))
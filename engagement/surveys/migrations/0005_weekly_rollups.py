@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:13
+
+from collections import defaultdict
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_weekly_rollups(apps, schema_editor):
+    # Rating histograms are added and filled in by 0008 and 0009
+    Answer = apps.get_model('surveys', 'Answer')
+    QuestionWeekRollup = apps.get_model('surveys', 'QuestionWeekRollup')
+    ThemeWeekRollup = apps.get_model('surveys', 'ThemeWeekRollup')
+
+    question_sums = defaultdict(lambda: [0, 0])
+    theme_sums = defaultdict(lambda: [0, 0])
+    rows = Answer.objects.filter(response__completed_at__isnull=False).annotate(
+        day=TruncDate('response__completed_at')
+    ).values_list(
+        'response__organization_id', 'question_id', 'question__theme_id', 'day'
+    ).annotate(rating_total=Sum('rating'), rating_count=Count('id')).order_by()
+    for organization_id, question_id, theme_id, day, total, count in rows.iterator(chunk_size=10000):
+        week = day - timedelta(days=day.weekday())
+        for rollup in (question_sums[(organization_id, question_id, week)], theme_sums[(organization_id, theme_id, week)]):
+            rollup[0] += total
+            rollup[1] += count
+
+    QuestionWeekRollup.objects.bulk_create(
+        (
+            QuestionWeekRollup(
+                organization_id=organization_id, question_id=question_id, week_start=week, total=total, count=count
+            )
+            for (organization_id, question_id, week), (total, count) in question_sums.items()
+        ),
+        batch_size=10000
+    )
+    ThemeWeekRollup.objects.bulk_create(
+        (
+            ThemeWeekRollup(organization_id=organization_id, theme_id=theme_id, week_start=week, total=total, count=count)
+            for (organization_id, theme_id, week), (total, count) in theme_sums.items()
+        ),
+        batch_size=10000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0004_organizationmembership_title'),
+        ('surveys', '0004_surveyresponse_answer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionWeekRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('total', models.PositiveBigIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='organizations.organization')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='week_rollups', to='surveys.question')),
+            ],
+            options={
+                'ordering': ['week_start'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['organization', 'week_start'], name='surveys_que_organiz_1d2669_idx')],
+                'unique_together': {('question', 'week_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ThemeWeekRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('total', models.PositiveBigIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='organizations.organization')),
+                ('theme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='week_rollups', to='surveys.theme')),
+            ],
+            options={
+                'ordering': ['week_start'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['organization', 'week_start'], name='surveys_the_organiz_f6d2ca_idx')],
+                'unique_together': {('theme', 'week_start')},
+            },
+        ),
+        migrations.RunPython(populate_weekly_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:56
+
+from collections import defaultdict
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_team_week_rollups(apps, schema_editor):
+    Answer = apps.get_model('surveys', 'Answer')
+    ReportingLine = apps.get_model('organizations', 'ReportingLine')
+    TeamWeekRollup = apps.get_model('surveys', 'TeamWeekRollup')
+
+    managers = defaultdict(list)
+    for organization_id, user_id, manager_id in ReportingLine.objects.filter(depth__gt=0).values_list(
+        'organization_id', 'descendant__user_id', 'ancestor_id'
+    ).iterator(chunk_size=10000):
+        managers[(organization_id, user_id)].append(manager_id)
+
+    sums = defaultdict(lambda: [0, 0])
+    rows = Answer.objects.filter(response__completed_at__isnull=False).annotate(
+        day=TruncDate('response__completed_at')
+    ).values_list(
+        'response__organization_id', 'response__user_id', 'question_id', 'day'
+    ).annotate(rating_total=Sum('rating'), rating_count=Count('id')).order_by()
+    for organization_id, user_id, question_id, day, total, count in rows.iterator(chunk_size=10000):
+        week = day - timedelta(days=day.weekday())
+        for manager_id in managers.get((organization_id, user_id), ()):
+            rollup = sums[(organization_id, manager_id, question_id, week)]
+            rollup[0] += total
+            rollup[1] += count
+
+    TeamWeekRollup.objects.bulk_create(
+        (
+            TeamWeekRollup(
+                organization_id=organization_id,
+                manager_id=manager_id,
+                question_id=question_id,
+                week_start=week,
+                total=total,
+                count=count
+            )
+            for (organization_id, manager_id, question_id, week), (total, count) in sums.items()
+        ),
+        batch_size=10000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0006_populate_reporting_lines'),
+        ('surveys', '0006_surveycycleassignment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamWeekRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('total', models.PositiveBigIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['week_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='surveyresponse',
+            index=models.Index(fields=['organization', 'user'], name='surveys_sur_organiz_f899f1_idx'),
+        ),
+        migrations.AddField(
+            model_name='teamweekrollup',
+            name='manager',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='team_week_rollups', to='organizations.organizationmembership'),
+        ),
+        migrations.AddField(
+            model_name='teamweekrollup',
+            name='organization',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='organizations.organization'),
+        ),
+        migrations.AddField(
+            model_name='teamweekrollup',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='team_week_rollups', to='surveys.question'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='teamweekrollup',
+            unique_together={('manager', 'question', 'week_start')},
+        ),
+        migrations.RunPython(populate_team_week_rollups, migrations.RunPython.noop),
+    ]
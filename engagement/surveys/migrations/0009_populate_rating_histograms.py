@@ -0,0 +1,63 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def populate_rating_histograms(apps, schema_editor):
+    Answer = apps.get_model('surveys', 'Answer')
+    ReportingLine = apps.get_model('organizations', 'ReportingLine')
+    QuestionWeekRollup = apps.get_model('surveys', 'QuestionWeekRollup')
+    ThemeWeekRollup = apps.get_model('surveys', 'ThemeWeekRollup')
+    TeamWeekRollup = apps.get_model('surveys', 'TeamWeekRollup')
+
+    managers = defaultdict(list)
+    for organization_id, user_id, manager_id in ReportingLine.objects.filter(depth__gt=0).values_list(
+        'organization_id', 'descendant__user_id', 'ancestor_id'
+    ).iterator(chunk_size=10000):
+        managers[(organization_id, user_id)].append(manager_id)
+
+    question_counts = defaultdict(lambda: [0] * 10)
+    theme_counts = defaultdict(lambda: [0] * 10)
+    team_counts = defaultdict(lambda: [0] * 10)
+    rows = Answer.objects.filter(response__completed_at__isnull=False).annotate(
+        day=TruncDate('response__completed_at')
+    ).values_list(
+        'response__organization_id', 'response__user_id', 'question_id', 'question__theme_id', 'day', 'rating'
+    ).annotate(answers=Count('id')).order_by()
+    for organization_id, user_id, question_id, theme_id, day, rating, answers in rows.iterator(chunk_size=10000):
+        week = day - timedelta(days=day.weekday())
+        question_counts[(question_id, week)][rating - 1] += answers
+        theme_counts[(theme_id, week)][rating - 1] += answers
+        for manager_id in managers.get((organization_id, user_id), ()):
+            team_counts[(manager_id, question_id, week)][rating - 1] += answers
+
+    connection = schema_editor.connection
+    quote_name = connection.ops.quote_name
+    assignments = ', '.join(f'{quote_name(f"rating_{rating}")} = %s' for rating in range(1, 11))
+    for model, key_columns, counts in [
+        (QuestionWeekRollup, ['question_id'], question_counts),
+        (ThemeWeekRollup, ['theme_id'], theme_counts),
+        (TeamWeekRollup, ['manager_id', 'question_id'], team_counts),
+    ]:
+        conditions = ' AND '.join(f'{quote_name(column)} = %s' for column in [*key_columns, 'week_start'])
+        update = f'UPDATE {quote_name(model._meta.db_table)} SET {assignments} WHERE {conditions}'
+        with connection.cursor() as cursor:
+            cursor.executemany(update, [
+                (*slots, *key[:-1], connection.ops.adapt_datefield_value(key[-1]))
+                for key, slots in counts.items()
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0006_populate_reporting_lines'),
+        ('surveys', '0008_rating_histograms'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_rating_histograms, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from organizations.models import Organization
+from organizations.models import Organization, OrganizationMembership
 
 
 class Survey(models.Model):
@@ -52,11 +52,25 @@ class SurveyResponse(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Team results look up the responses of a set of members
+            models.Index(fields=['organization', 'user']),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.organization.name} ({self.created_at.date()})"
 
 
+class AnswerQuerySet(models.QuerySet):
+    def delete(self):
+        # Deleting answers directly (rather than along with their response) has
+        # no signal to hook into without giving up fast deletes, see signals
+        from . import rollups
+        with transaction.atomic():
+            rollups.remove_answers(self)
+            return super().delete()
+
+
 class Answer(models.Model):
     RATING_CHOICES = [(i, str(i)) for i in range(1, 11)]
     
@@ -64,8 +78,97 @@ class Answer(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     rating = models.PositiveIntegerField(choices=RATING_CHOICES)
     
+    objects = AnswerQuerySet.as_manager()
+    
     class Meta:
         unique_together = ['response', 'question']
     
     def __str__(self):
         return f"{self.question.text[:30]}... - {self.rating}/10"
+    
+    def delete(self, *args, **kwargs):
+        from . import rollups
+        with transaction.atomic():
+            rollups.remove_answers(Answer.objects.filter(pk=self.pk))
+            return super().delete(*args, **kwargs)
+
+
+class SurveyCycleAssignment(models.Model):
+    """Questions drawn for a user in one survey cycle, so every request in the cycle shows the same ones"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    cycle_start = models.DateField(help_text="Monday of the ISO week the cycle covers")
+    question_ids = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['organization', 'user', 'cycle_start']
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.organization.name} ({self.cycle_start})"
+
+
+class SpoolCheckpoint(models.Model):
+    """How far process_survey_spool got through a claimed spool file, saved with the rows it wrote"""
+    name = models.CharField(max_length=100, unique=True)
+    offset = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.offset}"
+
+
+class WeeklyRollup(models.Model):
+    """Running sum, count and histogram of ratings for one ISO week (weeks start on Monday)"""
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    week_start = models.DateField()
+    total = models.PositiveBigIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    # Number of answers per rating, see surveys.histograms
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    rating_6 = models.PositiveIntegerField(default=0)
+    rating_7 = models.PositiveIntegerField(default=0)
+    rating_8 = models.PositiveIntegerField(default=0)
+    rating_9 = models.PositiveIntegerField(default=0)
+    rating_10 = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        abstract = True
+        ordering = ['week_start']
+
+
+class QuestionWeekRollup(WeeklyRollup):
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='week_rollups')
+    
+    class Meta(WeeklyRollup.Meta):
+        unique_together = ['question', 'week_start']
+        indexes = [models.Index(fields=['organization', 'week_start'])]
+    
+    def __str__(self):
+        return f"{self.question} ({self.week_start}): {self.total}/{self.count}"
+
+
+class ThemeWeekRollup(WeeklyRollup):
+    theme = models.ForeignKey(Theme, on_delete=models.CASCADE, related_name='week_rollups')
+    
+    class Meta(WeeklyRollup.Meta):
+        unique_together = ['theme', 'week_start']
+        indexes = [models.Index(fields=['organization', 'week_start'])]
+    
+    def __str__(self):
+        return f"{self.theme} ({self.week_start}): {self.total}/{self.count}"
+
+
+class TeamWeekRollup(WeeklyRollup):
+    """Ratings of everyone below a manager in the reporting tree, at any depth"""
+    manager = models.ForeignKey(OrganizationMembership, on_delete=models.CASCADE, related_name='team_week_rollups')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='team_week_rollups')
+    
+    class Meta(WeeklyRollup.Meta):
+        unique_together = ['manager', 'question', 'week_start']
+    
+    def __str__(self):
+        return f"{self.manager_id}: {self.question} ({self.week_start}): {self.total}/{self.count}"
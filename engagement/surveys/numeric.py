@@ -0,0 +1,18 @@
+"""Optional NumPy support shared by the analytics modules.
+
+NumPy is optional. Without it the columnar results engine, the heatmap and the
+correlations fall back to pure Python, and averages get no bootstrap intervals.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def wants_numpy(use_numpy):
+    """Resolve a ``use_numpy`` argument: ``None`` means whenever NumPy is installed"""
+    if use_numpy is None:
+        return np is not None
+    if use_numpy and np is None:
+        raise ImportError('NumPy is required with use_numpy=True')
+    return use_numpy
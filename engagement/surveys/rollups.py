@@ -0,0 +1,267 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+from organizations.models import ReportingLine
+from . import histograms
+from .caching import bump_results_version
+from .models import Answer, QuestionWeekRollup, ThemeWeekRollup, TeamWeekRollup
+
+
+def week_start(value):
+    """Return the Monday of the ISO week containing a datetime or date"""
+    if hasattr(value, 'tzinfo') and value.tzinfo is not None:
+        value = timezone.localtime(value)
+    if hasattr(value, 'date'):
+        value = value.date()
+    return value - timedelta(days=value.weekday())
+
+
+# Every rollup row carries these running sums, see histograms for the rating slots
+COLUMNS = ['total', 'count', *histograms.FIELDS]
+
+
+def _sums():
+    return [0] * len(COLUMNS)
+
+
+def _add(sums, rating, answers=1):
+    sums[0] += rating * answers
+    sums[1] += answers
+    sums[1 + rating] += answers
+
+
+def _merge(sums, other, sign=1):
+    for index, value in enumerate(other):
+        sums[index] += sign * value
+
+
+def record_answers(organization, user_id, completed_at, answers):
+    """Add the (question, rating) pairs of one completed response to the weekly rollups.
+
+    Must be called inside the transaction that writes the answers so the rollups
+    never disagree with the Answer table.
+    """
+    week = week_start(completed_at)
+    apply_rows(organization, [
+        (user_id, question.id, question.theme_id, week, rating) for question, rating in answers
+    ])
+
+
+def apply_rows(organization, rows, sign=1):
+    """Increment rollups from (user_id, question_id, theme_id, week_start, rating) rows, or decrement with ``sign=-1``"""
+    _apply(organization.pk, [(*row, sign) for row in rows])
+
+
+def _apply(organization_id, rows, teams=True):
+    # Rows are (user_id, question_id, theme_id, week_start, rating, answers), answers negative to remove them
+    managers = defaultdict(list)
+    if teams:
+        for user_id, manager_id in ReportingLine.objects.filter(
+            organization_id=organization_id,
+            descendant__user_id__in={row[0] for row in rows},
+            depth__gt=0
+        ).values_list('descendant__user_id', 'ancestor_id'):
+            managers[user_id].append(manager_id)
+
+    question_sums = defaultdict(_sums)
+    theme_sums = defaultdict(_sums)
+    team_sums = defaultdict(_sums)
+    for user_id, question_id, theme_id, week, rating, answers in rows:
+        _add(question_sums[(question_id, week)], rating, answers)
+        _add(theme_sums[(theme_id, week)], rating, answers)
+        for manager_id in managers[user_id]:
+            _add(team_sums[(manager_id, question_id, week)], rating, answers)
+
+    _increment(QuestionWeekRollup, ['question_id'], organization_id, question_sums)
+    _increment(ThemeWeekRollup, ['theme_id'], organization_id, theme_sums)
+    _increment(TeamWeekRollup, ['manager_id', 'question_id'], organization_id, team_sums)
+    bump_results_version(organization_id)
+
+
+def answer_rows(answers):
+    """Group the completed answers of a queryset into {organization_id: rows} for ``replace_answers``"""
+    rows = defaultdict(list)
+    for organization_id, user_id, question_id, theme_id, week, rating, count in _weekly_ratings(
+        answers, 'response__organization_id', 'response__user_id', 'question_id', 'question__theme_id'
+    ):
+        rows[organization_id].append((user_id, question_id, theme_id, week_start(week), rating, count))
+    return rows
+
+
+def replace_answers(previous, current, teams=True):
+    """Swap the ``answer_rows`` read before a write for those read after it.
+
+    Edits and deletes of answers (or of the responses they belong to) go through
+    here, so the rollups follow whatever changed: a rating, a completion date,
+    the respondent or whether the answers exist at all. With ``teams=False`` the
+    team rollups are left to the membership signals.
+    """
+    if previous == current:
+        return
+    for organization_id in previous.keys() | current.keys():
+        rows = [(*row[:-1], -row[-1]) for row in previous.get(organization_id, ())]
+        rows.extend(current.get(organization_id, ()))
+        _apply(organization_id, rows, teams=teams)
+
+
+def remove_answers(answers, teams=True):
+    """Take the answers of a queryset out of the rollups, before deleting them"""
+    replace_answers(answer_rows(answers), {}, teams=teams)
+
+
+def _increment(model, key_fields, organization_id, sums):
+    """Add to rollups from {(*keys, week_start): [total, count, *histogram]}, where the keys match ``key_fields``"""
+    sums = {key: values for key, values in sums.items() if any(values)}
+    if not sums:
+        return
+
+    # Make sure every row exists, then add to all of them with one prepared UPDATE,
+    # so a submission costs two statements per rollup table whatever its size
+    model.objects.bulk_create(
+        [model(organization_id=organization_id, week_start=key[-1], **dict(zip(key_fields, key))) for key in sums],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+    quote_name = connection.ops.quote_name
+    assignments = ', '.join(f'{quote_name(column)} = {quote_name(column)} + %s' for column in COLUMNS)
+    conditions = ' AND '.join(
+        f'{quote_name(model._meta.get_field(field).column)} = %s' for field in [*key_fields, 'week_start']
+    )
+    update = f'UPDATE {quote_name(model._meta.db_table)} SET {assignments} WHERE {conditions}'
+    with connection.cursor() as cursor:
+        cursor.executemany(update, [
+            (*values, *key[:-1], connection.ops.adapt_datefield_value(key[-1]))
+            for key, values in sums.items()
+        ])
+
+
+def managers_of(membership_id):
+    """Ids of everyone above a member in the reporting tree"""
+    return set(ReportingLine.objects.filter(
+        descendant_id=membership_id,
+        depth__gt=0
+    ).values_list('ancestor_id', flat=True))
+
+
+def _weekly_ratings(answers, *fields):
+    """Group an Answer queryset by ``fields``, week and rating into (*fields, week, rating, answers) rows"""
+    return answers.filter(
+        response__completed_at__isnull=False
+    ).annotate(
+        week=TruncWeek('response__completed_at')
+    ).values_list(*fields, 'week', 'rating').annotate(answers=Count('id')).order_by()
+
+
+def move_team(membership, previous_managers, managers):
+    """Move the ratings of a member and everyone below them from ``previous_managers`` to ``managers``.
+
+    Called when a member joins, leaves or changes managers, with the ids of the
+    managers above them before and after the change.
+    """
+    removed = set(previous_managers) - set(managers)
+    added = set(managers) - set(previous_managers)
+    if not removed and not added:
+        return
+
+    # The member's own answers plus their team's rollups
+    contribution = defaultdict(_sums)
+    own = _weekly_ratings(
+        Answer.objects.filter(
+            response__organization_id=membership.organization_id,
+            response__user_id=membership.user_id
+        ),
+        'question_id'
+    )
+    for question_id, week, rating, answers in own:
+        _add(contribution[(question_id, week_start(week))], rating, answers)
+    for question_id, week, *values in TeamWeekRollup.objects.filter(manager=membership).values_list(
+        'question_id', 'week_start', *COLUMNS
+    ):
+        _merge(contribution[(question_id, week)], values)
+    if not contribution:
+        return
+
+    team_sums = defaultdict(_sums)
+    for manager_ids, sign in ((removed, -1), (added, 1)):
+        for manager_id in manager_ids:
+            for (question_id, week), values in contribution.items():
+                _merge(team_sums[(manager_id, question_id, week)], values, sign)
+    _increment(TeamWeekRollup, ['manager_id', 'question_id'], membership.organization_id, team_sums)
+    bump_results_version(membership.organization_id)
+
+
+def rebuild(organization):
+    """Recompute all rollups for an organization from its answers"""
+    weekly = _weekly_ratings(
+        Answer.objects.filter(response__organization=organization), 'question_id', 'question__theme_id'
+    )
+
+    question_sums = defaultdict(_sums)
+    theme_sums = defaultdict(_sums)
+    for question_id, theme_id, week, rating, answers in weekly:
+        week = week_start(week)
+        _add(question_sums[(question_id, week)], rating, answers)
+        _add(theme_sums[(theme_id, week)], rating, answers)
+
+    question_rollups = [
+        QuestionWeekRollup(
+            organization=organization, question_id=question_id, week_start=week, **dict(zip(COLUMNS, values))
+        )
+        for (question_id, week), values in question_sums.items()
+    ]
+    theme_rollups = [
+        ThemeWeekRollup(organization=organization, theme_id=theme_id, week_start=week, **dict(zip(COLUMNS, values)))
+        for (theme_id, week), values in theme_sums.items()
+    ]
+
+    with transaction.atomic():
+        QuestionWeekRollup.objects.filter(organization=organization).delete()
+        ThemeWeekRollup.objects.filter(organization=organization).delete()
+        QuestionWeekRollup.objects.bulk_create(question_rollups, batch_size=1000)
+        ThemeWeekRollup.objects.bulk_create(theme_rollups, batch_size=1000)
+        team_rows = rebuild_teams(organization)
+
+    return len(question_rollups), len(theme_rollups), team_rows
+
+
+def rebuild_teams(organization, batch_size=10000):
+    """Recompute the team rollups of an organization from its answers and reporting lines"""
+    weekly = _weekly_ratings(
+        Answer.objects.filter(response__organization=organization), 'response__user_id', 'question_id'
+    )
+
+    managers = defaultdict(list)
+    for user_id, manager_id in ReportingLine.objects.filter(
+        organization=organization,
+        depth__gt=0
+    ).values_list('descendant__user_id', 'ancestor_id'):
+        managers[user_id].append(manager_id)
+
+    team_sums = defaultdict(_sums)
+    for user_id, question_id, week, rating, answers in weekly.iterator(chunk_size=batch_size):
+        week = week_start(week)
+        for manager_id in managers.get(user_id, ()):
+            _add(team_sums[(manager_id, question_id, week)], rating, answers)
+
+    with transaction.atomic():
+        TeamWeekRollup.objects.filter(organization=organization).delete()
+        TeamWeekRollup.objects.bulk_create(
+            (
+                TeamWeekRollup(
+                    organization=organization,
+                    manager_id=manager_id,
+                    question_id=question_id,
+                    week_start=week,
+                    **dict(zip(COLUMNS, values))
+                )
+                for (manager_id, question_id, week), values in team_sums.items()
+            ),
+            batch_size=batch_size
+        )
+        bump_results_version(organization.pk)
+
+    return len(team_sums)
@@ -0,0 +1,136 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from organizations import hierarchy
+from organizations.decorators import bump_context_version
+from organizations.models import Organization, OrganizationMembership
+from . import rollups
+from .caching import bump_results_version
+from .catalog import bump_catalog_version
+from .models import Survey, Theme, Question, SurveyResponse, Answer
+
+
+@receiver(post_save, sender=SurveyResponse)
+@receiver(post_delete, sender=SurveyResponse)
+def survey_response_changed(sender, instance, **kwargs):
+    bump_results_version(instance.organization_id)
+
+
+# Rollups follow edits by reading the affected rows before and after the write.
+# New responses have no answers yet and new answers are bulk created along with
+# their rollups, so only existing rows are read.
+@receiver(pre_save, sender=SurveyResponse)
+def survey_response_saving(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk is not None:
+        instance._previous_rows = rollups.answer_rows(Answer.objects.filter(response_id=instance.pk))
+
+
+@receiver(post_save, sender=SurveyResponse)
+def survey_response_saved(sender, instance, raw=False, **kwargs):
+    if hasattr(instance, '_previous_rows'):
+        rollups.replace_answers(
+            instance.__dict__.pop('_previous_rows'), rollups.answer_rows(Answer.objects.filter(response_id=instance.pk))
+        )
+
+
+@receiver(pre_delete, sender=SurveyResponse)
+def survey_response_deleting(sender, instance, origin=None, **kwargs):
+    # Deleting an organization removes its rollups anyway, and when a user is
+    # deleted their membership takes their answers out of the team rollups
+    origin_model = _origin_model(origin)
+    if origin_model is Organization:
+        return
+    rollups.remove_answers(Answer.objects.filter(response_id=instance.pk), teams=origin_model is not User)
+
+
+# Answers are not watched on delete: a pre_delete or post_delete receiver would
+# stop Django from fast-deleting them when a response or organization is
+# deleted. Deleting a response already updates the rollups and the version, and
+# answers deleted directly go through Answer.delete() or AnswerQuerySet.delete().
+@receiver(pre_save, sender=Answer)
+def answer_saving(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk is not None:
+        instance._previous_rows = rollups.answer_rows(Answer.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Answer)
+def answer_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.replace_answers(
+            instance.__dict__.pop('_previous_rows', {}), rollups.answer_rows(Answer.objects.filter(pk=instance.pk))
+        )
+    bump_results_version(instance.response.organization_id)
+
+
+def _origin_model(origin):
+    # Deletes started from a queryset (like the admin's delete action) pass it as the origin
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+@receiver(post_save, sender=Organization)
+def organization_changed(sender, instance, created, **kwargs):
+    # questions_per_cycle is part of the catalog
+    if not created:
+        bump_catalog_version(instance.pk)
+
+
+@receiver(post_save, sender=Survey)
+@receiver(post_delete, sender=Survey)
+def survey_changed(sender, instance, **kwargs):
+    bump_catalog_version(instance.organization_id)
+    # Memberships are cached together with the organization's survey
+    bump_context_version(instance.organization_id)
+
+
+@receiver(post_save, sender=Theme)
+@receiver(post_delete, sender=Theme)
+def theme_changed(sender, instance, **kwargs):
+    organization_id = Survey.objects.filter(pk=instance.survey_id).values_list('organization_id', flat=True).first()
+    if organization_id is not None:
+        bump_catalog_version(organization_id)
+        bump_results_version(organization_id)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, **kwargs):
+    # The theme may already be gone when questions are deleted along with their survey
+    organization_id = Theme.objects.filter(pk=instance.theme_id).values_list(
+        'survey__organization_id', flat=True
+    ).first()
+    if organization_id is not None:
+        bump_catalog_version(organization_id)
+        bump_results_version(organization_id)
+
+
+# Team rollups follow the reporting tree. The organizations app connects its
+# receivers first, so the closure table is still the old one in pre_save and
+# already the new one in post_save.
+@receiver(pre_save, sender=OrganizationMembership)
+def membership_saving(sender, instance, raw=False, **kwargs):
+    if getattr(instance, '_reports_to_changed', False):
+        instance._previous_managers = rollups.managers_of(instance.pk)
+
+
+@receiver(post_save, sender=OrganizationMembership)
+def membership_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or hierarchy.maintenance_deferred():
+        return
+    if created and instance.reports_to_id is not None:
+        rollups.move_team(instance, [], rollups.managers_of(instance.pk))
+    elif getattr(instance, '_reports_to_changed', False):
+        rollups.move_team(instance, instance._previous_managers, rollups.managers_of(instance.pk))
+
+
+@receiver(pre_delete, sender=OrganizationMembership)
+def membership_deleting(sender, instance, origin=None, **kwargs):
+    # Deleting an organization removes its rollups anyway
+    if isinstance(origin, Organization) or hierarchy.maintenance_deferred():
+        return
+    rollups.move_team(instance, rollups.managers_of(instance.pk), [])
+
+
+@receiver(hierarchy.rebuilt)
+def reporting_lines_rebuilt(sender, organization, **kwargs):
+    rollups.rebuild_teams(organization)
@@ -0,0 +1,164 @@
+"""Columnar Parquet snapshots of survey answers for analytics notebooks.
+
+Each organization gets a directory of ISO-week partitions in Hive layout::
+
+    <output>/organization=<id>/week=<monday>/answers.parquet
+
+The theme and question columns are dictionary encoded. ``_manifest.json`` stores
+a fingerprint of each exported week, a checksum of its answers, so later runs
+rewrite only the weeks whose answers changed. pyarrow is optional and only
+needed here.
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import date, timedelta
+from itertools import islice
+from pathlib import Path
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncWeek
+from .catalog import get_catalog
+from .export import start_of_day
+from .models import Answer
+from .rollups import week_start
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, only Parquet snapshots need it
+    pa = pq = None
+
+
+# Dataset readers skip files starting with _ or ., so neither the manifest nor
+# partially written files are mistaken for data
+MANIFEST_NAME = '_manifest.json'
+PARTITION_FILE = 'answers.parquet'
+
+
+def answer_schema():
+    return pa.schema([
+        ('response_id', pa.int64()),
+        ('completed_at', pa.timestamp('us', tz='UTC')),
+        ('theme_id', pa.int64()),
+        ('theme', pa.dictionary(pa.int32(), pa.string())),
+        ('question_id', pa.int64()),
+        ('question', pa.dictionary(pa.int32(), pa.string())),
+        ('rating', pa.uint8()),
+    ])
+
+
+def week_fingerprints(organization):
+    """Return {week: [answers, last id, checksum, checksum]} for every week with answers.
+
+    The checksums weigh each answer's rating and question by its id, so any
+    added, deleted or edited answer changes them, even edits that leave the
+    weekly totals as they were (like two ratings swapped). They are computed
+    from the answers rather than the rollups so writes that bypass the rollups
+    are caught too.
+    """
+    weeks = Answer.objects.filter(
+        response__organization=organization,
+        response__completed_at__isnull=False
+    ).annotate(
+        week=TruncWeek('response__completed_at')
+    ).values('week').annotate(
+        answers=Count('id'),
+        last_id=Max('id'),
+        ratings=Sum(F('id') * F('rating')),
+        questions=Sum(F('id') * F('question_id'))
+    ).values_list('week', 'answers', 'last_id', 'ratings', 'questions').order_by('week')
+    return {week_start(week).isoformat(): fingerprint for week, *fingerprint in weeks}
+
+
+def catalog_fingerprint(catalog):
+    """Hash of the theme and question names, which are written into every partition"""
+    names = [
+        (question.id, question.text, question.theme_id, question.theme.name)
+        for question in catalog.questions.values()
+    ]
+    return hashlib.sha256(json.dumps(sorted(names)).encode()).hexdigest()
+
+
+def export_snapshot(organization, output_dir, full=False, chunk_size=50000):
+    """Write the changed weeks of an organization and return (written weeks, answers, unchanged, removed)"""
+    if pa is None:
+        raise ImportError('pyarrow is required for Parquet snapshots')
+
+    catalog = get_catalog(organization)
+    directory = Path(output_dir) / f'organization={organization.pk}'
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = directory / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() and not full else {}
+
+    fingerprints = week_fingerprints(organization) if catalog is not None else {}
+    names = catalog_fingerprint(catalog) if catalog is not None else None
+    previous = manifest.get('weeks', {}) if manifest.get('catalog') == names else {}
+
+    written = answers = 0
+    for week, fingerprint in fingerprints.items():
+        if previous.get(week) == fingerprint and (directory / f'week={week}' / PARTITION_FILE).exists():
+            continue
+        answers += _write_week(organization, catalog, date.fromisoformat(week), directory, chunk_size)
+        written += 1
+
+    removed = 0
+    for partition in directory.glob('week=*'):
+        if partition.name.split('=', 1)[1] not in fingerprints:
+            shutil.rmtree(partition)
+            removed += 1
+
+    temporary = directory / f'.{MANIFEST_NAME}.tmp'
+    temporary.write_text(json.dumps({'catalog': names, 'weeks': fingerprints}, indent=2))
+    os.replace(temporary, manifest_path)
+
+    return written, answers, len(fingerprints) - written, removed
+
+
+def _write_week(organization, catalog, week, directory, chunk_size):
+    """Write one ISO week to its partition, a row group per chunk, and return the number of answers"""
+    themes = {theme.id: index for index, theme in enumerate(catalog.themes)}
+    questions = {question_id: index for index, question_id in enumerate(catalog.questions)}
+    theme_names = pa.array([theme.name for theme in catalog.themes], pa.string())
+    question_texts = pa.array([question.text for question in catalog.questions.values()], pa.string())
+    schema = answer_schema()
+
+    rows = Answer.objects.filter(
+        response__organization=organization,
+        response__completed_at__gte=start_of_day(week),
+        response__completed_at__lt=start_of_day(week + timedelta(weeks=1))
+    ).order_by('id').values_list(
+        'response_id', 'response__completed_at', 'question_id', 'rating'
+    ).iterator(chunk_size=chunk_size)
+
+    partition = directory / f'week={week.isoformat()}'
+    partition.mkdir(exist_ok=True)
+    temporary = partition / f'.{PARTITION_FILE}.tmp'
+    count = 0
+    with pq.ParquetWriter(temporary, schema) as writer:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            # Skip answers to questions added after the catalog was loaded
+            chunk = [row for row in chunk if row[2] in questions]
+            if not chunk:
+                continue
+            response_ids, completed_at, question_ids, ratings = zip(*chunk)
+            theme_ids = [catalog.questions[question_id].theme_id for question_id in question_ids]
+            writer.write_batch(pa.record_batch([
+                pa.array(response_ids, pa.int64()),
+                pa.array(completed_at, pa.timestamp('us', tz='UTC')),
+                pa.array(theme_ids, pa.int64()),
+                pa.DictionaryArray.from_arrays(
+                    pa.array([themes[theme_id] for theme_id in theme_ids], pa.int32()), theme_names
+                ),
+                pa.array(question_ids, pa.int64()),
+                pa.DictionaryArray.from_arrays(
+                    pa.array([questions[question_id] for question_id in question_ids], pa.int32()), question_texts
+                ),
+                pa.array(ratings, pa.uint8()),
+            ], schema=schema))
+            count += len(chunk)
+    os.replace(temporary, partition / PARTITION_FILE)
+    return count
@@ -0,0 +1,192 @@
+"""Write-behind queue for survey submissions.
+
+With SURVEY_WRITE_BEHIND enabled, take_survey appends each validated submission
+to a JSON-lines spool file instead of writing it to the database. The
+process_survey_spool command turns the spool into responses and answers, one
+transaction per batch. The spool is guarded by flock, so it needs only a local
+disk and no broker.
+"""
+import fcntl
+import json
+import os
+import time
+from collections import defaultdict
+from itertools import islice
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from organizations.models import Organization
+from . import rollups
+from .models import Question, SpoolCheckpoint, SurveyResponse, Answer
+
+
+SPOOL_NAME = 'submissions.jsonl'
+CLAIMED_PATTERN = 'submissions.*.claimed'
+WORKER_LOCK_NAME = 'worker.lock'
+
+
+def spool_dir():
+    return Path(getattr(settings, 'SURVEY_SPOOL_DIR', settings.BASE_DIR / 'spool'))
+
+
+def enqueue(user_id, organization_id, completed_at, answers):
+    """Durably append one submission with its (question_id, rating) pairs to the spool"""
+    line = json.dumps({
+        'user_id': user_id,
+        'organization_id': organization_id,
+        'completed_at': completed_at.isoformat(),
+        'answers': [[question_id, rating] for question_id, rating in answers],
+    }) + '\n'
+
+    directory = spool_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / SPOOL_NAME
+    while True:
+        with open(path, 'a') as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            # The worker may have claimed this file while we waited for the lock,
+            # in which case start over with a fresh spool (closing releases the lock)
+            try:
+                current = os.stat(path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != os.fstat(spool.fileno()).st_ino:
+                continue
+            spool.write(line)
+            spool.flush()
+            os.fsync(spool.fileno())
+            return
+
+
+def lock_worker():
+    """Return an open lock file if no other worker is draining the spool, else None"""
+    directory = spool_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    lock = open(directory / WORKER_LOCK_NAME, 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def claim_spool():
+    """Move the current spool aside and return every claimed file, oldest first"""
+    directory = spool_dir()
+    path = directory / SPOOL_NAME
+    if path.exists():
+        with open(path, 'a') as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            if os.fstat(spool.fileno()).st_size:
+                os.rename(path, directory / f'submissions.{time.time_ns()}.claimed')
+    return sorted(directory.glob(CLAIMED_PATTERN))
+
+
+def drain(batch_size=500):
+    """Write all spooled submissions, yielding (responses, answers, skipped) per batch.
+
+    The caller must hold the worker lock. Progress through a claimed file is
+    checkpointed in the database, in the transaction that writes the batch, so
+    a crash never replays a committed batch. Lines that are not JSON or not
+    shaped like a submission are skipped.
+    """
+    claimed = claim_spool()
+    # A crash between removing a finished file and its checkpoint leaves the checkpoint behind
+    SpoolCheckpoint.objects.exclude(name__in=[path.name for path in claimed]).delete()
+    for path in claimed:
+        offset = SpoolCheckpoint.objects.filter(name=path.name).values_list('offset', flat=True).first() or 0
+        with open(path, 'rb') as spool:
+            spool.seek(offset)
+            while True:
+                lines = list(islice(spool, batch_size))
+                if not lines:
+                    break
+                batch = [submission for submission in map(read_submission, lines) if submission is not None]
+                with transaction.atomic():
+                    responses, answers = write_submissions(batch)
+                    save_checkpoint(path.name, spool.tell())
+                yield responses, answers, len(lines) - responses
+        path.unlink()
+        SpoolCheckpoint.objects.filter(name=path.name).delete()
+
+
+def save_checkpoint(name, offset):
+    SpoolCheckpoint.objects.update_or_create(name=name, defaults={'offset': offset})
+
+
+def read_submission(line):
+    """Return the submission on a spool line, or None if it is not valid JSON of the spooled shape"""
+    try:
+        submission = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(submission, dict):
+        return None
+    if type(submission.get('user_id')) is not int or type(submission.get('organization_id')) is not int:
+        return None
+    completed_at = submission.get('completed_at')
+    try:
+        if not isinstance(completed_at, str) or parse_datetime(completed_at) is None:
+            return None
+    except ValueError:
+        return None
+    answers = submission.get('answers')
+    if not isinstance(answers, list) or not answers:
+        return None
+    for answer in answers:
+        if not isinstance(answer, list) or len(answer) != 2:
+            return None
+        question_id, rating = answer
+        if type(question_id) is not int or type(rating) is not int or not 1 <= rating <= 10:
+            return None
+    return submission
+
+
+def write_submissions(submissions, insert_size=1000):
+    """Write spooled submissions as responses and answers in one transaction.
+
+    Submissions from users or organizations deleted since, and answers to
+    deleted questions, are dropped. Rows are inserted ``insert_size`` at a
+    time. Returns (responses, answers) written.
+    """
+    themes = dict(Question.objects.filter(
+        id__in={question_id for submission in submissions for question_id, rating in submission['answers']}
+    ).values_list('id', 'theme_id'))
+    organizations = Organization.objects.in_bulk({submission['organization_id'] for submission in submissions})
+    users = set(User.objects.filter(
+        id__in={submission['user_id'] for submission in submissions}
+    ).values_list('id', flat=True))
+    submissions = [
+        submission for submission in submissions
+        if submission['organization_id'] in organizations and submission['user_id'] in users
+    ]
+
+    responses = [
+        SurveyResponse(
+            user_id=submission['user_id'],
+            organization_id=submission['organization_id'],
+            completed_at=parse_datetime(submission['completed_at'])
+        )
+        for submission in submissions
+    ]
+    with transaction.atomic():
+        SurveyResponse.objects.bulk_create(responses, batch_size=insert_size)
+
+        answers = []
+        rows = defaultdict(list)
+        for response, submission in zip(responses, submissions):
+            week = rollups.week_start(response.completed_at)
+            organization_rows = rows[response.organization_id]
+            for question_id, rating in submission['answers']:
+                if question_id in themes:
+                    answers.append(Answer(response_id=response.pk, question_id=question_id, rating=rating))
+                    organization_rows.append((response.user_id, question_id, themes[question_id], week, rating))
+        Answer.objects.bulk_create(answers, batch_size=insert_size)
+
+        for organization_id, organization_rows in rows.items():
+            rollups.apply_rows(organizations[organization_id], organization_rows)
+
+    return len(responses), len(answers)
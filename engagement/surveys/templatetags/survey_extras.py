@@ -1,8 +1,25 @@
 from django import template
+from django.utils.html import format_html
 
 register = template.Library()
 
 @register.filter
 def get_item(dictionary, key):
     """Get an item from a dictionary by key"""
-    return dictionary.get(key, {})
\ No newline at end of file
+    return dictionary.get(key, {})
+
+@register.simple_tag
+def confidence_interval(stats):
+    """The bootstrap interval of an average, or an "insufficient data" badge"""
+    if stats.get('insufficient'):
+        if stats.get('ci_low') is None:
+            title = 'Too few answers'
+        else:
+            title = format_html('95% confidence interval: {} to {}', stats['ci_low'], stats['ci_high'])
+        return format_html('<br><span class="badge bg-light text-muted" title="{}">insufficient data</span>', title)
+    if stats.get('ci_low') is None:
+        return ''
+    return format_html(
+        '<br><small class="text-muted" title="95% confidence interval">{}&ndash;{}</small>',
+        stats['ci_low'], stats['ci_high']
+    )
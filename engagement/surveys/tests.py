@@ -1,3 +1,837 @@
-from django.test import TestCase
+import csv
+import json
+import random
+import tempfile
+from collections import Counter
+from datetime import datetime, time, timedelta
+from io import StringIO
+from itertools import count
+from time import time_ns
+from pathlib import Path
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from engagement.testing import QueryBudgetTestCase
+from organizations.models import Organization, OrganizationMembership
+from . import analytics, bootstrap, catalog, correlations, export, heatmap, histograms, rollups, snapshots, submissions
+from .models import (
+    Survey, Theme, Question, SurveyResponse, Answer, QuestionWeekRollup, ThemeWeekRollup, TeamWeekRollup,
+    SpoolCheckpoint
+)
 
-# Create your tests here.
+
+class SurveyDataMixin:
+    """An organization with a survey and answers, given more members, questions and answers by ``grow()``"""
+    def setUp(self):
+        super().setUp()
+        # Rolled back tests never bump the cache versions and the next test reuses their ids
+        cache.clear()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'password')
+        self.organization = Organization.objects.create(name='Acme', questions_per_cycle=3)
+        self.membership = OrganizationMembership.objects.create(
+            user=self.user, organization=self.organization, role='owner'
+        )
+        self.survey = Survey.objects.create(organization=self.organization, title='Engagement')
+        self.themes = []
+        self.questions = []
+        self.grown = 0
+        self.add_themes(2, 'first')
+        self.add_responses(3, 'first')
+        self.client.force_login(self.user)
+
+    def add_themes(self, count, prefix):
+        for number in range(count):
+            theme = Theme.objects.create(survey=self.survey, name=f'{prefix} theme {number}', order=number)
+            self.themes.append(theme)
+            self.questions.extend(
+                Question.objects.create(theme=theme, text=f'{theme.name}, question {order}?', order=order)
+                for order in range(2)
+            )
+
+    def add_responses(self, members, prefix):
+        now = timezone.now()
+        for number in range(members):
+            user = User.objects.create_user(f'{prefix}-{number}', f'{prefix}-{number}@example.com')
+            OrganizationMembership.objects.create(
+                user=user, organization=self.organization, reports_to=self.membership
+            )
+            for week in range(3):
+                response = SurveyResponse.objects.create(
+                    user=user, organization=self.organization, completed_at=now - timedelta(weeks=week)
+                )
+                Answer.objects.bulk_create(
+                    Answer(response=response, question=question, rating=(number + index) % 10 + 1)
+                    for index, question in enumerate(self.questions)
+                )
+        rollups.rebuild(self.organization)
+
+    def grow(self):
+        self.grown += 1
+        self.add_themes(3, f'more{self.grown}')
+        self.add_responses(6, f'more{self.grown}')
+
+    def assertRollupsMatchAnswers(self):
+        """The question rollups agree with grouping the answers, and every rollup with a rebuild"""
+        weekly_ranges = analytics.get_weekly_ranges()
+        overall, weekly = analytics.rollup_aggregates(self.organization, weekly_ranges)
+        expected_overall, expected_weekly = analytics.sql_aggregates(self.organization, weekly_ranges)
+        self.assertEqual(sorted(row for row in overall if any(row[-1])), sorted(expected_overall))
+        self.assertEqual(sorted(row for row in weekly if any(row[-1])), sorted(expected_weekly))
+
+        # Themes and teams too, compared with rollups rebuilt from scratch
+        kept = self.rollup_rows()
+        rollups.rebuild(self.organization)
+        self.assertEqual(kept, self.rollup_rows())
+
+    def rollup_rows(self):
+        return [
+            sorted(row for row in model.objects.values_list(*keys, 'week_start', *rollups.COLUMNS) if any(row[-10:]))
+            for model, keys in [
+                (QuestionWeekRollup, ['question_id']),
+                (ThemeWeekRollup, ['theme_id']),
+                (TeamWeekRollup, ['manager_id', 'question_id']),
+            ]
+        ]
+
+
+class SurveyViewQueryTests(SurveyDataMixin, QueryBudgetTestCase):
+    def url(self, name, *args):
+        return reverse(name, args=[self.organization.pk, *args])
+
+    def test_survey_detail(self):
+        self.assertQueryBudget(6, lambda: self.client.get(self.url('survey_detail')))
+
+    def test_survey_create(self):
+        organization = Organization.objects.create(name='No survey yet')
+        OrganizationMembership.objects.create(user=self.user, organization=organization, role='owner')
+        url = reverse('survey_create', args=[organization.pk])
+        self.assertQueryBudget(3, lambda: self.client.get(url))
+
+    def test_survey_create_post(self):
+        urls = []
+        for number in range(2):
+            organization = Organization.objects.create(name=f'No survey yet {number}')
+            OrganizationMembership.objects.create(user=self.user, organization=organization, role='owner')
+            urls.append(reverse('survey_create', args=[organization.pk]))
+        urls = iter(urls)
+        self.assertQueryBudget(
+            10,
+            lambda: self.client.post(next(urls), {'title': 'New survey', 'description': '', 'is_active': 'on'}),
+            status=302
+        )
+
+    def test_survey_edit(self):
+        self.assertQueryBudget(3, lambda: self.client.get(self.url('survey_edit')))
+
+    def test_survey_edit_post(self):
+        self.assertQueryBudget(
+            6,
+            lambda: self.client.post(self.url('survey_edit'), {'title': 'Renamed', 'description': '', 'is_active': 'on'}),
+            status=302
+        )
+
+    def test_theme_create(self):
+        self.assertQueryBudget(3, lambda: self.client.get(self.url('theme_create')))
+
+    def test_theme_create_post(self):
+        names = (f'New theme {number}' for number in count())
+        self.assertQueryBudget(
+            6,
+            lambda: self.client.post(self.url('theme_create'), {'name': next(names), 'description': '', 'order': 9}),
+            status=302
+        )
+
+    def test_question_create(self):
+        self.assertQueryBudget(4, lambda: self.client.get(self.url('question_create', self.themes[0].pk)))
+
+    def test_question_create_post(self):
+        self.assertQueryBudget(
+            7,
+            lambda: self.client.post(
+                self.url('question_create', self.themes[0].pk), {'text': 'New question?', 'order': 9}
+            ),
+            status=302
+        )
+
+    def test_take_survey(self):
+        # The first GET of a cycle draws its questions
+        self.client.get(self.url('take_survey'))
+        self.assertQueryBudget(8, lambda: self.client.get(self.url('take_survey')))
+
+    def test_take_survey_post(self):
+        # The GET draws this cycle's questions, the POST answers them
+        form = self.client.get(self.url('take_survey')).context['form']
+        answers = {name: '7' for name in form.fields}
+        self.assertQueryBudget(17, lambda: self.client.post(self.url('take_survey'), answers), status=302)
+
+    def test_survey_results(self):
+        for engine in analytics.ENGINES:
+            with self.subTest(engine=engine), override_settings(SURVEY_RESULTS_ENGINE=engine):
+                self.assertQueryBudget(10, lambda: self.client.get(self.url('survey_results')))
+
+    def test_survey_heatmap(self):
+        first, *others = OrganizationMembership.objects.filter(reports_to=self.membership).order_by('id')
+        for other in others:
+            other.reports_to = first
+            other.save()
+        for level in ['1', '2']:
+            with self.subTest(level=level):
+                self.assertQueryBudget(7, lambda: self.client.get(self.url('survey_heatmap'), {'level': level}))
+
+    @override_settings(SURVEY_CORRELATION_MIN_RESPONDENTS=2)
+    def test_survey_correlations(self):
+        self.assertQueryBudget(7, lambda: self.client.get(self.url('survey_correlations')))
+
+    def test_team_results(self):
+        self.assertQueryBudget(8, lambda: self.client.get(self.url('team_results', self.membership.pk)))
+
+    def test_team_results_api(self):
+        self.assertQueryBudget(8, lambda: self.client.get(self.url('team_results_api', self.membership.pk)))
+
+    def test_export_results(self):
+        for export_format in ['csv', 'ndjson']:
+            with self.subTest(format=export_format):
+                self.assertQueryBudget(
+                    7, lambda: self.client.get(self.url('survey_results_export'), {'format': export_format})
+                )
+
+    def test_import_responses(self):
+        completed_at = (timezone.now() - timedelta(days=1)).isoformat()
+        body = '\n'.join(
+            json.dumps({'user': self.user.pk, 'completed_at': completed_at, 'answers': [[question.pk, 8]]})
+            for question in self.questions[:2]
+        )
+        self.assertQueryBudget(
+            19,
+            lambda: self.client.post(self.url('import_survey_responses'), body, content_type='application/x-ndjson')
+        )
+
+
+class TakeSurveyTests(SurveyDataMixin, TestCase):
+    def test_post_saves_the_questions_shown(self):
+        url = reverse('take_survey', args=[self.organization.pk])
+        with mock.patch('surveys.views.random.sample', wraps=random.sample) as sample:
+            form = self.client.get(url).context['form']
+            self.assertEqual(self.client.get(url).context['form'].fields.keys(), form.fields.keys())
+            response = self.client.post(url, {name: '6' for name in form.fields})
+        self.assertRedirects(response, reverse('organization_detail', args=[self.organization.pk]))
+        # Only the first request of the cycle draws questions
+        self.assertEqual(sample.call_count, 1)
+
+        shown = {int(name.removeprefix('question_')) for name in form.fields}
+        self.assertEqual(len(shown), self.organization.questions_per_cycle)
+        saved = SurveyResponse.objects.filter(user=self.user).latest('completed_at')
+        self.assertEqual(set(saved.answers.values_list('question_id', flat=True)), shown)
+        self.assertEqual(set(saved.answers.values_list('rating', flat=True)), {6})
+
+    def test_questions_deleted_since_the_draw_are_topped_up(self):
+        url = reverse('take_survey', args=[self.organization.pk])
+        drawn = list(self.client.get(url).context['form'].fields)
+        # The deletion bumps the catalog version once it commits
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.get(pk=int(drawn[0].removeprefix('question_'))).delete()
+        form = self.client.get(url).context['form']
+        self.assertEqual(len(form.fields), self.organization.questions_per_cycle)
+        self.assertEqual(list(form.fields)[:-1], drawn[1:])
+        # The top-up is saved, so the next request shows the same questions
+        self.assertEqual(list(self.client.get(url).context['form'].fields), list(form.fields))
+
+    def test_post_without_answers_is_refused(self):
+        url = reverse('take_survey', args=[self.organization.pk])
+        form = self.client.get(url).context['form']
+        responses = SurveyResponse.objects.count()
+        for write_behind in [False, True]:
+            with self.subTest(write_behind=write_behind), tempfile.TemporaryDirectory() as spool_dir, \
+                    override_settings(SURVEY_WRITE_BEHIND=write_behind, SURVEY_SPOOL_DIR=Path(spool_dir)):
+                response = self.client.post(url, {name: '' for name in form.fields})
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Please answer at least one question.')
+                self.assertEqual(SurveyResponse.objects.count(), responses)
+                self.assertEqual(list(Path(spool_dir).iterdir()), [])
+
+    def test_catalog_follows_a_version_bumped_by_another_process(self):
+        url = reverse('take_survey', args=[self.organization.pk])
+        self.client.get(url)
+        # A queryset update skips the signals, like a change made by another process
+        Question.objects.filter(theme__survey=self.survey).update(text='Reworded?')
+        self.assertNotContains(self.client.get(url), 'Reworded?')
+        cache.set(catalog.CATALOG_VERSION_KEY.format(organization_id=self.organization.pk), time_ns(), timeout=None)
+        self.assertContains(self.client.get(url), 'Reworded?')
+
+    def test_post_is_refused_when_the_survey_was_deactivated_elsewhere(self):
+        url = reverse('take_survey', args=[self.organization.pk])
+        form = self.client.get(url).context['form']
+        Survey.objects.filter(pk=self.survey.pk).update(is_active=False)
+        responses = SurveyResponse.objects.count()
+        response = self.client.post(url, {name: '6' for name in form.fields}, follow=True)
+        self.assertRedirects(response, reverse('organization_detail', args=[self.organization.pk]))
+        self.assertContains(response, 'This survey is currently inactive.')
+        self.assertEqual(SurveyResponse.objects.count(), responses)
+        # The stale catalog was dropped, so the form is no longer shown either
+        self.assertRedirects(self.client.get(url), reverse('organization_detail', args=[self.organization.pk]))
+
+
+class ImportResponsesTests(SurveyDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('import_survey_responses', args=[self.organization.pk])
+        self.completed_at = (timezone.now() - timedelta(days=1)).isoformat()
+
+    def post(self, *records):
+        body = '\n'.join(record if isinstance(record, str) else json.dumps(record) for record in records)
+        return self.client.post(self.url, body, content_type='application/x-ndjson')
+
+    def record(self, answers, user='first-0@example.com'):
+        return {'user': user, 'completed_at': self.completed_at, 'answers': answers}
+
+    def test_imports_valid_lines(self):
+        before = SurveyResponse.objects.count()
+        response = self.post(
+            self.record([[self.questions[0].pk, 8], [self.questions[1].pk, 3]]),
+            self.record([[self.questions[2].pk, 10]], user=self.user.pk),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'responses': 2, 'answers': 3, 'errors': []})
+        self.assertEqual(SurveyResponse.objects.count(), before + 2)
+        self.assertEqual(
+            sorted(Answer.objects.filter(response__user=self.user).values_list('question_id', 'rating')),
+            [(self.questions[2].pk, 10)]
+        )
+        self.assertRollupsMatchAnswers()
+
+    def test_reports_invalid_lines(self):
+        response = self.post(
+            self.record([[self.questions[0].pk, 8]]),
+            self.record([[999999, 8]]),
+            self.record([[self.questions[0].pk, 11]]),
+            '{"user": ',
+            self.record([[self.questions[0].pk, 5]], user='stranger@example.com'),
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['responses'], data['answers']), (1, 1))
+        self.assertEqual([error['line'] for error in data['errors']], [2, 3, 4, 5])
+        self.assertIn('999999 is not part of this survey', data['errors'][0]['error'])
+        self.assertIn('must be a whole number from 1 to 10', data['errors'][1]['error'])
+        self.assertEqual(data['errors'][2]['error'], 'Not valid JSON')
+        self.assertIn('is not a member', data['errors'][3]['error'])
+
+    def test_nothing_valid(self):
+        before = SurveyResponse.objects.count()
+        response = self.post('not json', self.record([]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['responses'], 0)
+        self.assertEqual(len(response.json()['errors']), 2)
+        self.assertEqual(SurveyResponse.objects.count(), before)
+
+    def test_session_only(self):
+        self.client.logout()
+        response = self.post(self.record([[self.questions[0].pk, 8]]))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('error', response.json())
+
+        self.client.force_login(User.objects.get(username='first-0'))
+        self.assertEqual(self.post(self.record([[self.questions[0].pk, 8]])).status_code, 403)
+
+        csrf_client = self.client_class(enforce_csrf_checks=True)
+        csrf_client.force_login(self.user)
+        response = csrf_client.post(
+            self.url, json.dumps(self.record([[self.questions[0].pk, 8]])), content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class SpoolTests(SurveyDataMixin, TestCase):
+    """Write-behind submissions go through the spool and process_survey_spool"""
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool_dir = Path(directory.name)
+        settings_override = override_settings(SURVEY_SPOOL_DIR=self.spool_dir, SURVEY_WRITE_BEHIND=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.responses = SurveyResponse.objects.count()
+
+    def enqueue(self, *answers, user=None):
+        submissions.enqueue((user or self.user).pk, self.organization.pk, timezone.now(), answers)
+
+    def process(self):
+        output = StringIO()
+        call_command('process_survey_spool', stdout=output)
+        return output.getvalue()
+
+    def test_take_survey_is_written_by_the_worker(self):
+        url = reverse('take_survey', args=[self.organization.pk])
+        form = self.client.get(url).context['form']
+        self.client.post(url, {name: '9' for name in form.fields})
+        self.assertEqual(SurveyResponse.objects.count(), self.responses)
+        self.assertEqual(len((self.spool_dir / submissions.SPOOL_NAME).read_text().splitlines()), 1)
+
+        self.assertIn('Wrote 1 queued survey responses', self.process())
+        saved = SurveyResponse.objects.get(user=self.user)
+        self.assertEqual(saved.answers.count(), len(form.fields))
+        self.assertRollupsMatchAnswers()
+        self.assertEqual(list(self.spool_dir.glob(submissions.CLAIMED_PATTERN)), [])
+        self.assertEqual(self.process(), '')
+
+    def test_one_worker_at_a_time(self):
+        self.enqueue((self.questions[0].pk, 5))
+        lock = submissions.lock_worker()
+        try:
+            with self.assertRaisesMessage(CommandError, 'Another worker is already draining'):
+                self.process()
+        finally:
+            lock.close()
+        self.assertEqual(SurveyResponse.objects.count(), self.responses)
+        self.process()
+        self.assertEqual(SurveyResponse.objects.count(), self.responses + 1)
+
+    def test_claimed_spools_and_checkpoints(self):
+        self.enqueue((self.questions[0].pk, 1))
+        self.enqueue((self.questions[0].pk, 2))
+        [claimed] = submissions.claim_spool()
+        # Submissions arriving after the claim go to a fresh spool
+        self.enqueue((self.questions[0].pk, 3))
+        self.assertEqual(len((self.spool_dir / submissions.SPOOL_NAME).read_text().splitlines()), 1)
+        # As if a worker had committed the first line of the claimed file and then died
+        SpoolCheckpoint.objects.create(
+            name=claimed.name, offset=len(claimed.read_text().splitlines(keepends=True)[0])
+        )
+
+        lock = submissions.lock_worker()
+        try:
+            written = list(submissions.drain())
+        finally:
+            lock.close()
+        self.assertEqual(written, [(1, 1, 0), (1, 1, 0)])
+        self.assertEqual(
+            sorted(Answer.objects.filter(response__user=self.user).values_list('rating', flat=True)), [2, 3]
+        )
+        self.assertEqual(sorted(path.name for path in self.spool_dir.iterdir()), [submissions.WORKER_LOCK_NAME])
+        self.assertFalse(SpoolCheckpoint.objects.exists())
+        self.assertRollupsMatchAnswers()
+
+    def test_a_batch_and_its_checkpoint_commit_together(self):
+        for rating in [1, 2, 3]:
+            self.enqueue((self.questions[0].pk, rating))
+        save_checkpoint = submissions.save_checkpoint
+        calls = count()
+
+        def crash_after_first_batch(name, offset):
+            if next(calls):
+                raise RuntimeError('worker died')
+            save_checkpoint(name, offset)
+
+        lock = submissions.lock_worker()
+        try:
+            with mock.patch('surveys.submissions.save_checkpoint', side_effect=crash_after_first_batch):
+                with self.assertRaisesMessage(RuntimeError, 'worker died'):
+                    list(submissions.drain(batch_size=1))
+            self.assertEqual(SurveyResponse.objects.count(), self.responses + 1)
+            self.assertEqual(list(submissions.drain(batch_size=1)), [(1, 1, 0), (1, 1, 0)])
+        finally:
+            lock.close()
+        self.assertEqual(
+            sorted(Answer.objects.filter(response__user=self.user).values_list('rating', flat=True)), [1, 2, 3]
+        )
+        self.assertRollupsMatchAnswers()
+
+    def test_malformed_lines_are_skipped(self):
+        self.enqueue((self.questions[0].pk, 4))
+        with open(self.spool_dir / submissions.SPOOL_NAME, 'a') as spool:
+            spool.write('{"user_id": \n')
+        self.enqueue((self.questions[1].pk, 6), user=User.objects.get(username='first-0'))
+
+        output = self.process()
+        self.assertIn('Wrote 2 responses / 2 answers, skipped 1', output)
+        self.assertEqual(SurveyResponse.objects.count(), self.responses + 2)
+        self.assertRollupsMatchAnswers()
+
+    def test_lines_of_the_wrong_shape_are_skipped(self):
+        question = self.questions[0].pk
+        valid = {
+            'user_id': self.user.pk,
+            'organization_id': self.organization.pk,
+            'completed_at': timezone.now().isoformat(),
+            'answers': [[question, 4]],
+        }
+        wrong = [
+            [valid],
+            {**valid, 'user_id': str(self.user.pk)},
+            {key: value for key, value in valid.items() if key != 'organization_id'},
+            {**valid, 'completed_at': 'yesterday'},
+            {**valid, 'completed_at': '2025-02-30T10:00:00'},
+            {**valid, 'answers': []},
+            {**valid, 'answers': [question, 4]},
+            {**valid, 'answers': [[question, 11]]},
+            {**valid, 'answers': [[question, '4']]},
+        ]
+        with open(self.spool_dir / submissions.SPOOL_NAME, 'a') as spool:
+            for record in [*wrong, valid]:
+                spool.write(json.dumps(record) + '\n')
+        output = self.process()
+        self.assertIn(f'Wrote 1 responses / 1 answers, skipped {len(wrong)}', output)
+        self.assertEqual(SurveyResponse.objects.count(), self.responses + 1)
+        self.assertEqual(list(self.spool_dir.glob(submissions.CLAIMED_PATTERN)), [])
+        self.assertRollupsMatchAnswers()
+
+
+class ExportTests(SurveyDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('survey_results_export', args=[self.organization.pk])
+        # Another organization's answers, and an unfinished response, are never exported
+        other = Organization.objects.create(name='Other')
+        theme = Theme.objects.create(survey=Survey.objects.create(organization=other), name='Other theme')
+        question = Question.objects.create(theme=theme, text='Elsewhere?')
+        Answer.objects.create(
+            response=SurveyResponse.objects.create(user=self.user, organization=other, completed_at=timezone.now()),
+            question=question,
+            rating=1
+        )
+        Answer.objects.create(
+            response=SurveyResponse.objects.create(user=self.user, organization=self.organization),
+            question=self.questions[0],
+            rating=1
+        )
+        self.expected = {
+            (answer.response_id, answer.question_id, answer.rating)
+            for answer in Answer.objects.filter(
+                response__organization=self.organization, response__completed_at__isnull=False
+            )
+        }
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, content = self.download()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn(f'survey-answers-{self.organization.pk}.csv', response['Content-Disposition'])
+        header, *rows = csv.reader(StringIO(content))
+        self.assertEqual(header, export.FIELDS)
+        self.assertEqual(len(rows), len(self.expected))
+        self.assertEqual({(int(row[0]), int(row[4]), int(row[6])) for row in rows}, self.expected)
+        question = self.questions[0]
+        self.assertIn([str(question.theme_id), question.theme.name, str(question.pk), question.text], [
+            row[2:6] for row in rows
+        ])
+
+    def test_ndjson(self):
+        response, content = self.download(format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), len(self.expected))
+        self.assertTrue(all(list(row) == export.FIELDS for row in rows))
+        self.assertEqual({(row['response_id'], row['question_id'], row['rating']) for row in rows}, self.expected)
+
+    def test_filters(self):
+        theme = self.themes[1]
+        _, content = self.download(format='ndjson', theme=theme.pk, start=timezone.localdate().isoformat())
+        rows = [json.loads(line) for line in content.splitlines()]
+        expected = Answer.objects.filter(
+            response__organization=self.organization,
+            response__completed_at__date=timezone.localdate(),
+            question__theme=theme
+        ).count()
+        self.assertEqual(len(rows), expected)
+        self.assertTrue(expected)
+        self.assertEqual({row['theme_id'] for row in rows}, {theme.pk})
+
+
+class TeamRollupTests(SurveyDataMixin, TestCase):
+    """Team rollups kept up to date by the membership signals agree with grouping the answers"""
+    def assertTeamsMatchAnswers(self):
+        weekly_ranges = analytics.get_weekly_ranges()
+        for manager in OrganizationMembership.objects.filter(organization=self.organization):
+            with self.subTest(manager=manager.user.username):
+                overall, weekly = analytics.team_rollup_aggregates(manager, weekly_ranges)
+                expected_overall, expected_weekly = analytics.team_sql_aggregates(manager, weekly_ranges)
+                self.assertEqual(sorted(row for row in overall if any(row[-1])), sorted(expected_overall))
+                self.assertEqual(sorted(row for row in weekly if any(row[-1])), sorted(expected_weekly))
+
+    def test_reporting_changes(self):
+        first, second, third = OrganizationMembership.objects.filter(
+            organization=self.organization, reports_to=self.membership
+        ).order_by('id')
+        third.reports_to = second
+        third.save()
+        self.assertTeamsMatchAnswers()
+
+        second.reports_to = first
+        second.save()
+        self.assertTeamsMatchAnswers()
+
+        second.delete()
+        self.assertTeamsMatchAnswers()
+
+        third.reports_to = first
+        third.save()
+        self.add_responses(2, 'late')
+        self.assertTeamsMatchAnswers()
+
+    @override_settings(TEAM_RESULTS_MIN_RESPONDENTS=1)
+    def test_team_results_match_the_sql_engine(self):
+        first, second, third = OrganizationMembership.objects.filter(
+            organization=self.organization, reports_to=self.membership
+        ).order_by('id')
+        third.reports_to = second
+        third.save()
+        for manager in [self.membership, second]:
+            with self.subTest(manager=manager.user.username):
+                url = reverse('team_results_api', args=[self.organization.pk, manager.pk])
+                results = {}
+                for engine in ['rollup', 'sql']:
+                    cache.clear()
+                    with override_settings(SURVEY_RESULTS_ENGINE=engine):
+                        results[engine] = self.client.get(url).json()
+                self.assertEqual(results['rollup'], results['sql'])
+
+                answers = Answer.objects.filter(
+                    response__user__organizationmembership__in=manager.get_all_subordinates()
+                )
+                self.assertEqual(results['sql']['total_answers'], answers.count())
+                counts = Counter(answers.values_list('question_id', flat=True))
+                self.assertEqual(
+                    {
+                        question['id']: question['count']
+                        for theme in results['sql']['themes'] for question in theme['questions']
+                    },
+                    counts
+                )
+
+    def test_take_survey(self):
+        report = OrganizationMembership.objects.filter(reports_to=self.membership).select_related('user').first()
+        self.client.force_login(report.user)
+        url = reverse('take_survey', args=[self.organization.pk])
+        form = self.client.get(url).context['form']
+        self.client.post(url, {name: '4' for name in form.fields})
+        self.assertTeamsMatchAnswers()
+
+
+class EngineTests(SurveyDataMixin, TestCase):
+    """Every results engine returns the same aggregate rows"""
+    def setUp(self):
+        super().setUp()
+        self.weekly_ranges = analytics.get_weekly_ranges()
+        user = User.objects.get(username='first-0')
+        # The first instant of a displayed week, and a week before the displayed ones
+        for completed_at in [
+            timezone.make_aware(datetime.combine(self.weekly_ranges[1]['start'], time.min)),
+            timezone.now() - timedelta(weeks=10),
+        ]:
+            response = SurveyResponse.objects.create(user=user, organization=self.organization, completed_at=completed_at)
+            rollups.record_answers(self.organization, user.pk, completed_at, [(self.questions[0], 9)])
+            Answer.objects.bulk_create([Answer(response=response, question=self.questions[0], rating=9)])
+
+    def aggregates(self, engine, **kwargs):
+        overall, weekly = analytics.ENGINES[engine](self.organization, self.weekly_ranges, **kwargs)
+        return sorted(row for row in overall if any(row[-1])), sorted(row for row in weekly if any(row[-1]))
+
+    def test_columnar_numpy_and_python_agree(self):
+        if analytics.np is None:
+            self.skipTest('NumPy is not installed')
+        with_numpy = analytics.columnar_aggregates(self.organization, self.weekly_ranges, use_numpy=True)
+        without = analytics.columnar_aggregates(self.organization, self.weekly_ranges, use_numpy=False)
+        self.assertEqual(with_numpy, without)
+        self.assertEqual(
+            analytics.load_answer_columns(analytics.completed_answers(self.organization), use_numpy=True).tolist(),
+            analytics.load_answer_columns(analytics.completed_answers(self.organization), use_numpy=False)
+        )
+
+    def test_engines_agree(self):
+        expected = self.aggregates('sql')
+        self.assertEqual(len(expected[1]), 3 * len(self.questions) + 1)
+        for engine in analytics.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(self.aggregates(engine), expected)
+
+
+class RollupEditTests(SurveyDataMixin, TestCase):
+    """Rollups follow answers and responses that are edited or deleted after they were recorded"""
+    def test_edits_and_deletes(self):
+        first, second = Answer.objects.filter(response__user__username='first-0').order_by('id')[:2]
+        first.rating, second.rating = second.rating, first.rating
+        first.save()
+        second.save()
+        self.assertRollupsMatchAnswers()
+
+        Answer.objects.filter(pk=first.pk).delete()
+        second.delete()
+        self.assertRollupsMatchAnswers()
+
+        response = SurveyResponse.objects.filter(user__username='first-1').order_by('id').first()
+        response.completed_at -= timedelta(weeks=1)
+        response.save()
+        response.answers.filter(question=first.question).delete()
+        Answer.objects.create(response=response, question=first.question, rating=2)
+        self.assertRollupsMatchAnswers()
+
+        response.delete()
+        SurveyResponse.objects.filter(user__username='first-1').delete()
+        self.assertRollupsMatchAnswers()
+
+        User.objects.get(username='first-2').delete()
+        self.assertRollupsMatchAnswers()
+
+    def test_generate_survey_data(self):
+        # The answer signals keep the rollups up to date, so neither mode rebuilds them
+        for options in [{}, {'bulk': True}]:
+            with self.subTest(**options), mock.patch('surveys.rollups.rebuild') as rebuild:
+                call_command(
+                    'generate_survey_data', self.organization.pk, clear_responses=True, weeks=3,
+                    responses_per_week=4, stdout=StringIO(), **options
+                )
+                rebuild.assert_not_called()
+                self.assertTrue(SurveyResponse.objects.filter(organization=self.organization).exists())
+            self.assertRollupsMatchAnswers()
+
+
+class SnapshotTests(SurveyDataMixin, TestCase):
+    def test_fingerprints_catch_swapped_ratings(self):
+        before = snapshots.week_fingerprints(self.organization)
+        self.assertEqual(len(before), 3)
+        first, second = Answer.objects.filter(response__user__username='first-0').order_by('id')[:2]
+        Answer.objects.filter(pk=first.pk).update(rating=second.rating)
+        Answer.objects.filter(pk=second.pk).update(rating=first.rating)
+
+        after = snapshots.week_fingerprints(self.organization)
+        changed = [week for week in before if before[week] != after[week]]
+        self.assertEqual(changed, [rollups.week_start(first.response.completed_at).isoformat()])
+
+
+class HistogramTests(TestCase):
+    def test_statistics(self):
+        histogram = histograms.from_ratings([1, 2, 7, 8, 9, 9, 10, 10])
+        self.assertEqual(histograms.count(histogram), 8)
+        self.assertEqual(histograms.mean(histogram), 7)
+        self.assertEqual(histograms.median(histogram), 8.5)
+        self.assertEqual(histograms.percentile(histogram, 25), 5.75)
+        self.assertEqual(histograms.percentile(histogram, 100), 10)
+        # 4 promoters and 2 detractors out of 8
+        self.assertEqual(histograms.enps(histogram), 25)
+        self.assertEqual(histograms.merge(histogram, histograms.from_ratings([3])), histograms.from_ratings(
+            [1, 2, 3, 7, 8, 9, 9, 10, 10]
+        ))
+        self.assertIsNone(histograms.median(histograms.EMPTY))
+
+
+class BootstrapTests(TestCase):
+    def setUp(self):
+        if bootstrap.np is None:
+            self.skipTest('NumPy is not installed')
+
+    def test_confidence_intervals(self):
+        few = histograms.from_ratings([1, 10, 5])
+        many = histograms.from_ratings([6, 7, 8] * 200)
+        same = histograms.from_ratings([7, 7])
+        one = histograms.from_ratings([4])
+        intervals = bootstrap.confidence_intervals([few, many, same, one, few])
+
+        self.assertEqual(intervals, bootstrap.confidence_intervals([few, many, same, one, few]))
+        (few_low, few_high), (many_low, many_high), same_interval, one_interval, repeated = intervals
+        self.assertLess(few_low, histograms.mean(few))
+        self.assertGreater(few_high, histograms.mean(few))
+        self.assertLess(many_high - many_low, 0.2)
+        self.assertGreater(few_high - few_low, 2)
+        self.assertEqual(same_interval, (7, 7))
+        self.assertIsNone(one_interval)
+        self.assertEqual(repeated, (few_low, few_high))
+
+    def test_max_draws(self):
+        cells = [histograms.from_ratings([1, 2, number]) for number in range(3, 11)]
+        intervals = bootstrap.confidence_intervals(cells, max_draws=bootstrap.MIN_RESAMPLES * 3)
+        self.assertEqual(sum(interval is not None for interval in intervals), 3)
+
+    def test_results_flag_insufficient_data(self):
+        cells = [{'histogram': histograms.from_ratings(ratings)} for ratings in ([1, 10, 5], [6, 7, 8] * 200, [4])]
+        for cell in cells:
+            cell.update(analytics.describe(cell['histogram'], summary=True))
+        analytics.add_intervals(cells)
+        self.assertEqual([cell['insufficient'] for cell in cells], [True, False, True])
+
+
+class CorrelationTests(TestCase):
+    def test_pairwise_complete(self):
+        # Question 3 was only answered by users 1-3, question 2 by users 2-5
+        ratings = [
+            (1, 1, 2), (1, 3, 3),
+            (2, 1, 4), (2, 2, 5), (2, 3, 5),
+            (3, 1, 6), (3, 2, 4), (3, 3, 7),
+            (4, 1, 8), (4, 2, 9),
+            (5, 1, 9), (5, 2, 7),
+        ]
+        expected = None
+        for use_numpy in [False, True]:
+            if use_numpy and correlations.np is None:
+                continue
+            n, sx, sxx, sxy = correlations.pairwise_sums(ratings, [1, 2, 3], use_numpy=use_numpy)
+            self.assertEqual([[int(value) for value in row] for row in n], [[5, 4, 3], [4, 4, 2], [3, 2, 3]])
+            matrix = [
+                [correlations.correlation(n[i][j], sx[i][j], sx[j][i], sxx[i][j], sxx[j][i], sxy[i][j]) for j in range(3)]
+                for i in range(3)
+            ]
+            # Users 1-3 rated question 3 one higher than question 1
+            self.assertAlmostEqual(matrix[0][2], 1)
+            self.assertAlmostEqual(matrix[0][0], 1)
+            self.assertAlmostEqual(matrix[0][1], matrix[1][0])
+            # Two respondents always correlate perfectly, one way or the other
+            self.assertAlmostEqual(abs(matrix[1][2]), 1)
+            if expected is None:
+                expected = matrix
+            for row, expected_row in zip(matrix, expected):
+                for value, expected_value in zip(row, expected_row):
+                    self.assertAlmostEqual(value, expected_value)
+
+
+class HeatmapTests(SurveyDataMixin, TestCase):
+    def test_ancestors_at_level(self):
+        parents = {1: None, 2: 1, 3: 2, 4: 3, 5: 2, 6: 7, 7: 6, 8: 99}
+        # Walking up from 6 comes back to it through 7, which is taken as the top
+        self.assertEqual(heatmap.ancestors_at_level(parents, 0), {2: 1, 3: 1, 4: 1, 5: 1, 6: 7})
+        self.assertEqual(heatmap.ancestors_at_level(parents, 1), {3: 2, 4: 2, 5: 2})
+        self.assertEqual(heatmap.ancestors_at_level(parents, 2), {4: 3})
+
+    def test_numpy_and_python_agree(self):
+        if heatmap.np is None:
+            self.skipTest('NumPy is not installed')
+        first, *others = OrganizationMembership.objects.filter(reports_to=self.membership).order_by('id')
+        for other in others:
+            other.reports_to = first
+            other.save()
+
+        with override_settings(TEAM_RESULTS_MIN_RESPONDENTS=1):
+            with_numpy = heatmap.compute_heatmap(self.organization, self.survey, use_numpy=True)
+            without = heatmap.compute_heatmap(self.organization, self.survey, use_numpy=False)
+        self.assertEqual([row['manager'] for row in with_numpy['rows']], [first])
+        self.assertEqual(
+            [row['cells'] for row in with_numpy['rows']],
+            [row['cells'] for row in without['rows']]
+        )
+        team = analytics.compute_team_results(first, self.survey, analytics.get_weekly_ranges(), engine='sql')
+        self.assertEqual(
+            [cell['average'] for cell in with_numpy['rows'][0]['cells']],
+            [stats['average'] for stats in team['theme_stats']]
+        )
+
+
+class SurveyAdminQueryTests(SurveyDataMixin, QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+
+    def test_changelists(self):
+        for model in [Survey, Theme, Question, SurveyResponse, Answer]:
+            with self.subTest(model=model.__name__):
+                url = reverse(f'admin:surveys_{model._meta.model_name}_changelist')
+                self.assertQueryBudget(6, lambda: self.client.get(url))
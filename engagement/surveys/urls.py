@@ -9,4 +9,10 @@ urlpatterns = [
     path('<int:org_pk>/themes/<int:theme_pk>/questions/create/', views.question_create, name='question_create'),
     path('<int:org_pk>/take/', views.take_survey, name='take_survey'),
     path('<int:org_pk>/results/', views.survey_results, name='survey_results'),
+    path('<int:org_pk>/results/heatmap/', views.survey_heatmap, name='survey_heatmap'),
+    path('<int:org_pk>/results/correlations/', views.survey_correlations, name='survey_correlations'),
+    path('<int:org_pk>/results/export/', views.export_results, name='survey_results_export'),
+    path('<int:org_pk>/teams/<int:member_pk>/results/', views.team_results, name='team_results'),
+    path('<int:org_pk>/teams/<int:member_pk>/results/data/', views.team_results_api, name='team_results_api'),
+    path('<int:org_pk>/responses/import/', views.import_responses, name='import_survey_responses'),
 ]
\ No newline at end of file
@@ -1,25 +1,88 @@
+from functools import wraps
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.views.decorators.http import require_POST
 from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, prefetch_related_objects
 from django.forms import modelformset_factory
 from django.utils import timezone
-from datetime import timedelta
 import random
-from organizations.models import Organization, OrganizationMembership
-from .models import Survey, Theme, Question, SurveyResponse, Answer
-from .forms import SurveyForm, ThemeForm, QuestionForm, SurveyResponseForm
+from organizations.decorators import organization_member
+from organizations.hierarchy import with_report_counts
+from organizations.models import OrganizationMembership, ReportingLine
+from .models import Survey, Theme, SurveyResponse, Answer, SurveyCycleAssignment
+from .forms import SurveyForm, ThemeForm, QuestionForm, SurveyResponseForm, AnswerExportForm
+from . import analytics, caching, correlations, export, heatmap, ingest, rollups, submissions
+from .catalog import get_catalog, survey_is_active
+
+
+def get_survey_or_404(organization):
+    """Return the survey that organization_member loaded with the organization"""
+    try:
+        return organization.survey
+    except Survey.DoesNotExist:
+        raise Http404('This organization does not have a survey.')
+
+
+def get_team_manager(organization, membership, member_pk):
+    """Return the member whose team is asked for, with ``headcount``, or None if the caller may not see it.
+
+    Owners and admins see every team, other members their own team and the teams below them.
+    """
+    manager = with_report_counts(
+        OrganizationMembership.objects.filter(organization=organization, pk=member_pk)
+    ).annotate(
+        below_caller=Exists(ReportingLine.objects.filter(ancestor=membership, descendant=OuterRef('pk')))
+    ).select_related('user').first()
+    if manager is None:
+        raise Http404('No organization membership matches the given query.')
+    if membership.role in ['owner', 'admin'] or manager.below_caller:
+        return manager
+    return None
+
+
+def get_team_results(manager, survey):
+    """Results over everyone below ``manager``, withheld while fewer than TEAM_RESULTS_MIN_RESPONDENTS answered"""
+    weekly_ranges = analytics.get_weekly_ranges()
+    min_respondents = getattr(settings, 'TEAM_RESULTS_MIN_RESPONDENTS', 3)
+    
+    def compute():
+        totals = analytics.team_responses(manager).aggregate(
+            responses=Count('id'),
+            respondents=Count('user_id', distinct=True)
+        )
+        results = {'question_stats': [], 'theme_stats': [], 'total_answers': 0}
+        withheld = 0 < totals['respondents'] < min_respondents
+        if totals['responses'] and not withheld:
+            results = analytics.compute_team_results(manager, survey, weekly_ranges)
+        return {
+            'total_responses': totals['responses'],
+            'respondents': totals['respondents'],
+            'withheld': withheld,
+            'min_respondents': min_respondents,
+            'weekly_ranges': weekly_ranges,
+            **results,
+        }
+    
+    # Cached until an answer of the organization or a reporting line changes
+    return caching.get_cached_team_results(manager, weekly_ranges, compute)
 
 
 @login_required
+@organization_member('org_pk')
 def survey_detail(request, org_pk):
-    organization = get_object_or_404(Organization, pk=org_pk)
-    membership = get_object_or_404(OrganizationMembership, user=request.user, organization=organization)
+    organization = request.organization
+    membership = request.membership
     
     try:
         survey = organization.survey
     except Survey.DoesNotExist:
         survey = None
+    else:
+        prefetch_related_objects([survey], 'themes__questions')
     
     context = {
         'organization': organization,
@@ -30,9 +93,10 @@ def survey_detail(request, org_pk):
 
 
 @login_required
+@organization_member('org_pk')
 def survey_create(request, org_pk):
-    organization = get_object_or_404(Organization, pk=org_pk)
-    membership = get_object_or_404(OrganizationMembership, user=request.user, organization=organization)
+    organization = request.organization
+    membership = request.membership
     
     if membership.role not in ['owner', 'admin']:
         messages.error(request, 'You do not have permission to create surveys for this organization.')
@@ -61,10 +125,11 @@ def survey_create(request, org_pk):
 
 
 @login_required
+@organization_member('org_pk')
 def survey_edit(request, org_pk):
-    organization = get_object_or_404(Organization, pk=org_pk)
-    membership = get_object_or_404(OrganizationMembership, user=request.user, organization=organization)
-    survey = get_object_or_404(Survey, organization=organization)
+    organization = request.organization
+    membership = request.membership
+    survey = get_survey_or_404(organization)
     
     if membership.role not in ['owner', 'admin']:
         messages.error(request, 'You do not have permission to edit this survey.')
@@ -88,10 +153,11 @@ def survey_edit(request, org_pk):
 
 
 @login_required
+@organization_member('org_pk')
 def theme_create(request, org_pk):
-    organization = get_object_or_404(Organization, pk=org_pk)
-    membership = get_object_or_404(OrganizationMembership, user=request.user, organization=organization)
-    survey = get_object_or_404(Survey, organization=organization)
+    organization = request.organization
+    membership = request.membership
+    survey = get_survey_or_404(organization)
     
     if membership.role not in ['owner', 'admin']:
         messages.error(request, 'You do not have permission to add themes to this survey.')
@@ -117,10 +183,11 @@ def theme_create(request, org_pk):
 
 
 @login_required
+@organization_member('org_pk')
 def question_create(request, org_pk, theme_pk):
-    organization = get_object_or_404(Organization, pk=org_pk)
-    membership = get_object_or_404(OrganizationMembership, user=request.user, organization=organization)
-    survey = get_object_or_404(Survey, organization=organization)
+    organization = request.organization
+    membership = request.membership
+    survey = get_survey_or_404(organization)
     theme = get_object_or_404(Theme, pk=theme_pk, survey=survey)
     
     if membership.role not in ['owner', 'admin']:
@@ -148,54 +215,94 @@ def question_create(request, org_pk, theme_pk):
 
 
 @login_required
+@organization_member('org_pk')
 def take_survey(request, org_pk):
-    organization = get_object_or_404(Organization, pk=org_pk)
-    membership = get_object_or_404(OrganizationMembership, user=request.user, organization=organization)
+    organization = request.organization
     
-    try:
-        survey = organization.survey
-    except Survey.DoesNotExist:
+    # Survey, themes and questions come from the in-process catalog rather than the database
+    catalog = get_catalog(organization)
+    if catalog is None:
         messages.error(request, 'This organization does not have a survey yet.')
         return redirect('organization_detail', pk=org_pk)
     
+    survey = catalog.survey
     if not survey.is_active:
         messages.error(request, 'This survey is currently inactive.')
         return redirect('organization_detail', pk=org_pk)
     
-    # Get all questions from the survey
-    all_questions = Question.objects.filter(theme__survey=survey)
-    
-    if not all_questions.exists():
+    if not catalog.question_ids:
         messages.error(request, 'This survey has no questions yet.')
         return redirect('organization_detail', pk=org_pk)
     
-    # Randomly select questions based on organization config
-    questions_count = min(organization.questions_per_cycle, all_questions.count())
-    selected_questions = random.sample(list(all_questions), questions_count)
+    # Questions are drawn once per cycle, so the POST saves answers to the questions the GET showed.
+    # The draw is a callable so that it only runs when the cycle's assignment is created.
+    assignment, created = SurveyCycleAssignment.objects.get_or_create(
+        user=request.user,
+        organization=organization,
+        cycle_start=rollups.week_start(timezone.now()),
+        defaults={
+            'question_ids': lambda: random.sample(
+                catalog.question_ids, min(catalog.questions_per_cycle, len(catalog.question_ids))
+            )
+        }
+    )
+    selected_questions = catalog.get_questions(assignment.question_ids)
+    
+    # Questions deleted since the draw are topped up from the rest of the catalog
+    missing = min(catalog.questions_per_cycle, len(catalog.question_ids)) - len(selected_questions)
+    if missing > 0:
+        shown = [question.id for question in selected_questions]
+        remaining = [question_id for question_id in catalog.question_ids if question_id not in shown]
+        assignment.question_ids = shown + random.sample(remaining, missing)
+        assignment.save(update_fields=['question_ids'])
+        selected_questions = catalog.get_questions(assignment.question_ids)
     
     if request.method == 'POST':
+        # The catalog may not have seen a deactivation yet, answers are only accepted if the database agrees
+        if not survey_is_active(organization, catalog):
+            messages.error(request, 'This survey is currently inactive.')
+            return redirect('organization_detail', pk=org_pk)
+        
         form = SurveyResponseForm(request.POST, questions=selected_questions)
         if form.is_valid():
+            # Everything but the inserts happens before the transaction so the write lock is held briefly
+            answered = []
+            for question in selected_questions:
+                rating = form.cleaned_data.get(f'question_{question.id}')
+                if rating:  # Only save if user provided a rating
+                    answered.append((question, int(rating)))
+            completed_at = timezone.now()
+            
+            if getattr(settings, 'SURVEY_WRITE_BEHIND', False):
+                # process_survey_spool writes the submission and updates the rollups
+                submissions.enqueue(
+                    request.user.pk,
+                    organization.pk,
+                    completed_at,
+                    [(question.id, rating) for question, rating in answered]
+                )
+                messages.success(
+                    request,
+                    'Thank you! Your survey responses have been recorded and will appear in the results shortly.'
+                )
+                return redirect('organization_detail', pk=org_pk)
+            
             with transaction.atomic():
-                # Create survey response
                 response = SurveyResponse.objects.create(
                     user=request.user,
                     organization=organization,
-                    completed_at=timezone.now()
+                    completed_at=completed_at
+                )
+                Answer.objects.bulk_create(
+                    Answer(response=response, question_id=question.id, rating=rating)
+                    for question, rating in answered
                 )
                 
-                # Create answers
-                for question in selected_questions:
-                    rating = form.cleaned_data.get(f'question_{question.id}')
-                    if rating:  # Only save if user provided a rating
-                        Answer.objects.create(
-                            response=response,
-                            question=question,
-                            rating=rating
-                        )
+                # Keep the weekly results rollups in step with the answers
+                rollups.record_answers(organization, request.user.pk, completed_at, answered)
                 
-                messages.success(request, 'Thank you! Your survey responses have been saved.')
-                return redirect('organization_detail', pk=org_pk)
+            messages.success(request, 'Thank you! Your survey responses have been saved.')
+            return redirect('organization_detail', pk=org_pk)
     else:
         form = SurveyResponseForm(questions=selected_questions)
     
@@ -220,9 +327,10 @@ def take_survey(request, org_pk):
 
 
 @login_required
+@organization_member('org_pk')
 def survey_results(request, org_pk):
-    organization = get_object_or_404(Organization, pk=org_pk)
-    membership = get_object_or_404(OrganizationMembership, user=request.user, organization=organization)
+    organization = request.organization
+    membership = request.membership
     
     if membership.role not in ['owner', 'admin']:
         messages.error(request, 'You do not have permission to view survey results for this organization.')
@@ -234,132 +342,285 @@ def survey_results(request, org_pk):
         messages.error(request, 'This organization does not have a survey yet.')
         return redirect('organization_detail', pk=org_pk)
     
-    # Get all survey responses for this organization
-    responses = SurveyResponse.objects.filter(
-        organization=organization,
-        completed_at__isnull=False
-    ).prefetch_related('answers__question__theme').order_by('-completed_at')
-    
-    # Get all answers with question and theme info
-    answers = Answer.objects.filter(
-        response__organization=organization,
-        response__completed_at__isnull=False
-    ).select_related('response__user', 'question__theme').order_by(
-        '-response__completed_at', 'question__theme__order', 'question__order'
-    )
-    
     # Calculate weekly date ranges (last 6 weeks)
-    today = timezone.now().date()
-    weekly_ranges = []
-    for i in range(6):
-        week_start = today - timedelta(days=today.weekday()) - timedelta(weeks=i)
-        week_end = week_start + timedelta(days=6)
-        weekly_ranges.append({
-            'start': week_start,
-            'end': week_end,
-            'label': f"Week {week_start.strftime('%m/%d')}"
-        })
-    weekly_ranges.reverse()  # Show oldest to newest
-    
-    # Calculate some basic statistics
-    total_responses = responses.count()
-    if total_responses > 0:
-        # Calculate average rating per question
-        question_stats = {}
-        theme_stats = {}
-        
-        for answer in answers:
-            question_id = answer.question.id
-            theme_id = answer.question.theme.id
-            answer_date = answer.response.completed_at.date()
-            
-            # Question statistics
-            if question_id not in question_stats:
-                question_stats[question_id] = {
-                    'question': answer.question,
-                    'ratings': [],
-                    'total': 0,
-                    'count': 0,
-                    'weekly_data': {week['label']: {'total': 0, 'count': 0, 'average': 0} for week in weekly_ranges}
-                }
-            question_stats[question_id]['ratings'].append(answer.rating)
-            question_stats[question_id]['total'] += answer.rating
-            question_stats[question_id]['count'] += 1
-            
-            # Add to weekly data
-            for week in weekly_ranges:
-                if week['start'] <= answer_date <= week['end']:
-                    question_stats[question_id]['weekly_data'][week['label']]['total'] += answer.rating
-                    question_stats[question_id]['weekly_data'][week['label']]['count'] += 1
-                    break
-            
-            # Theme statistics
-            if theme_id not in theme_stats:
-                theme_stats[theme_id] = {
-                    'theme': answer.question.theme,
-                    'ratings': [],
-                    'total': 0,
-                    'count': 0,
-                    'questions': [],
-                    'weekly_data': {week['label']: {'total': 0, 'count': 0, 'average': 0} for week in weekly_ranges}
-                }
-            theme_stats[theme_id]['ratings'].append(answer.rating)
-            theme_stats[theme_id]['total'] += answer.rating
-            theme_stats[theme_id]['count'] += 1
-            
-            # Add to weekly data
-            for week in weekly_ranges:
-                if week['start'] <= answer_date <= week['end']:
-                    theme_stats[theme_id]['weekly_data'][week['label']]['total'] += answer.rating
-                    theme_stats[theme_id]['weekly_data'][week['label']]['count'] += 1
-                    break
-            
-            # Add question to theme if not already present
-            if answer.question not in theme_stats[theme_id]['questions']:
-                theme_stats[theme_id]['questions'].append(answer.question)
-        
-        # Calculate averages (overall and weekly)
-        for stats in question_stats.values():
-            if stats['count'] > 0:
-                stats['average'] = round(stats['total'] / stats['count'], 1)
-            else:
-                stats['average'] = 0
-            
-            # Calculate weekly averages
-            for week_data in stats['weekly_data'].values():
-                if week_data['count'] > 0:
-                    week_data['average'] = round(week_data['total'] / week_data['count'], 1)
-                else:
-                    week_data['average'] = 0
-                
-        for stats in theme_stats.values():
-            if stats['count'] > 0:
-                stats['average'] = round(stats['total'] / stats['count'], 1)
-            else:
-                stats['average'] = 0
-            
-            # Calculate weekly averages
-            for week_data in stats['weekly_data'].values():
-                if week_data['count'] > 0:
-                    week_data['average'] = round(week_data['total'] / week_data['count'], 1)
-                else:
-                    week_data['average'] = 0
-            
-            # Sort questions by order
-            stats['questions'].sort(key=lambda q: (q.order, q.id))
-    else:
-        question_stats = {}
-        theme_stats = {}
+    weekly_ranges = analytics.get_weekly_ranges()
+    
+    def compute():
+        total_responses = SurveyResponse.objects.filter(
+            organization=organization,
+            completed_at__isnull=False
+        ).count()
+        if total_responses > 0:
+            results = analytics.compute_results(organization, survey, weekly_ranges)
+        else:
+            results = {'question_stats': [], 'theme_stats': [], 'total_answers': 0}
+        return {'total_responses': total_responses, 'weekly_ranges': weekly_ranges, **results}
+    
+    # Cached until a response, answer, theme or question of the organization changes
+    results = caching.get_cached_results(organization, weekly_ranges, compute)
     
     context = {
         'organization': organization,
         'survey': survey,
-        'responses': responses,
-        'answers': answers,
-        'total_responses': total_responses,
-        'question_stats': question_stats.values(),
-        'theme_stats': sorted(theme_stats.values(), key=lambda x: x['theme'].order),
-        'weekly_ranges': weekly_ranges,
         'membership': membership,
+        'export_form': AnswerExportForm(themes=get_catalog(organization).themes),
+        **results,
     }
     return render(request, 'surveys/results.html', context)
+
+
+@login_required
+@organization_member('org_pk')
+def survey_heatmap(request, org_pk):
+    """Average theme score per first- or second-level manager"""
+    organization = request.organization
+    membership = request.membership
+    
+    if membership.role not in ['owner', 'admin']:
+        messages.error(request, 'You do not have permission to view survey results for this organization.')
+        return redirect('organization_detail', pk=org_pk)
+    
+    try:
+        survey = organization.survey
+    except Survey.DoesNotExist:
+        messages.error(request, 'This organization does not have a survey yet.')
+        return redirect('organization_detail', pk=org_pk)
+    
+    level = request.GET.get('level', '1')
+    level = int(level) if level in ['1', '2'] else 1
+    
+    # Cached until an answer of the organization or a reporting line changes
+    heatmap_data = caching.get_cached_heatmap(
+        organization, level, lambda: heatmap.compute_heatmap(organization, survey, level)
+    )
+    
+    context = {
+        'organization': organization,
+        'survey': survey,
+        'membership': membership,
+        'levels': [1, 2],
+        **heatmap_data,
+    }
+    return render(request, 'surveys/heatmap.html', context)
+
+
+@login_required
+@organization_member('org_pk')
+def survey_correlations(request, org_pk):
+    """Which questions move together, to find redundant ones"""
+    organization = request.organization
+    membership = request.membership
+    
+    if membership.role not in ['owner', 'admin']:
+        messages.error(request, 'You do not have permission to view survey results for this organization.')
+        return redirect('organization_detail', pk=org_pk)
+    
+    try:
+        survey = organization.survey
+    except Survey.DoesNotExist:
+        messages.error(request, 'This organization does not have a survey yet.')
+        return redirect('organization_detail', pk=org_pk)
+    
+    # Cached until an answer, theme or question of the organization changes
+    results = caching.get_cached_correlations(
+        organization, lambda: correlations.compute_correlations(organization, survey)
+    )
+    
+    context = {
+        'organization': organization,
+        'survey': survey,
+        'membership': membership,
+        **results,
+    }
+    return render(request, 'surveys/correlations.html', context)
+
+
+@login_required
+@organization_member('org_pk')
+def team_results(request, org_pk, member_pk):
+    """Results over everyone reporting to a member, directly or indirectly"""
+    organization = request.organization
+    membership = request.membership
+    
+    manager = get_team_manager(organization, membership, member_pk)
+    if manager is None:
+        messages.error(request, 'You do not have permission to view the results of this team.')
+        return redirect('organization_detail', pk=org_pk)
+    
+    try:
+        survey = organization.survey
+    except Survey.DoesNotExist:
+        messages.error(request, 'This organization does not have a survey yet.')
+        return redirect('organization_detail', pk=org_pk)
+    
+    context = {
+        'organization': organization,
+        'survey': survey,
+        'membership': membership,
+        'manager': manager,
+        'manager_name': manager.user.get_full_name() or manager.user.username,
+        **get_team_results(manager, survey),
+    }
+    return render(request, 'surveys/team_results.html', context)
+
+
+@login_required
+@organization_member('org_pk')
+def team_results_api(request, org_pk, member_pk):
+    """Team results as JSON, for dashboards"""
+    organization = request.organization
+    membership = request.membership
+    
+    manager = get_team_manager(organization, membership, member_pk)
+    if manager is None:
+        return JsonResponse({'error': 'You do not have permission to view the results of this team.'}, status=403)
+    survey = get_survey_or_404(organization)
+    results = get_team_results(manager, survey)
+    
+    def weekly(stats):
+        weeks = []
+        for week in results['weekly_ranges']:
+            week_data = stats['weekly_data'][week['label']]
+            weeks.append({
+                'week': week['start'].isoformat(),
+                'count': week_data['count'],
+                'average': week_data['average'],
+                'ci_low': week_data['ci_low'],
+                'ci_high': week_data['ci_high'],
+                'insufficient': week_data['insufficient'],
+            })
+        return weeks
+    
+    question_stats = {stats['question'].id: stats for stats in results['question_stats']}
+    return JsonResponse({
+        'manager': {
+            'id': manager.id,
+            'name': manager.user.get_full_name() or manager.user.username,
+            'headcount': manager.headcount,
+        },
+        'respondents': results['respondents'],
+        'total_responses': results['total_responses'],
+        'total_answers': results['total_answers'],
+        'withheld': results['withheld'],
+        'weeks': [
+            {'start': week['start'].isoformat(), 'end': week['end'].isoformat(), 'label': week['label']}
+            for week in results['weekly_ranges']
+        ],
+        'themes': [
+            {
+                'id': stats['theme'].id,
+                'name': stats['theme'].name,
+                'count': stats['count'],
+                'average': stats['average'],
+                'median': stats['median'],
+                'enps': stats['enps'],
+                'ci_low': stats['ci_low'],
+                'ci_high': stats['ci_high'],
+                'histogram': list(stats['histogram']),
+                'weekly': weekly(stats),
+                'questions': [
+                    {
+                        'id': question.id,
+                        'text': question.text,
+                        'count': question_stats[question.id]['count'],
+                        'average': question_stats[question.id]['average'],
+                        'median': question_stats[question.id]['median'],
+                        'enps': question_stats[question.id]['enps'],
+                        'ci_low': question_stats[question.id]['ci_low'],
+                        'ci_high': question_stats[question.id]['ci_high'],
+                        'histogram': list(question_stats[question.id]['histogram']),
+                        'weekly': weekly(question_stats[question.id]),
+                    }
+                    for question in stats['questions']
+                ],
+            }
+            for stats in results['theme_stats']
+        ],
+    })
+
+
+@login_required
+@organization_member('org_pk')
+def export_results(request, org_pk):
+    """Stream the individual answers as CSV or NDJSON, optionally filtered by date range and theme"""
+    organization = request.organization
+    membership = request.membership
+    
+    if membership.role not in ['owner', 'admin']:
+        messages.error(request, 'You do not have permission to export survey results for this organization.')
+        return redirect('organization_detail', pk=org_pk)
+    
+    catalog = get_catalog(organization)
+    if catalog is None:
+        messages.error(request, 'This organization does not have a survey yet.')
+        return redirect('organization_detail', pk=org_pk)
+    
+    form = AnswerExportForm(request.GET, themes=catalog.themes)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect('survey_results', org_pk=org_pk)
+    
+    export_format = form.cleaned_data['format'] or 'csv'
+    lines, content_type = export.FORMATS[export_format]
+    rows = export.export_rows(
+        organization,
+        start=form.cleaned_data['start'],
+        end=form.cleaned_data['end'],
+        theme_id=form.cleaned_data['theme']
+    )
+    response = StreamingHttpResponse(lines(rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="survey-answers-{organization.pk}.{export_format}"'
+    return response
+
+
+def json_login_required(view_func):
+    """Like login_required, but anonymous callers get a JSON 401 rather than a redirect to the login page"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Log in to use this endpoint.'}, status=401)
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+@json_login_required
+@require_POST
+@organization_member('org_pk')
+def import_responses(request, org_pk):
+    """Bulk import of JSON-lines survey responses, e.g. from kiosks that collect them offline.
+
+    Session-authenticated only: callers need a logged-in session and the CSRF token
+    in the X-CSRFToken header. Scripts without a browser session use the
+    import_survey_responses management command instead.
+    """
+    organization = request.organization
+    membership = request.membership
+    
+    if membership.role not in ['owner', 'admin']:
+        return JsonResponse(
+            {'error': 'You do not have permission to import survey responses for this organization.'},
+            status=403
+        )
+    
+    errors = []
+    
+    def valid_submissions():
+        # The body is read line by line so large uploads are never held in memory at once
+        for line_number, submission, error in ingest.read_records(organization, request):
+            if error:
+                errors.append({'line': line_number, 'error': error})
+            else:
+                yield submission
+    
+    responses = answers = 0
+    for batch_responses, batch_answers, seconds in ingest.write_in_batches(valid_submissions()):
+        responses += batch_responses
+        answers += batch_answers
+    
+    return JsonResponse({
+        'responses': responses,
+        'answers': answers,
+        'errors': errors,
+    }, status=400 if errors and not responses else 200)